@@ -9,12 +9,97 @@ def create_app(test_config=None):
     # Asumimos que las variables de entorno ya están cargadas en el entry point (wsgi.py o app.py)
     app.config.from_mapping(
         SECRET_KEY=os.getenv('SECRET_KEY', 'dev'),
+        USER_CACHE_SIZE=int(os.getenv('USER_CACHE_SIZE', 4096)),
+        USER_CACHE_TTL=float(os.getenv('USER_CACHE_TTL', 60)),
+        BOLETA_CACHE_SIZE=int(os.getenv('BOLETA_CACHE_SIZE', 64)),
+        IMPORT_WORKERS=int(os.getenv('IMPORT_WORKERS', 2)) or None,
+        IMPORT_VERIFICAR_DIGITO=os.getenv('IMPORT_VERIFICAR_DIGITO', 'false').lower() == 'true',
+        BCRYPT_ROUNDS=int(os.getenv('BCRYPT_ROUNDS', 12)),
+        BCRYPT_WORKERS=int(os.getenv('BCRYPT_WORKERS', 2)),
+        BCRYPT_QUEUE=int(os.getenv('BCRYPT_QUEUE', 32)),
+        BCRYPT_TIMEOUT=float(os.getenv('BCRYPT_TIMEOUT', 3.0)),
+        RESULTADOS_PUSH_INTERVAL=float(os.getenv('RESULTADOS_PUSH_INTERVAL', 1.0)),
+        AUDIT_ASYNC=os.getenv('AUDIT_ASYNC', 'true').lower() == 'true',
+        AUDIT_BATCH=int(os.getenv('AUDIT_BATCH', 200)),
+        AUDIT_FLUSH_INTERVAL=float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0)),
+        AUDIT_BUFFER=int(os.getenv('AUDIT_BUFFER', 10000)),
+        AUDIT_PUT_TIMEOUT=float(os.getenv('AUDIT_PUT_TIMEOUT', 0.5)),
+        AUDIT_SELLO_INTERVALO=float(os.getenv('AUDIT_SELLO_INTERVALO', 5)),
+        AUDIT_CHECKPOINT_EVENTOS=int(os.getenv('AUDIT_CHECKPOINT_EVENTOS', 10000)),
+        AUDIT_CHECKPOINT_INTERVALO=float(os.getenv('AUDIT_CHECKPOINT_INTERVALO', 3600)),
+        DASHBOARD_STATS_TTL=float(os.getenv('DASHBOARD_STATS_TTL', 15)),
+        FOTO_MAX_BYTES=int(os.getenv('FOTO_MAX_BYTES', 5 * 1024 * 1024)),
+        COMPRESION_MIN_BYTES=int(os.getenv('COMPRESION_MIN_BYTES', 500)),
+        COMPRESION_NIVEL=int(os.getenv('COMPRESION_NIVEL', 6)),
+        ELECCION_CACHE_TTL=float(os.getenv('ELECCION_CACHE_TTL', 300)),
+        VERIFICACION_MAX_CODIGOS=int(os.getenv('VERIFICACION_MAX_CODIGOS', 5000)),
+        VERIFICACION_POR_MINUTO=float(os.getenv('VERIFICACION_POR_MINUTO', 30)),
+        VERIFICACION_RAFAGA=int(os.getenv('VERIFICACION_RAFAGA', 10)),
+        SEGUNDA_VUELTA_EMPATE=os.getenv('SEGUNDA_VUELTA_EMPATE', 'incluir'),
+        FIRMA_CLAVE_ARCHIVO=os.getenv('FIRMA_CLAVE_ARCHIVO', ''),
+        METRICAS_TOKEN=os.getenv('METRICAS_TOKEN', ''),
+        METRICAS_REQUEST_LENTO=float(os.getenv('METRICAS_REQUEST_LENTO', 1.0)),
+        ACTAS_SINCRONO_MAX_VOTOS=int(os.getenv('ACTAS_SINCRONO_MAX_VOTOS', 20000)),
+        ACTAS_INTERVALO=float(os.getenv('ACTAS_INTERVALO', 5)),
     )
 
     # Registrar funciones de cierre de DB y CLI
     from . import db
     app.teardown_appcontext(db.close_db)
     app.cli.add_command(db.init_db_command)
+    from .migraciones import migrate_db_command
+    app.cli.add_command(migrate_db_command)
+    from .importacion import importar_votantes_command
+    app.cli.add_command(importar_votantes_command)
+    from .conteos import reconciliar_conteos_command
+    app.cli.add_command(reconciliar_conteos_command)
+    from .recibos import verificar_recibos_command
+    app.cli.add_command(verificar_recibos_command)
+    from .cadena_auditoria import verificar_auditoria_command
+    app.cli.add_command(verificar_auditoria_command)
+    from .actas import generar_actas_command
+    app.cli.add_command(generar_actas_command)
+    db.init_pool(app)
+
+    # Consultas y tiempo de DB por request, exportados en /admin/metricas
+    from .metricas import init_metricas
+    init_metricas(app)
+
+    # Caches en memoria del worker
+    from .cache import init_caches
+    init_caches(app)
+
+    # Verificación de contraseñas en pool de procesos
+    from .claves import init_claves
+    init_claves(app)
+
+    # Resultados en vivo (LISTEN/NOTIFY + SSE)
+    from .en_vivo import init_en_vivo
+    init_en_vivo(app)
+
+    # Auditoría asíncrona por lotes
+    from .auditoria import init_auditoria
+    init_auditoria(app)
+
+    # Cadena de hashes de la auditoría con checkpoints firmados
+    from .cadena_auditoria import init_cadena_auditoria
+    init_cadena_auditoria(app)
+
+    # Actas de resultados firmadas al cerrar (las grandes, en segundo plano)
+    from .actas import init_actas
+    init_actas(app)
+
+    # Estadísticas del dashboard refrescadas en segundo plano
+    from .estadisticas import init_estadisticas
+    init_estadisticas(app)
+
+    # Fotos de candidatos procesadas (miniaturas + WebP con caché inmutable)
+    from .fotos import init_fotos
+    init_fotos(app)
+
+    # Validadores condicionales, compresión y estáticos versionados
+    from .respuestas import init_respuestas
+    init_respuestas(app)
 
     # Ruta principal
     @app.route('/')
@@ -22,10 +107,12 @@ def create_app(test_config=None):
         return render_template('index.html')
 
     # Registrar Blueprints
-    from .blueprints import auth, admin, voter
+    from .blueprints import auth, admin, voter, verificacion
     app.register_blueprint(auth.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(voter.bp)
+    app.register_blueprint(verificacion.bp)
+    verificacion.init_verificacion(app)
 
     # Context processor para saber si el votante tiene elecciones pendientes
     @app.context_processor
@@ -33,27 +120,9 @@ def create_app(test_config=None):
         from flask import g
         tiene_pendientes = False
         if hasattr(g, 'user') and g.user and g.user['rol'] == 'VOTANTE':
-            from .db import query_db
-            elecciones = query_db("SELECT * FROM elecciones WHERE activa = TRUE")
-            for e in elecciones:
-                if e['todos_habilitados']:
-                    ya_voto = query_db(
-                        "SELECT id FROM votos WHERE election_id=%s AND vuelta=%s AND votante_id=%s LIMIT 1",
-                        (e['id'], e['vuelta_actual'], g.user['id']), one=True)
-                    if not ya_voto:
-                        tiene_pendientes = True
-                        break
-                else:
-                    hab = query_db(
-                        "SELECT votante_id FROM eleccion_votantes WHERE election_id=%s AND votante_id=%s",
-                        (e['id'], g.user['id']), one=True)
-                    if hab:
-                        ya_voto = query_db(
-                            "SELECT id FROM votos WHERE election_id=%s AND vuelta=%s AND votante_id=%s LIMIT 1",
-                            (e['id'], e['vuelta_actual'], g.user['id']), one=True)
-                        if not ya_voto:
-                            tiene_pendientes = True
-                            break
+            from .estado_votante import resolver_estado
+            tiene_pendientes = any(e['elegible'] and not e['ya_voto']
+                                   for e in resolver_estado(g.user['id']))
         return dict(tiene_pendientes=tiene_pendientes)
 
     return app
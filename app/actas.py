@@ -0,0 +1,326 @@
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import datetime
+import threading
+import click
+from flask import current_app
+from app.db import get_db, close_db, query_db, execute_db
+from app.firmas import firmar, verificar_firma
+from app.participacion import contar_participacion
+from app.auditoria import registrar_evento
+
+# Actas de resultados: al cerrar una elección (o una vuelta, al pasar a la segunda) se congela
+# por vuelta un documento con los votos de cada candidato por cargo, la participación y la raíz
+# del registro de recibos. Se guarda como JSON canónico con su SHA-256 y una firma Ed25519 (ver
+# app/firmas.py); desde entonces resultados, exportaciones y verificación pública leen el acta
+# en vez de recalcular desde `votos`. Las elecciones chicas la generan en el mismo request del
+# cierre; las grandes quedan PENDIENTE y las toma el hilo GeneradorActas, que informa avance
+# (cargos procesados) en la misma fila. Cada acta en generación tiene un advisory lock de sesión
+# (election_id, vuelta): otro worker solo la retoma si quien la tenía perdió la conexión.
+
+PENDIENTE, GENERANDO, LISTA, ERROR = 'PENDIENTE', 'GENERANDO', 'LISTA', 'ERROR'
+REINTENTO_SEGUNDOS = 300  # Un acta en ERROR se vuelve a intentar pasado este tiempo
+
+_VOTOS_CARGO = """
+    SELECT cand.id, cand.nombres, cand.partido, cand.genero, cand.foto_url, COALESCE(v.total, 0) AS total
+    FROM candidatos cand
+    LEFT JOIN (SELECT candidato_id, COUNT(*) AS total FROM votos
+               WHERE election_id = %(eid)s AND cargo_id = %(cargo)s AND vuelta = %(vuelta)s
+               GROUP BY candidato_id) v ON v.candidato_id = cand.id
+    WHERE cand.election_id = %(eid)s AND cand.cargo_id = %(cargo)s
+      AND (v.total IS NOT NULL
+           OR (%(vuelta)s = 1 AND cand.estado = 'ACTIVO')
+           OR EXISTS (SELECT 1 FROM candidatos_vuelta cv
+                      WHERE cv.original_candidato_id = cand.id AND cv.vuelta = %(vuelta)s))
+    ORDER BY total DESC, cand.id
+"""
+
+
+def serializar(contenido):
+    """JSON canónico (claves ordenadas, sin espacios, UTF-8): son los bytes que se firman."""
+    return json.dumps(contenido, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+def mensaje_acta(election_id, vuelta, hash_hex):
+    return f"acta|{election_id}|{vuelta}|{hash_hex}".encode('ascii')
+
+
+def solicitar_actas(election_id, vueltas=None):
+    """Deja PENDIENTE el acta de cada vuelta (por defecto 1..vuelta_actual) que aún no exista.
+
+    Si la elección tiene hasta ACTAS_SINCRONO_MAX_VOTOS votantes, las genera ahora; si no,
+    despierta al generador en segundo plano. Devuelve {vuelta: estado}.
+    """
+    eleccion = query_db("SELECT vuelta_actual FROM elecciones WHERE id = %s", (election_id,), one=True)
+    if vueltas is None:
+        vueltas = range(1, eleccion['vuelta_actual'] + 1)
+    for vuelta in vueltas:
+        execute_db("""
+            INSERT INTO actas (election_id, vuelta) VALUES (%s, %s) ON CONFLICT DO NOTHING
+        """, (election_id, vuelta))
+
+    votantes = query_db("SELECT COUNT(*) AS n FROM certificados WHERE election_id = %s",
+                        (election_id,), one=True)['n']
+    if votantes <= current_app.config['ACTAS_SINCRONO_MAX_VOTOS']:
+        for vuelta in vueltas:
+            try:
+                generar_acta(election_id, vuelta)
+            except Exception as e:
+                # Queda en ERROR y el generador la reintenta más tarde
+                current_app.logger.warning(f"No se pudo generar el acta de la elección {election_id} "
+                                           f"vuelta {vuelta}: {e}")
+    else:
+        current_app.extensions['generador_actas'].despertar()
+    return {r['vuelta']: r['estado'] for r in query_db(
+        "SELECT vuelta, estado FROM actas WHERE election_id = %s AND vuelta = ANY(%s)",
+        (election_id, list(vueltas)))}
+
+def _tomar(election_id=None, vuelta=None):
+    """Toma un acta pendiente (la indicada o cualquiera) y devuelve (election_id, vuelta), o None.
+
+    Quien genera un acta tiene el advisory lock de sesión (election_id, vuelta) en su conexión:
+    un acta GENERANDO solo se retoma si ese lock está libre (el worker que la tenía murió o
+    perdió la conexión), nunca por tiempo, por más que un GROUP BY tarde. El lock se libera
+    con _soltar al terminar.
+    """
+    filtro = "AND election_id = %(eid)s AND vuelta = %(vuelta)s" if election_id is not None else ""
+    db = get_db()
+    cur = db.cursor()
+    try:
+        cur.execute(f"""
+            SELECT election_id, vuelta FROM actas
+            WHERE (estado IN ('PENDIENTE', 'GENERANDO')
+                   OR (estado = 'ERROR' AND actualizada_en < NOW() - make_interval(secs => %(reintento)s)))
+              {filtro}
+            ORDER BY solicitada_en
+        """, {'eid': election_id, 'vuelta': vuelta, 'reintento': REINTENTO_SEGUNDOS})
+        for eid, v in cur.fetchall():
+            cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (eid, v))
+            if not cur.fetchone()[0]:
+                continue  # La está generando otro worker
+            # Con el lock, confirmar que nadie la terminó entre la consulta y el lock
+            cur.execute("""
+                UPDATE actas SET estado = 'GENERANDO', progreso = 0, error = NULL, actualizada_en = NOW()
+                WHERE election_id = %s AND vuelta = %s AND estado <> 'LISTA'
+                RETURNING election_id, vuelta
+            """, (eid, v))
+            tomada = cur.fetchone()
+            db.commit()
+            if tomada:
+                return tomada
+            if not _soltar(eid, v):
+                return None  # Se descartó la conexión
+        db.commit()
+        return None
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+
+def _soltar(election_id, vuelta):
+    """Libera el advisory lock del acta. Si no se puede, cierra la conexión: el lock es de la
+    sesión y el pool solo hace rollback, así que volvería al pool tomado. Devuelve False si
+    descartó la conexión."""
+    db = get_db()
+    try:
+        db.rollback()
+        execute_db("SELECT pg_advisory_unlock(%s, %s)", (election_id, vuelta))
+        return True
+    except Exception as e:
+        current_app.logger.warning(f"No se pudo liberar el acta de la elección {election_id} "
+                                   f"vuelta {vuelta}, se descarta la conexión: {e}")
+        db.close()
+        close_db()
+        return False
+
+def _fallo(election_id, vuelta, error):
+    # La transacción de _generar puede haber quedado abortada: sin rollback el UPDATE fallaría
+    # con InFailedSqlTransaction y el acta seguiría GENERANDO sin error ni espera de reintento
+    get_db().rollback()
+    execute_db("""
+        UPDATE actas SET estado = 'ERROR', error = %s, actualizada_en = NOW()
+        WHERE election_id = %s AND vuelta = %s
+    """, (str(error)[:500], election_id, vuelta))
+
+def _avance(election_id, vuelta, progreso, total):
+    execute_db("""
+        UPDATE actas SET progreso = %s, total = %s, actualizada_en = NOW()
+        WHERE election_id = %s AND vuelta = %s
+    """, (progreso, total, election_id, vuelta))
+
+def generar_acta(election_id, vuelta):
+    """Calcula, firma y guarda el acta si está pendiente. Devuelve True si la generó esta llamada."""
+    if _tomar(election_id, vuelta) is None:
+        return False
+    try:
+        _generar(election_id, vuelta)
+    except Exception as e:
+        _fallo(election_id, vuelta, e)
+        raise
+    finally:
+        _soltar(election_id, vuelta)
+    return True
+
+def _generar(election_id, vuelta):
+    eleccion = query_db("SELECT * FROM elecciones WHERE id = %s", (election_id,), one=True)
+    cargos = query_db("""
+        SELECT c.id, c.nombre FROM eleccion_cargos ec JOIN cargos c ON c.id = ec.cargo_id
+        WHERE ec.election_id = %s ORDER BY c.id
+    """, (election_id,))
+    _avance(election_id, vuelta, 0, len(cargos))
+
+    # Un GROUP BY por cargo: cada uno usa el índice (election_id, cargo_id, vuelta) de votos
+    # y deja registrado el avance para la página de resultados
+    por_cargo = []
+    for i, cargo in enumerate(cargos, 1):
+        candidatos = [{'id': r['id'], 'nombres': r['nombres'], 'partido': r['partido'],
+                       'genero': r['genero'], 'foto_url': r['foto_url'], 'total': r['total']}
+                      for r in query_db(_VOTOS_CARGO, {'eid': election_id, 'cargo': cargo['id'], 'vuelta': vuelta})]
+        por_cargo.append({'id': cargo['id'], 'nombre': cargo['nombre'], 'candidatos': candidatos,
+                          'total': sum(c['total'] for c in candidatos)})
+        _avance(election_id, vuelta, i, len(cargos))
+
+    votaron, habilitados = contar_participacion(dict(eleccion, vuelta_actual=vuelta))
+    log = query_db("SELECT tamano, raiz FROM recibos_log WHERE election_id = %s AND vuelta = %s",
+                   (election_id, vuelta), one=True)
+    contenido = {
+        'eleccion': {'id': election_id, 'titulo': eleccion['titulo'], 'vuelta': vuelta},
+        'cargos': por_cargo,
+        'participacion': {'votaron': votaron, 'habilitados': habilitados},
+        'recibos': {'tamano': log['tamano'] if log else 0,
+                    'raiz': bytes(log['raiz']).hex() if log and log['raiz'] else None},
+        'generada_en': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }
+    texto = serializar(contenido)
+    hash_hex = hashlib.sha256(texto.encode('utf-8')).hexdigest()
+    execute_db("""
+        UPDATE actas SET estado = 'LISTA', contenido = %s, hash = %s, firma = %s,
+                         generada_en = NOW(), actualizada_en = NOW()
+        WHERE election_id = %s AND vuelta = %s AND estado <> 'LISTA'  -- Una vez firmada no cambia
+    """, (texto, hash_hex, firmar(mensaje_acta(election_id, vuelta, hash_hex)), election_id, vuelta))
+    registrar_evento('ACTA_RESULTADOS', f"Eleccion {election_id} vuelta {vuelta}: {votaron} votantes, "
+                                        f"sha256 {hash_hex}")
+
+
+def obtener_acta(election_id, vuelta):
+    """Fila del acta con `datos` (el contenido ya decodificado si está LISTA), o None."""
+    acta = query_db("SELECT * FROM actas WHERE election_id = %s AND vuelta = %s",
+                    (election_id, vuelta), one=True)
+    if acta is not None:
+        acta['datos'] = json.loads(acta['contenido']) if acta['estado'] == LISTA else None
+    return acta
+
+def resultados_de_acta(datos):
+    """{nombre_cargo: [candidatos con 'total']}, como conteos.resultados_por_cargo."""
+    return {cargo['nombre']: cargo['candidatos'] for cargo in datos['cargos']}
+
+def acta_csv(datos):
+    """Votos por candidato del acta, una fila por candidato."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(['vuelta', 'cargo', 'candidato_id', 'candidato', 'partido', 'votos'])
+    vuelta = datos['eleccion']['vuelta']
+    for cargo in datos['cargos']:
+        for c in cargo['candidatos']:
+            writer.writerow([vuelta, cargo['nombre'], c['id'], c['nombres'], c['partido'], c['total']])
+    return buf.getvalue()
+
+def documento_publico(acta):
+    """Lo que se publica para verificar: el texto exacto firmado, su hash y la firma."""
+    return {'eleccion': acta['election_id'], 'vuelta': acta['vuelta'], 'contenido': acta['contenido'],
+            'hash': acta['hash'], 'firma': acta['firma'],
+            'mensaje': mensaje_acta(acta['election_id'], acta['vuelta'], acta['hash']).decode('ascii'),
+            'generada_en': acta['generada_en'].isoformat() if acta['generada_en'] else None}
+
+def verificar_acta(acta):
+    """None si el contenido coincide con el hash y la firma; si no, la descripción de la falla."""
+    if hashlib.sha256(acta['contenido'].encode('utf-8')).hexdigest() != acta['hash']:
+        return "El contenido no coincide con su hash"
+    if not verificar_firma(mensaje_acta(acta['election_id'], acta['vuelta'], acta['hash']), acta['firma']):
+        return "Firma inválida"
+    return None
+
+
+class GeneradorActas:
+    """Hilo por worker que genera las actas pendientes; el advisory lock por acta reparte el trabajo entre workers."""
+
+    def __init__(self, app, intervalo):
+        self.app = app
+        self.intervalo = intervalo
+        self._pid = None
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self.stats = {'generadas': 0, 'errores': 0}
+
+    def asegurar_hilo(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name='actas', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def despertar(self):
+        self.asegurar_hilo()
+        self._evento.set()
+
+    def _run(self):
+        while True:
+            self._evento.wait(self.intervalo)
+            self._evento.clear()
+            try:
+                with self.app.app_context():
+                    while True:
+                        tomada = _tomar()
+                        if tomada is None:
+                            break
+                        eid, vuelta = tomada
+                        t0 = time.perf_counter()
+                        try:
+                            _generar(eid, vuelta)
+                        except Exception as e:
+                            self.stats['errores'] += 1
+                            _fallo(eid, vuelta, e)
+                            self.app.logger.warning(f"No se pudo generar el acta de la elección {eid} vuelta {vuelta}: {e}")
+                            continue
+                        finally:
+                            _soltar(eid, vuelta)
+                        self.stats['generadas'] += 1
+                        self.app.logger.info(f"Acta de la elección {eid} vuelta {vuelta} generada "
+                                             f"en {time.perf_counter() - t0:.1f} s")
+            except Exception as e:
+                self.stats['errores'] += 1
+                self.app.logger.warning(f"No se pudieron generar las actas pendientes: {e}")
+
+
+def init_actas(app):
+    generador = GeneradorActas(app, app.config['ACTAS_INTERVALO'])
+    app.extensions['generador_actas'] = generador
+    # Cualquier request arranca el hilo del worker (retoma actas que quedaron pendientes)
+    app.before_request(generador.asegurar_hilo)
+
+@click.command('generar-actas')
+@click.option('--eleccion', type=int, required=True)
+@click.option('--verificar', is_flag=True, help='Solo verificar hash y firma de las actas existentes.')
+def generar_actas_command(eleccion, verificar):
+    """Genera (o verifica) las actas de resultados firmadas de una elección cerrada."""
+    if not verificar:
+        e = query_db("SELECT cerrada, vuelta_actual FROM elecciones WHERE id = %s", (eleccion,), one=True)
+        if e is None or not e['cerrada']:
+            raise click.ClickException("La elección no existe o no está cerrada.")
+        for vuelta in range(1, e['vuelta_actual'] + 1):
+            execute_db("INSERT INTO actas (election_id, vuelta) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                       (eleccion, vuelta))
+            if generar_acta(eleccion, vuelta):
+                click.echo(f"  Vuelta {vuelta}: acta generada.")
+    fallas = 0
+    for acta in query_db("SELECT * FROM actas WHERE election_id = %s AND estado = 'LISTA' ORDER BY vuelta",
+                         (eleccion,)):
+        falla = verificar_acta(acta)
+        fallas += bool(falla)
+        click.echo(f"  Vuelta {acta['vuelta']}: {falla or 'íntegra'} (sha256 {acta['hash']})")
+    if fallas:
+        raise click.ClickException(f"{fallas} actas no verifican.")
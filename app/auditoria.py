@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import queue
+import atexit
+import datetime
+import threading
+import psycopg2
+import psycopg2.extras
+from flask import current_app
+from app.db import get_pool, execute_db, PoolAgotado
+
+# Escritor asíncrono de la tabla `auditoria`.
+# Los eventos se encolan en memoria y un hilo por worker los inserta por lotes cuando se
+# junta `AUDIT_BATCH` o pasa `AUDIT_FLUSH_INTERVAL`. Si la DB no responde, el lote se
+# guarda en un archivo local (append-only) que se reproduce al arrancar. Con la cola llena
+# el request espera hasta `AUDIT_PUT_TIMEOUT` (backpressure) y luego va al archivo.
+# Solo los errores de conexión mandan al archivo: si la DB rechaza un evento (DataError,
+# IntegrityError...) el lote se reintenta de a uno y los que siguen fallando se apartan en
+# `auditoria.descartados`, para que una fila inválida no bloquee a las demás en cada arranque.
+# Los eventos que deben ser atómicos con otra escritura usan sync=True.
+
+INSERT_SQL = "INSERT INTO auditoria (evento, detalle, usuario_id, ip_origen, fecha_evento) VALUES %s"
+# La DB no está disponible: reintentar más tarde (spool)
+TRANSITORIOS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolAgotado)
+
+
+class AuditWriter:
+    def __init__(self, app, lote, intervalo, capacidad, espera, spool, descartados):
+        self.app = app
+        self.lote = lote
+        self.intervalo = intervalo
+        self.espera = espera
+        self.spool = spool
+        self.descartados = descartados
+        self.cola = queue.Queue(capacidad)
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {'encolados': 0, 'escritos': 0, 'lotes': 0, 'spill': 0, 'esperas_llena': 0,
+                      'descartados': 0}
+
+    def _asegurar_hilo(self):
+        # Tras un fork el hilo del padre no existe en el hijo
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.cola = queue.Queue(self.cola.maxsize)
+                    self._hilo = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                    self._hilo.start()
+                    self._pid = os.getpid()
+
+    def registrar(self, evento):
+        self._asegurar_hilo()
+        self.stats['encolados'] += 1
+        try:
+            self.cola.put_nowait(evento)
+            return
+        except queue.Full:
+            self.stats['esperas_llena'] += 1
+        try:
+            self.cola.put(evento, timeout=self.espera)
+        except queue.Full:
+            self._spill([evento])
+
+    def _siguiente_lote(self):
+        lote = [self.cola.get()]
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.lote:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self.cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _run(self):
+        while True:
+            self._escribir(self._siguiente_lote())
+
+    def _insertar(self, eventos):
+        pool = get_pool(self.app)
+        conn = pool.getconn()
+        try:
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(cur, INSERT_SQL, eventos, page_size=len(eventos))
+            conn.commit()
+            cur.close()
+        finally:
+            pool.putconn(conn)
+
+    def _guardar(self, eventos):
+        """Inserta `eventos`; devuelve los que quedaron sin escribir por falta de DB."""
+        try:
+            self._insertar(eventos)
+            self.stats['escritos'] += len(eventos)
+            self.stats['lotes'] += 1
+            return []
+        except TRANSITORIOS as e:
+            self.app.logger.warning(f"Auditoría sin DB, {len(eventos)} eventos pendientes: {e}")
+            return eventos
+        except Exception as e:
+            self.app.logger.warning(f"Lote de auditoría rechazado ({e}); se reintenta evento por evento")
+        # Un evento inválido rechaza todo el lote: de a uno, solo se aparta el que falla
+        for i, ev in enumerate(eventos):
+            try:
+                self._insertar([ev])
+                self.stats['escritos'] += 1
+            except TRANSITORIOS as e:
+                self.app.logger.warning(f"Auditoría sin DB, {len(eventos) - i} eventos pendientes: {e}")
+                return eventos[i:]
+            except Exception as e:
+                self._descartar(ev, e)
+        return []
+
+    def _escribir(self, eventos):
+        pendientes = self._guardar(eventos)
+        if pendientes:
+            self._spill(pendientes)
+
+    def _descartar(self, evento, error):
+        """Aparta un evento que la DB rechaza (no se reintenta solo; queda para revisión manual)."""
+        self.stats['descartados'] += 1
+        self.app.logger.error(f"Evento de auditoría rechazado por la DB, guardado en {self.descartados}: {error}")
+        with self._lock:
+            with open(self.descartados, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'evento': evento, 'error': str(error).strip()}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _spill(self, eventos):
+        self.stats['spill'] += len(eventos)
+        with self._lock:
+            with open(self.spool, 'a', encoding='utf-8') as f:
+                for ev in eventos:
+                    f.write(json.dumps(ev) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def replay(self):
+        """Reinserta los eventos que quedaron en el archivo local. Devuelve cuántos se recuperaron."""
+        tomado = f"{self.spool}.{os.getpid()}.replay"
+        try:
+            os.rename(self.spool, tomado)  # Solo un worker se lo lleva
+        except FileNotFoundError:
+            return 0
+        with open(tomado, encoding='utf-8') as f:
+            eventos = [tuple(json.loads(linea)) for linea in f if linea.strip()]
+        pendientes = []
+        for i in range(0, len(eventos), self.lote):
+            pendientes = self._guardar(eventos[i:i + self.lote])
+            if pendientes:
+                pendientes += eventos[i + self.lote:]
+                break
+        if pendientes:
+            # Sin DB: se devuelven al spool para el próximo arranque
+            self._spill(pendientes)
+        os.remove(tomado)
+        return len(eventos) - len(pendientes)
+
+    def flush(self):
+        """Vacía la cola de forma síncrona (al terminar el proceso)."""
+        eventos = []
+        while True:
+            try:
+                eventos.append(self.cola.get_nowait())
+            except queue.Empty:
+                break
+        if eventos:
+            self._escribir(eventos)
+
+
+def init_auditoria(app):
+    if not app.config['AUDIT_ASYNC']:
+        return
+    os.makedirs(app.instance_path, exist_ok=True)
+    writer = AuditWriter(app,
+                         lote=app.config['AUDIT_BATCH'],
+                         intervalo=app.config['AUDIT_FLUSH_INTERVAL'],
+                         capacidad=app.config['AUDIT_BUFFER'],
+                         espera=app.config['AUDIT_PUT_TIMEOUT'],
+                         spool=os.path.join(app.instance_path, 'auditoria.spool'),
+                         descartados=os.path.join(app.instance_path, 'auditoria.descartados'))
+    app.extensions['audit_writer'] = writer
+    atexit.register(writer.flush)
+    try:
+        recuperados = writer.replay()
+        if recuperados:
+            app.logger.info(f"Auditoría: {recuperados} eventos recuperados del archivo local")
+    except Exception as e:
+        app.logger.warning(f"No se pudo reproducir el archivo de auditoría: {e}")
+
+def registrar_evento(evento, detalle, usuario_id=None, ip_origen=None, sync=False):
+    """Registra un evento de auditoría; por defecto asíncrono y por lotes."""
+    writer = current_app.extensions.get('audit_writer')
+    if sync or writer is None:
+        execute_db("INSERT INTO auditoria (evento, detalle, usuario_id, ip_origen) VALUES (%s, %s, %s, %s)",
+                   (evento, detalle, usuario_id, ip_origen))
+        return
+    writer.registrar((evento, detalle, usuario_id, ip_origen, datetime.datetime.now().isoformat()))
@@ -1,30 +1,40 @@
-import os
-import csv
 import io
+import json
 import datetime
-import bcrypt
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for, current_app
+    Blueprint, flash, g, redirect, render_template, request, url_for, current_app, Response, jsonify,
+    stream_with_context
 )
-from app.db import get_db, query_db, execute_db
-from app.blueprints.auth import admin_required
+from app.db import get_db, query_db, execute_db, close_db
+from app.blueprints.auth import admin_required, invalidar_usuario
+from app.boletas import publicar_boleta, invalidar_boleta
+from app.importacion import importar_votantes
+from app.conteos import resultados_por_cargo
+from app.auditoria import registrar_evento
+from app.en_vivo import stream_resultados
+from app.votantes import buscar_usuarios
+from app.fotos import procesar_foto, eliminar_si_huerfana, FotoInvalida
+from app.estadisticas import obtener_estadisticas
+from app.participacion import (contar_participacion, pagina_votantes, exportar_votantes,
+                               TIPOS as TIPOS_LISTA)
+from app.segunda_vuelta import generar_segunda_vuelta as generar_vuelta_2, SegundaVueltaError
+from app.elegibilidad import actualizar_votantes, sincronizar_cargos, habilitar_cohorte
+from app.recibos import firmar_raices
+from app.actas import solicitar_actas, obtener_acta, resultados_de_acta, acta_csv, documento_publico, LISTA
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 @bp.route('/')
 @admin_required
 def dashboard():
-    # Estadisticas rapidas
-    votos_totales = query_db("SELECT COUNT(*) as c FROM votos", one=True)['c']
-    elecciones_activas = query_db("SELECT COUNT(*) as c FROM elecciones WHERE activa = TRUE", one=True)['c']
-    usuarios_totales = query_db("SELECT COUNT(*) as c FROM usuarios WHERE rol='VOTANTE'", one=True)['c']
-    
-    # Ultimos eventos auditoria
-    auditoria = query_db("SELECT * FROM auditoria ORDER BY fecha_evento DESC LIMIT 10")
-    
-    return render_template('admin/dashboard.html', 
-                           stats={'votos': votos_totales, 'elecciones': elecciones_activas, 'usuarios': usuarios_totales},
-                           auditoria=auditoria)
+    # Estadisticas precalculadas (ver app/estadisticas.py), con su antigüedad
+    datos = obtener_estadisticas()
+    return render_template('admin/dashboard.html',
+                           stats=datos['stats'],
+                           elecciones=datos['elecciones'],
+                           auditoria=datos['auditoria'],
+                           cadena=datos.get('cadena'),
+                           edad=datos['edad'])
 
 # --- ELECCIONES ---
 @bp.route('/elecciones', methods=('GET', 'POST'))
@@ -46,27 +56,46 @@ def elecciones():
             # Obtener el ID de la elección recién creada
             nueva = query_db("SELECT id FROM elecciones ORDER BY id DESC LIMIT 1", one=True)
             
-            execute_db("INSERT INTO auditoria (evento, detalle, usuario_id) VALUES (%s, %s, %s)",
-                       ('ADMIN_CREA_ELECCION', f'Eleccion: {titulo}', g.user['id']))
+            registrar_evento('ADMIN_CREA_ELECCION', f'Eleccion: {titulo}', g.user['id'])
             flash('Elección creada. Ahora configura los cargos y candidatos.', 'success')
             return redirect(url_for('admin.eleccion_detalle', id=nueva['id']))
             
         elif action == 'toggle_active':
             eid = request.form['id']
-            curr = query_db("SELECT activa FROM elecciones WHERE id=%s", (eid,), one=True)
+            curr = query_db("SELECT activa, vuelta_actual FROM elecciones WHERE id=%s", (eid,), one=True)
             new_state = not curr['activa']
             execute_db("UPDATE elecciones SET activa = %s WHERE id = %s", (new_state, eid))
+            if new_state:
+                publicar_boleta(int(eid), curr['vuelta_actual'])
             flash(f'Estado cambiado a {"ACTIVA" if new_state else "INACTIVA"}', 'success')
             
         elif action == 'close':
             eid = request.form['id']
             execute_db("UPDATE elecciones SET cerrada = TRUE, activa = FALSE WHERE id = %s", (eid,))
+            # Publica la raíz firmada del registro de recibos de cada vuelta
+            for vuelta, r in firmar_raices(int(eid)).items():
+                registrar_evento('FIRMA_RECIBOS', f"Eleccion {eid} vuelta {vuelta}: {r['tamano']} recibos, raiz {r['raiz']}",
+                                 g.user['id'])
+            # Congela los resultados de cada vuelta en un acta firmada
+            estados = solicitar_actas(int(eid))
             flash('Elección cerrada definitivamente.', 'warning')
+            if any(estado != LISTA for estado in estados.values()):
+                flash('El acta de resultados se está generando en segundo plano; '
+                      'el avance se ve en la página de resultados.', 'info')
             
     elecciones = query_db("SELECT * FROM elecciones ORDER BY fecha_inicio DESC")
     return render_template('admin/elecciones.html', elecciones=elecciones)
 
 # --- DETALLE / CONFIGURACIÓN DE ELECCIÓN (Vista Unificada) ---
+def _eliminar_foto(foto_url):
+    """Borra los archivos de la foto si ningún otro candidato la comparte (nombres por contenido)."""
+    if foto_url:
+        en_uso = query_db("SELECT 1 FROM candidatos WHERE foto_url=%s LIMIT 1", (foto_url,), one=True)
+        eliminar_si_huerfana(foto_url, en_uso is not None)
+
+ACCIONES_BOLETA = ('save_cargos', 'add_cargo_nuevo', 'remove_cargo',
+                   'add_candidato', 'edit_candidato', 'delete_candidato')
+
 @bp.route('/elecciones/<int:id>', methods=('GET', 'POST'))
 @admin_required
 def eleccion_detalle(id):
@@ -84,6 +113,10 @@ def eleccion_detalle(id):
         
         action = request.form.get('action')
         
+        # Acciones que cambian la boleta: la guardada deja de ser válida
+        if action in ACCIONES_BOLETA:
+            invalidar_boleta(id)
+        
         if action == 'update_info':
             titulo = request.form['titulo']
             f_inicio = request.form['fecha_inicio']
@@ -96,10 +129,7 @@ def eleccion_detalle(id):
             flash("Datos de la elección actualizados.", "success")
         
         elif action == 'save_cargos':
-            cargos_selec = request.form.getlist('cargos')
-            execute_db("DELETE FROM eleccion_cargos WHERE election_id = %s", (id,))
-            for cid in cargos_selec:
-                execute_db("INSERT INTO eleccion_cargos (election_id, cargo_id) VALUES (%s, %s)", (id, cid))
+            sincronizar_cargos(id, request.form.getlist('cargos'))
             flash("Cargos actualizados.", "success")
         
         elif action == 'add_cargo_nuevo':
@@ -135,20 +165,15 @@ def eleccion_detalle(id):
             partido = request.form['partido']
             genero = request.form.get('genero', 'M')
             
-            # Handle photo upload
+            # Foto: se valida y se guarda en tamaños fijos bajo un nombre por contenido
             foto_filename = None
             foto = request.files.get('foto')
             if foto and foto.filename:
-                import uuid
-                from werkzeug.utils import secure_filename
-                ext = foto.filename.rsplit('.', 1)[-1].lower() if '.' in foto.filename else 'jpg'
-                if ext not in ('jpg', 'jpeg', 'png', 'gif', 'webp'):
-                    flash("Formato de imagen no válido. Use JPG, PNG, GIF o WEBP.", "error")
+                try:
+                    foto_filename = procesar_foto(foto)
+                except FotoInvalida as e:
+                    flash(str(e), "error")
                     return redirect(url_for('admin.eleccion_detalle', id=id))
-                foto_filename = f"{uuid.uuid4().hex}.{ext}"
-                upload_dir = os.path.join(current_app.static_folder, 'uploads', 'candidatos')
-                os.makedirs(upload_dir, exist_ok=True)
-                foto.save(os.path.join(upload_dir, foto_filename))
             
             execute_db("""
                 INSERT INTO candidatos (election_id, cargo_id, nombres, partido, genero, foto_url)
@@ -163,27 +188,19 @@ def eleccion_detalle(id):
             partido = request.form['partido']
             genero = request.form.get('genero', 'M')
             
-            # Handle optional new photo
+            # Foto nueva opcional
             foto = request.files.get('foto')
             if foto and foto.filename:
-                import uuid
-                ext = foto.filename.rsplit('.', 1)[-1].lower() if '.' in foto.filename else 'jpg'
-                if ext in ('jpg', 'jpeg', 'png', 'gif', 'webp'):
-                    # Delete old photo
-                    old = query_db("SELECT foto_url FROM candidatos WHERE id=%s", (candidato_id,), one=True)
-                    if old and old['foto_url']:
-                        old_path = os.path.join(current_app.static_folder, 'uploads', 'candidatos', old['foto_url'])
-                        if os.path.exists(old_path):
-                            os.remove(old_path)
-                    foto_filename = f"{uuid.uuid4().hex}.{ext}"
-                    upload_dir = os.path.join(current_app.static_folder, 'uploads', 'candidatos')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    foto.save(os.path.join(upload_dir, foto_filename))
-                    execute_db("UPDATE candidatos SET nombres=%s, partido=%s, genero=%s, foto_url=%s WHERE id=%s AND election_id=%s",
-                               (nombres, partido, genero, foto_filename, candidato_id, id))
-                else:
-                    flash("Formato de imagen no válido.", "error")
+                try:
+                    foto_filename = procesar_foto(foto)
+                except FotoInvalida as e:
+                    flash(str(e), "error")
                     return redirect(url_for('admin.eleccion_detalle', id=id))
+                old = query_db("SELECT foto_url FROM candidatos WHERE id=%s", (candidato_id,), one=True)
+                execute_db("UPDATE candidatos SET nombres=%s, partido=%s, genero=%s, foto_url=%s WHERE id=%s AND election_id=%s",
+                           (nombres, partido, genero, foto_filename, candidato_id, id))
+                if old and old['foto_url'] != foto_filename:
+                    _eliminar_foto(old['foto_url'])
             else:
                 execute_db("UPDATE candidatos SET nombres=%s, partido=%s, genero=%s WHERE id=%s AND election_id=%s",
                            (nombres, partido, genero, candidato_id, id))
@@ -192,13 +209,10 @@ def eleccion_detalle(id):
         
         elif action == 'delete_candidato':
             candidato_id = request.form['candidato_id']
-            # Remove photo file if exists
             cand = query_db("SELECT foto_url FROM candidatos WHERE id=%s", (candidato_id,), one=True)
-            if cand and cand['foto_url']:
-                foto_path = os.path.join(current_app.static_folder, 'uploads', 'candidatos', cand['foto_url'])
-                if os.path.exists(foto_path):
-                    os.remove(foto_path)
             execute_db("DELETE FROM candidatos WHERE id=%s AND election_id=%s", (candidato_id, id))
+            if cand:
+                _eliminar_foto(cand['foto_url'])
             flash("Candidato eliminado.", "success")
             return redirect(url_for('admin.eleccion_detalle', id=id) + '#candidatos')
         
@@ -211,11 +225,29 @@ def eleccion_detalle(id):
             return redirect(url_for('admin.eleccion_detalle', id=id) + '#votantes')
         
         elif action == 'save_votantes':
-            votante_ids = request.form.getlist('votante_ids')
-            execute_db("DELETE FROM eleccion_votantes WHERE election_id=%s", (id,))
-            for vid in votante_ids:
-                execute_db("INSERT INTO eleccion_votantes (election_id, votante_id) VALUES (%s, %s)", (id, int(vid)))
-            flash(f"{len(votante_ids)} votantes habilitados para esta elección.", "success")
+            # La lista es paginada: el formulario envía solo los cambios hechos por el admin
+            r = actualizar_votantes(id, agregar=request.form.getlist('agregar_ids'),
+                                    quitar=request.form.getlist('quitar_ids'))
+            flash(f"Votantes actualizados: {r['agregados']} agregados, {r['quitados']} quitados.", "success")
+            return redirect(url_for('admin.eleccion_detalle', id=id) + '#votantes')
+        
+        elif action == 'cohorte_votantes':
+            # CSV de cédulas: habilita (o reemplaza por) una cohorte completa en una transacción
+            archivo = request.files.get('archivo_cohorte')
+            if not archivo or archivo.filename == '':
+                flash("Selecciona un archivo CSV de cédulas.", "error")
+                return redirect(url_for('admin.eleccion_detalle', id=id) + '#votantes')
+            stream = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig', newline='')
+            r = habilitar_cohorte(id, stream, reemplazar='reemplazar' in request.form)
+            flash(f"Cohorte cargada: {r['leidas']} cédulas, {r['agregados']} agregados, "
+                  f"{r['quitados']} quitados.", "success")
+            if r['no_encontradas']:
+                flash(f"Cédulas sin votante registrado ({len(r['no_encontradas'])}): "
+                      f"{', '.join(r['no_encontradas'][:10])}...", "warning")
+            if r['invalidas']:
+                flash(f"Valores que no son cédulas de 10 dígitos, ignorados ({len(r['invalidas'])}): "
+                      f"{', '.join(r['invalidas'][:10])}...", "warning")
+            registrar_evento('ADMIN_CARGA_COHORTE', f"Eleccion ID: {id}, agregados: {r['agregados']}", g.user['id'])
             return redirect(url_for('admin.eleccion_detalle', id=id) + '#votantes')
         
         elif action == 'activate':
@@ -238,8 +270,8 @@ def eleccion_detalle(id):
                     flash(f"Los siguientes cargos necesitan al menos 2 candidatos: {nombres}", "error")
                 else:
                     execute_db("UPDATE elecciones SET activa = TRUE WHERE id = %s", (id,))
-                    execute_db("INSERT INTO auditoria (evento, detalle, usuario_id) VALUES (%s, %s, %s)",
-                               ('ADMIN_ACTIVA_ELECCION', f'Eleccion ID: {id}', g.user['id']))
+                    publicar_boleta(id, eleccion['vuelta_actual'])
+                    registrar_evento('ADMIN_ACTIVA_ELECCION', f'Eleccion ID: {id}', g.user['id'])
                     flash("¡Elección activada exitosamente!", "success")
                     return redirect(url_for('admin.elecciones'))
         
@@ -255,22 +287,20 @@ def eleccion_detalle(id):
     """, (id,))
     asignados_ids = [c['id'] for c in cargos_asignados]
     
-    # Candidatos agrupados por cargo
-    candidatos_por_cargo = {}
-    for cargo in cargos_asignados:
-        cands = query_db("""
-            SELECT * FROM candidatos
-            WHERE election_id = %s AND cargo_id = %s
-            ORDER BY nombres
-        """, (id, cargo['id']))
-        candidatos_por_cargo[cargo['id']] = cands
+    # Candidatos agrupados por cargo, en una sola consulta
+    candidatos_por_cargo = {cid: [] for cid in asignados_ids}
+    for cand in query_db("""
+        SELECT * FROM candidatos
+        WHERE election_id = %s
+        ORDER BY cargo_id, nombres
+    """, (id,)):
+        candidatos_por_cargo.setdefault(cand['cargo_id'], []).append(cand)
     
-    # Votantes para gestión de elegibilidad
-    todos_votantes = query_db("SELECT id, cedula, nombres, apellidos FROM usuarios WHERE rol='VOTANTE' AND habilitado=TRUE ORDER BY apellidos, nombres")
-    votantes_asignados_ids = []
+    # Votantes para gestión de elegibilidad: la lista se pagina desde admin.api_votantes
+    votantes_asignados = 0
     if not eleccion['todos_habilitados']:
-        rows = query_db("SELECT votante_id FROM eleccion_votantes WHERE election_id=%s", (id,))
-        votantes_asignados_ids = [r['votante_id'] for r in rows]
+        votantes_asignados = query_db("SELECT COUNT(*) AS c FROM eleccion_votantes WHERE election_id=%s",
+                                      (id,), one=True)['c']
     
     return render_template('admin/eleccion_detalle.html',
                            eleccion=eleccion,
@@ -279,13 +309,23 @@ def eleccion_detalle(id):
                            cargos_asignados=cargos_asignados,
                            asignados_ids=asignados_ids,
                            candidatos_por_cargo=candidatos_por_cargo,
-                           todos_votantes=todos_votantes,
-                           votantes_asignados_ids=votantes_asignados_ids)
+                           votantes_asignados=votantes_asignados)
 
 # --- USUARIOS CSV ---
 @bp.route('/usuarios', methods=('GET', 'POST'))
 @admin_required
 def usuarios():
+    if request.method == 'POST' and request.form.get('action') == 'toggle_habilitado':
+        uid = request.form['id']
+        if int(uid) == g.user['id']:
+            flash("No puedes deshabilitar tu propio usuario.", "error")
+            return redirect(url_for('admin.usuarios'))
+        execute_db("UPDATE usuarios SET habilitado = NOT habilitado WHERE id = %s", (uid,))
+        invalidar_usuario(uid)
+        registrar_evento('ADMIN_CAMBIA_HABILITADO', f'Usuario ID: {uid}', g.user['id'])
+        flash("Estado del usuario actualizado.", "success")
+        return redirect(url_for('admin.usuarios'))
+
     if request.method == 'POST':
         if 'file' not in request.files:
             flash('No file part', 'error')
@@ -296,172 +336,164 @@ def usuarios():
             return redirect(request.url)
         
         if file:
-            # Procesar CSV
-            stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-            csv_input = csv.DictReader(stream)
-            
-            exitos = 0
-            errores = []
+            # Procesar CSV en streaming (lotes + bcrypt en paralelo). Los procesos se arrancan con
+            # spawn: un fork de este worker copiaría los hilos de auditoría, sellado y actas
+            stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+            r = importar_votantes(stream,
+                                  workers=current_app.config['IMPORT_WORKERS'],
+                                  verificar_digito=current_app.config['IMPORT_VERIFICAR_DIGITO'],
+                                  rounds=current_app.config['BCRYPT_ROUNDS'],
+                                  arranque='spawn')
+            exitos = r['insertadas']
+            errores = r['errores']
             
-            for row in csv_input:
-                try:
-                    # Validaciones
-                    cedula = row['cedula'].strip()
-                    if len(cedula) != 10 or not cedula.isdigit():
-                         raise Exception(f"Cédula inválida: {cedula}")
-                    
-                    # Validar password (simple)
-                    clave = row['clave']
-                    if len(clave) < 8:
-                        raise Exception("Clave muy corta")
-                    
-                    hashed = bcrypt.hashpw(clave.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                    habilitado = row.get('habilitado', 'true').lower() == 'true'
-                    
-                    execute_db("""
-                        INSERT INTO usuarios (cedula, nombres, apellidos, fecha_nacimiento, clave, rol, habilitado)
-                        VALUES (%s, %s, %s, %s, %s, 'VOTANTE', %s)
-                        ON CONFLICT (cedula) DO NOTHING
-                    """, (cedula, row['nombres'], row['apellidos'], row['fecha_nacimiento'], hashed, habilitado))
-                    exitos += 1
-                except Exception as e:
-                    errores.append(f"Fila {row.get('cedula', '?')}: {str(e)}")
+            # La carga puede tocar muchos usuarios: invalidar la cache completa
+            invalidar_usuario()
             
-            flash(f"Carga completada. Exitos: {exitos}. Errores: {len(errores)}", "info")
+            flash(f"Carga completada. Exitos: {exitos}. Ya existentes: {r['duplicadas']}. Errores: {len(errores)}", "info")
             if errores:
                 flash(f"Detalle errores: {'; '.join(errores[:5])}...", "warning")
             
-            execute_db("INSERT INTO auditoria (evento, detalle, usuario_id) VALUES (%s, %s, %s)",
-                       ('ADMIN_CARGA_CSV', f'Usuarios importados: {exitos}', g.user['id']))
+            registrar_evento('ADMIN_CARGA_CSV', f'Usuarios importados: {exitos}', g.user['id'])
+
+    # Listar usuarios registrados (paginado por keyset)
+    filtros = _filtros_usuarios(request.args)
+    usuarios_list, siguiente = buscar_usuarios(rol=request.args.get('rol') or None,
+                                               despues=request.args.get('despues'), **filtros)
+    return render_template('admin/usuarios.html', usuarios=usuarios_list, siguiente=siguiente)
+
+def _filtros_usuarios(args):
+    """Filtros comunes de búsqueda a partir del query string."""
+    bool_o_none = {'si': True, 'no': False}
+    return {'q': args.get('q') or None,
+            'habilitado': bool_o_none.get(args.get('habilitado')),
+            'limite': args.get('limite', 50, type=int)}
 
-    # Listar usuarios registrados
-    usuarios_list = query_db("SELECT * FROM usuarios ORDER BY rol DESC, id ASC")
-    return render_template('admin/usuarios.html', usuarios=usuarios_list)
+@bp.route('/api/votantes')
+@admin_required
+def api_votantes():
+    """Búsqueda paginada de votantes; con election_id indica y filtra por asignación."""
+    bool_o_none = {'si': True, 'no': False}
+    items, siguiente = buscar_usuarios(election_id=request.args.get('election_id', type=int),
+                                       asignado=bool_o_none.get(request.args.get('asignado')),
+                                       despues=request.args.get('despues'),
+                                       **_filtros_usuarios(request.args))
+    campos = ('id', 'cedula', 'nombres', 'apellidos', 'habilitado', 'asignado')
+    return jsonify(items=[{k: row[k] for k in campos} for row in items], siguiente=siguiente)
 
 # --- RESULTADOS ---
 @bp.route('/resultados/<int:election_id>')
 @admin_required
 def resultados(election_id):
     eleccion = query_db("SELECT * FROM elecciones WHERE id=%s", (election_id,), one=True)
-    cargos = query_db("""
-        SELECT c.* FROM cargos c 
-        JOIN eleccion_cargos ec ON c.id = ec.cargo_id 
-        WHERE ec.election_id = %s
-    """, (election_id,))
-    
     vuelta = eleccion['vuelta_actual']
-    resultados_data = {}
-    
-    for cargo in cargos:
-        rows = query_db("""
-            SELECT cand.nombres, cand.partido, cand.genero, cand.foto_url, COUNT(v.id) as total
-            FROM candidatos cand
-            LEFT JOIN votos v ON v.candidato_id = cand.id AND v.vuelta = %s AND v.election_id = %s
-            WHERE cand.cargo_id = %s AND cand.election_id = %s
-            GROUP BY cand.id
-            ORDER BY total DESC
-        """, (vuelta, election_id, cargo['id'], election_id))
-        
-        resultados_data[cargo['nombre']] = rows
-    
-    # Estadísticas de participación
-    votos_row = query_db("SELECT COUNT(DISTINCT votante_id) as total FROM votos WHERE election_id=%s AND vuelta=%s",
-                         (election_id, vuelta), one=True)
-    total_votos = votos_row['total'] if votos_row else 0
-    
-    # Total votantes: si la elección usa votantes específicos, contar solo esos
-    if eleccion['todos_habilitados']:
-        votantes_row = query_db("SELECT COUNT(*) as total FROM usuarios WHERE rol='VOTANTE' AND habilitado=TRUE", one=True)
+    # Cerrada: se sirve el acta firmada; mientras se genera, el cálculo en vivo con su avance
+    acta = obtener_acta(election_id, vuelta) if eleccion['cerrada'] else None
+    if acta and acta['datos']:
+        resultados_data = resultados_de_acta(acta['datos'])
+        total_votos = acta['datos']['participacion']['votaron']
+        total_votantes = acta['datos']['participacion']['habilitados']
     else:
-        votantes_row = query_db("SELECT COUNT(*) as total FROM eleccion_votantes WHERE election_id=%s", (election_id,), one=True)
-    total_votantes = votantes_row['total'] if votantes_row else 0
-    
+        resultados_data = resultados_por_cargo(election_id, vuelta)
+        # Participación: solo conteos; las listas de votantes se piden bajo demanda
+        total_votos, total_votantes = contar_participacion(eleccion)
     participacion = round((total_votos / total_votantes * 100), 1) if total_votantes > 0 else 0
     
-    # Obtener lista de votantes que ya votaron
-    votantes_que_votaron = query_db("""
-        SELECT DISTINCT u.cedula, u.nombres, u.apellidos, u.genero, MIN(v.fecha_voto) as fecha_voto
-        FROM votos v
-        JOIN usuarios u ON u.id = v.votante_id
-        WHERE v.election_id = %s AND v.vuelta = %s
-        GROUP BY u.id, u.cedula, u.nombres, u.apellidos, u.genero
-        ORDER BY MIN(v.fecha_voto) DESC
-    """, (election_id, vuelta))
-    
-    # Obtener lista de votantes que NO han votado (pendientes / ausentes)
-    if eleccion['todos_habilitados']:
-        votantes_pendientes = query_db("""
-            SELECT u.cedula, u.nombres, u.apellidos, u.genero
-            FROM usuarios u
-            WHERE u.rol = 'VOTANTE' AND u.habilitado = TRUE
-              AND u.id NOT IN (
-                  SELECT DISTINCT v.votante_id FROM votos v
-                  WHERE v.election_id = %s AND v.vuelta = %s
-              )
-            ORDER BY u.apellidos, u.nombres
-        """, (election_id, vuelta))
-    else:
-        votantes_pendientes = query_db("""
-            SELECT u.cedula, u.nombres, u.apellidos, u.genero
-            FROM usuarios u
-            JOIN eleccion_votantes ev ON ev.votante_id = u.id
-            WHERE ev.election_id = %s
-              AND u.id NOT IN (
-                  SELECT DISTINCT v.votante_id FROM votos v
-                  WHERE v.election_id = %s AND v.vuelta = %s
-              )
-            ORDER BY u.apellidos, u.nombres
-        """, (election_id, election_id, vuelta))
-    
     return render_template('admin/resultados.html', 
                            eleccion=eleccion, 
                            resultados=resultados_data,
                            total_votos=total_votos,
                            total_votantes=total_votantes,
                            participacion=participacion,
-                           votantes_que_votaron=votantes_que_votaron,
-                           votantes_pendientes=votantes_pendientes)
+                           total_pendientes=max(total_votantes - total_votos, 0),
+                           acta=acta)
+
+@bp.route('/resultados/<int:election_id>/acta/estado')
+@admin_required
+def acta_estado(election_id):
+    """Estado y avance de las actas de la elección (lo consulta la página de resultados)."""
+    actas = query_db("""
+        SELECT vuelta, estado, progreso, total, hash, error FROM actas WHERE election_id = %s ORDER BY vuelta
+    """, (election_id,))
+    return jsonify(actas=actas)
+
+@bp.route('/resultados/<int:election_id>/acta/<int:vuelta>')
+@admin_required
+def acta_exportar(election_id, vuelta):
+    """Descarga el acta firmada (JSON con contenido, hash y firma) o sus votos en CSV."""
+    formato = request.args.get('formato', 'json')
+    acta = obtener_acta(election_id, vuelta)
+    if not acta or not acta['datos'] or formato not in ('csv', 'json'):
+        flash("El acta de resultados no está disponible.", "error")
+        return redirect(url_for('admin.resultados', election_id=election_id))
+    registrar_evento('ADMIN_EXPORTA_ACTA', f'Eleccion ID: {election_id}, vuelta: {vuelta}', g.user['id'])
+    nombre = f"acta_eleccion_{election_id}_v{vuelta}.{formato}"
+    if formato == 'csv':
+        cuerpo, mimetype = acta_csv(acta['datos']), 'text/csv'
+    else:
+        cuerpo, mimetype = json.dumps(documento_publico(acta), ensure_ascii=False, indent=2), 'application/json'
+    return Response(cuerpo, mimetype=f'{mimetype}; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+
+@bp.route('/resultados/<int:election_id>/votantes')
+@admin_required
+def resultados_votantes(election_id):
+    """Página (keyset) de la lista de votantes que sufragaron o están pendientes."""
+    eleccion = query_db("SELECT * FROM elecciones WHERE id=%s", (election_id,), one=True)
+    tipo = request.args.get('tipo', 'sufragaron')
+    if not eleccion or tipo not in TIPOS_LISTA:
+        return jsonify(error='Parámetros inválidos'), 400
+    items, siguiente = pagina_votantes(eleccion, tipo, despues=request.args.get('despues'),
+                                       limite=request.args.get('limite', 100, type=int))
+    campos = ('cedula', 'nombres', 'apellidos', 'genero')
+    return jsonify(items=[dict({k: row[k] for k in campos},
+                               fecha_voto=row['fecha_voto'].strftime('%d/%m/%Y %H:%M') if row.get('fecha_voto') else None)
+                          for row in items],
+                   siguiente=siguiente)
+
+@bp.route('/resultados/<int:election_id>/exportar')
+@admin_required
+def resultados_exportar(election_id):
+    """Descarga la lista completa en CSV o JSON, generada en streaming."""
+    eleccion = query_db("SELECT * FROM elecciones WHERE id=%s", (election_id,), one=True)
+    tipo = request.args.get('tipo', 'sufragaron')
+    formato = request.args.get('formato', 'csv')
+    if not eleccion or tipo not in TIPOS_LISTA or formato not in ('csv', 'json'):
+        flash("Parámetros de exportación inválidos.", "error")
+        return redirect(url_for('admin.elecciones'))
+    registrar_evento('ADMIN_EXPORTA_VOTANTES', f'Eleccion ID: {election_id}, lista: {tipo}', g.user['id'])
+    nombre = f"eleccion_{election_id}_v{eleccion['vuelta_actual']}_{tipo}.{formato}"
+    mimetype = 'text/csv' if formato == 'csv' else 'application/json'
+    return Response(stream_with_context(exportar_votantes(eleccion, tipo, formato)),
+                    mimetype=f'{mimetype}; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"'})
+
+@bp.route('/resultados/<int:election_id>/stream')
+@admin_required
+def resultados_stream(election_id):
+    # El stream puede durar horas: no retener una conexión del pool mientras tanto
+    close_db()
+    return Response(stream_resultados(election_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # --- GENERAR SEGUNDA VUELTA ---
 @bp.route('/segunda-vuelta/<int:election_id>', methods=['POST'])
 @admin_required
 def generar_segunda_vuelta(election_id):
-    eleccion = query_db("SELECT * FROM elecciones WHERE id=%s", (election_id,), one=True)
-    if eleccion['vuelta_actual'] != 1 or not eleccion['tiene_segunda_vuelta']:
-        flash("La elección no cumple condiciones para segunda vuelta.", "error")
+    try:
+        r = generar_vuelta_2(election_id, regla=current_app.config['SEGUNDA_VUELTA_EMPATE'])
+    except SegundaVueltaError as e:
+        flash(str(e), "error")
         return redirect(url_for('admin.resultados', election_id=election_id))
     
-    # Logica: Para cada cargo, tomar Top 2
-    cargos = query_db("SELECT cargo_id FROM eleccion_cargos WHERE election_id = %s", (election_id,))
-    
-    for c in cargos:
-        cid = c['cargo_id']
-        top2 = query_db("""
-            SELECT candidato_id, COUNT(*) as votos
-            FROM votos
-            WHERE election_id = %s AND cargo_id = %s AND vuelta = 1
-            GROUP BY candidato_id
-            ORDER BY votos DESC
-            LIMIT 2
-        """, (election_id, cid))
-        
-        if len(top2) < 2:
-            # Edge case: Menos de 2 candidatos con votos?
-            # En un sistema real habria reglas complejas. Aqui asumo pasamos lo que haya.
-            pass
-            
-        for cand in top2:
-             execute_db("""
-                INSERT INTO candidatos_vuelta (original_candidato_id, election_id, cargo_id, vuelta)
-                VALUES (%s, %s, %s, 2)
-             """, (cand['candidato_id'], election_id, cid))
-             
-    # Actualizar eleccion
-    execute_db("UPDATE elecciones SET vuelta_actual = 2 WHERE id = %s", (election_id,))
-    
-    execute_db("INSERT INTO auditoria (evento, detalle, usuario_id) VALUES (%s, %s, %s)",
-                       ('GENERA_SEGUNDA_VUELTA', f'Eleccion {election_id} a Vuelta 2', g.user['id']))
+    # La primera vuelta quedó cerrada: su acta se congela igual que al cerrar la elección
+    solicitar_actas(election_id, [1])
+    registrar_evento('GENERA_SEGUNDA_VUELTA',
+                     f"Eleccion {election_id} a Vuelta 2 ({r['finalistas']} finalistas)", g.user['id'])
     
     flash("Segunda vuelta generada con éxito.", "success")
+    if r['empates']:
+        flash(f"Empate en el corte resuelto por la regla '{current_app.config['SEGUNDA_VUELTA_EMPATE']}' en: "
+              f"{', '.join(sorted(r['empates']))}.", "warning")
     return redirect(url_for('admin.resultados', election_id=election_id))
 
@@ -1,9 +1,10 @@
 import functools
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, flash, g, redirect, render_template, request, session, url_for, current_app, make_response
 )
-import bcrypt
 from app.db import get_db, query_db, execute_db
+from app.auditoria import registrar_evento
+from app.claves import verificar_clave, VerificacionSaturada
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -28,6 +29,20 @@ def admin_required(view):
         return view(**kwargs)
     return wrapped_view
 
+# --- Cache de usuarios por worker ---
+# Solo las columnas que usan las vistas; nunca el hash de la clave.
+USER_COLS = "id, cedula, nombres, apellidos, genero, rol, habilitado"
+
+def user_cache():
+    return current_app.extensions['user_cache']
+
+def invalidar_usuario(user_id=None):
+    """Saca un usuario de la cache (o toda la cache si no se indica id)."""
+    if user_id is None:
+        user_cache().clear()
+    else:
+        user_cache().delete(int(user_id))
+
 # --- Carga de usuario en cada request ---
 @bp.before_app_request
 def load_logged_in_user():
@@ -35,8 +50,16 @@ def load_logged_in_user():
 
     if user_id is None:
         g.user = None
-    else:
-        g.user = query_db("SELECT * FROM usuarios WHERE id = %s", (user_id,), one=True)
+        return
+
+    cache = user_cache()
+    user = cache.get(user_id)
+    if user is None:
+        user = query_db(f"SELECT {USER_COLS} FROM usuarios WHERE id = %s", (user_id,), one=True)
+        if user is not None:
+            cache.set(user_id, dict(user))
+    # Un usuario deshabilitado pierde la sesión en cuanto expira/invalida su entrada
+    g.user = dict(user) if user and user['habilitado'] else None
 
 # --- Rutas ---
 @bp.route('/login', methods=('GET', 'POST'))
@@ -54,10 +77,19 @@ def login():
         elif not user['habilitado']:
              error = 'Usuario deshabilitado.'
         else:
-            # Validar password
-            # La password en DB debe ser bytes para bcrypt, asegurarnos de encode
-            if not bcrypt.checkpw(password.encode('utf-8'), user['clave'].encode('utf-8')):
+            # Validar password en el pool de bcrypt (fuera del hilo del request)
+            try:
+                ok, nuevo_hash = verificar_clave(password, user['clave'])
+            except VerificacionSaturada:
+                flash('Hay muchos ingresos en este momento. Intenta de nuevo en unos segundos.', 'warning')
+                resp = make_response(render_template('auth/login.html'), 503)
+                resp.headers['Retry-After'] = '5'
+                return resp
+            if not ok:
                 error = 'Contraseña incorrecta.'
+            elif nuevo_hash:
+                # El costo del hash no coincide con BCRYPT_ROUNDS: se guarda el rehash
+                execute_db("UPDATE usuarios SET clave = %s WHERE id = %s", (nuevo_hash, user['id']))
 
         if error is None:
             session.clear()
@@ -65,8 +97,7 @@ def login():
             session['user_rol'] = user['rol']
             
             # Auditoría
-            execute_db("INSERT INTO auditoria (evento, detalle, usuario_id, ip_origen) VALUES (%s, %s, %s, %s)",
-                       ('LOGIN_OK', f'Ingreso de {user["rol"]}', user['id'], request.remote_addr))
+            registrar_evento('LOGIN_OK', f'Ingreso de {user["rol"]}', user['id'], request.remote_addr)
             
             if user['rol'] == 'ADMIN':
                 return redirect(url_for('admin.dashboard'))
@@ -75,8 +106,7 @@ def login():
 
         flash(error, 'error')
         # Registrar fallo login (sin usuario id si no existe, o con si existe pero falló pass)
-        execute_db("INSERT INTO auditoria (evento, detalle, ip_origen) VALUES (%s, %s, %s)",
-                   ('LOGIN_FAIL', f'Intento fallido cedula: {cedula}', request.remote_addr))
+        registrar_evento('LOGIN_FAIL', f'Intento fallido cedula: {cedula}', ip_origen=request.remote_addr)
 
     return render_template('auth/login.html')
 
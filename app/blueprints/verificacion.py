@@ -0,0 +1,158 @@
+import re
+from flask import Blueprint, current_app, jsonify, request, Response
+from app.db import query_db
+from app.limites import LimitadorTasa
+from app.recibos import prueba_inclusion
+from app.actas import obtener_acta, documento_publico
+from app.firmas import clave_publica_pem
+
+# Verificación pública de certificados (observadores y auditores, sin login).
+# Recibe un lote de códigos y responde validez, elección y vuelta de cada uno, nunca la
+# identidad del votante. Cada lote es una consulta por el índice único de `codigo` y los
+# datos de las elecciones salen de una cache por worker.
+
+bp = Blueprint('verificacion', __name__, url_prefix='/verificar')
+
+CODIGO = re.compile(r'^[0-9a-f]{64}$')
+LOTE_CONSULTA = 1000
+BYTES_POR_CODIGO = 72  # 64 hex + comillas, coma y algo de espacio (JSON o una línea por código)
+BYTES_EXTRA = 1024
+
+
+def _limitador():
+    return current_app.extensions['limitador_verificacion']
+
+def _elecciones(ids):
+    """{id: {'id', 'titulo', 'cerrada'}} desde la cache; los que faltan, en una sola consulta."""
+    cache = current_app.extensions['eleccion_cache']
+    datos, faltan = {}, []
+    for eid in ids:
+        e = cache.get(eid)
+        if e is None:
+            faltan.append(eid)
+        else:
+            datos[eid] = e
+    if faltan:
+        for row in query_db("SELECT id, titulo, cerrada FROM elecciones WHERE id = ANY(%s)", (faltan,)):
+            e = {'id': row['id'], 'titulo': row['titulo'], 'cerrada': row['cerrada']}
+            cache.set(row['id'], e)
+            datos[row['id']] = e
+    return datos
+
+def verificar_codigos(codigos):
+    """[{'codigo', 'valido', 'eleccion', 'vuelta'}] en el mismo orden que `codigos`."""
+    normalizados = [c.strip().lower() for c in codigos]
+    bien_formados = sorted({c for c in normalizados if CODIGO.match(c)})
+    encontrados = {}
+    for i in range(0, len(bien_formados), LOTE_CONSULTA):
+        for row in query_db("SELECT codigo, election_id, vuelta FROM certificados WHERE codigo = ANY(%s)",
+                            (bien_formados[i:i + LOTE_CONSULTA],)):
+            encontrados[row['codigo']] = (row['election_id'], row['vuelta'])
+
+    elecciones = _elecciones({eid for eid, _v in encontrados.values()})
+    resultados = []
+    for c in normalizados:
+        if c in encontrados:
+            eid, vuelta = encontrados[c]
+            resultados.append({'codigo': c, 'valido': True, 'eleccion': elecciones.get(eid), 'vuelta': vuelta})
+        else:
+            resultados.append({'codigo': c, 'valido': False, 'eleccion': None, 'vuelta': None})
+    return resultados
+
+def _demasiadas_solicitudes(espera):
+    resp = jsonify(error='Demasiadas solicitudes, intenta más tarde')
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(espera)
+    return resp
+
+def _codigos_del_request():
+    if request.method == 'GET':
+        return request.args.getlist('codigo')
+    if request.is_json:
+        datos = request.get_json(silent=True) or {}
+        codigos = datos.get('codigos') if isinstance(datos, dict) else datos
+        return [str(c) for c in codigos] if isinstance(codigos, list) else None
+    # text/plain: un código por línea (no requiere preflight CORS)
+    return [l for l in request.get_data(as_text=True).splitlines() if l.strip()]
+
+@bp.route('/api', methods=('GET', 'POST'))
+def api():
+    """Verifica hasta VERIFICACION_MAX_CODIGOS códigos: ?codigo=... o POST JSON {"codigos": [...]}."""
+    # La ficha base se cobra antes de leer el cuerpo: un cuerpo rechazado también cuenta
+    espera = _limitador().consumir(request.remote_addr)
+    if espera:
+        return _demasiadas_solicitudes(espera)
+    maximo = current_app.config['VERIFICACION_MAX_CODIGOS']
+    if request.method == 'POST' and (request.content_length is None
+                                     or request.content_length > maximo * BYTES_POR_CODIGO + BYTES_EXTRA):
+        return jsonify(error=f'Máximo {maximo} códigos por solicitud'), 413
+
+    codigos = _codigos_del_request()
+    if codigos is None:
+        return jsonify(error='Se espera {"codigos": [...]}'), 400
+    if len(codigos) > maximo:
+        return jsonify(error=f'Máximo {maximo} códigos por solicitud'), 413
+
+    # Un lote grande gasta más fichas que una consulta suelta
+    extra = len(codigos) // LOTE_CONSULTA
+    espera = _limitador().consumir(request.remote_addr, costo=extra) if extra else 0
+    if espera:
+        return _demasiadas_solicitudes(espera)
+
+    resultados = verificar_codigos(codigos)
+    resp = jsonify(total=len(resultados), validos=sum(1 for r in resultados if r['valido']),
+                   resultados=resultados)
+    resp.headers['Access-Control-Allow-Origin'] = '*'
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+@bp.route('/recibo/<codigo>')
+def recibo(codigo):
+    """Prueba de inclusión del certificado en el registro de recibos (O(log n) hashes)."""
+    codigo = codigo.strip().lower()
+    if not CODIGO.match(codigo):
+        return jsonify(error='Código mal formado'), 400
+    espera = _limitador().consumir(request.remote_addr)
+    if espera:
+        return _demasiadas_solicitudes(espera)
+
+    prueba = prueba_inclusion(codigo)
+    if prueba is None:
+        return jsonify(error='Certificado no encontrado en el registro'), 404
+    resp = jsonify(prueba)
+    resp.headers['Access-Control-Allow-Origin'] = '*'
+    # Contra una raíz firmada la prueba ya no cambia; con la vuelta abierta crece con cada voto
+    resp.headers['Cache-Control'] = 'public, max-age=86400' if prueba['firma'] else 'no-store'
+    return resp
+
+@bp.route('/acta/<int:election_id>/<int:vuelta>')
+def acta(election_id, vuelta):
+    """Acta de resultados firmada: `contenido` es el texto exacto cuyo SHA-256 firma `firma`."""
+    espera = _limitador().consumir(request.remote_addr)
+    if espera:
+        return _demasiadas_solicitudes(espera)
+    acta = obtener_acta(election_id, vuelta)
+    if not acta or not acta['datos']:
+        return jsonify(error='No hay acta firmada para esa elección y vuelta'), 404
+    resp = jsonify(documento_publico(acta))
+    resp.headers['Access-Control-Allow-Origin'] = '*'
+    resp.headers['Cache-Control'] = 'public, max-age=86400'  # Firmada no cambia
+    return resp
+
+@bp.route('/clave-publica')
+def clave_publica():
+    """Clave pública Ed25519 (PEM) con la que se verifican las raíces y actas firmadas."""
+    resp = Response(clave_publica_pem(), mimetype='application/x-pem-file')
+    resp.headers['Access-Control-Allow-Origin'] = '*'
+    return resp
+
+def init_verificacion(app):
+    # Un lote máximo cuesta la ficha base más una por cada LOTE_CONSULTA códigos, y el cubo nunca
+    # tiene más de VERIFICACION_RAFAGA: si no alcanza, ese lote recibiría 429 para siempre
+    costo_maximo = 1 + app.config['VERIFICACION_MAX_CODIGOS'] // LOTE_CONSULTA
+    if costo_maximo > app.config['VERIFICACION_RAFAGA']:
+        raise ValueError(f"VERIFICACION_RAFAGA debe ser al menos {costo_maximo} para lotes de "
+                         f"VERIFICACION_MAX_CODIGOS={app.config['VERIFICACION_MAX_CODIGOS']} códigos")
+    app.extensions['limitador_verificacion'] = LimitadorTasa(
+        por_minuto=app.config['VERIFICACION_POR_MINUTO'],
+        rafaga=app.config['VERIFICACION_RAFAGA'])
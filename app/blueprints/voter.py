@@ -2,13 +2,23 @@ import hashlib
 import json
 import datetime
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, flash, g, redirect, render_template, request, url_for, make_response
 )
 from app.db import get_db, query_db, execute_db
 from app.blueprints.auth import login_required
+from app.estado_votante import resolver_estado, estado_eleccion
+from app.boletas import obtener_boleta
+from app.respuestas import etag_de, no_modificado, validadores
 
 bp = Blueprint('voter', __name__, url_prefix='/votar')
 
+def _version_usuario():
+    """Lo que base.html muestra del usuario (nombre, aviso de pendientes) también versiona la página."""
+    user = g.user
+    pendientes = user['rol'] == 'VOTANTE' and any(e['elegible'] and not e['ya_voto']
+                                                  for e in resolver_estado(user['id']))
+    return user['id'], user['nombres'], user['apellidos'], pendientes
+
 @bp.route('/')
 @login_required
 def votar():
@@ -16,40 +26,20 @@ def votar():
     if user['rol'] != 'VOTANTE':
         return redirect(url_for('admin.dashboard'))
     
-    # Buscar elecciones activas
-    elecciones = query_db("SELECT * FROM elecciones WHERE activa = TRUE")
+    # Elegibilidad, voto y certificado de todas las elecciones activas en un solo round-trip
+    estados = resolver_estado(user['id'])
     
-    if not elecciones:
+    if not estados:
         return render_template('voter/no_elecciones.html')
     
-    # Filtrar por elegibilidad del votante
-    elegibles = []
-    for e in elecciones:
-        if e['todos_habilitados']:
-            elegibles.append(e)
-        else:
-            hab = query_db(
-                "SELECT votante_id FROM eleccion_votantes WHERE election_id=%s AND votante_id=%s",
-                (e['id'], user['id']), one=True)
-            if hab:
-                elegibles.append(e)
-    
+    elegibles = [e for e in estados if e['elegible']]
     if not elegibles:
         return render_template('voter/no_elecciones.html')
     
     # Clasificar: pendientes vs ya votadas
-    pendientes = []
-    votadas = []
-    for e in elegibles:
-        ya_voto = query_db(
-            "SELECT id FROM votos WHERE election_id=%s AND vuelta=%s AND votante_id=%s LIMIT 1",
-            (e['id'], e['vuelta_actual'], user['id']), one=True)
-        if ya_voto:
-            cert = query_db("SELECT * FROM certificados WHERE election_id=%s AND vuelta=%s AND votante_id=%s",
-                            (e['id'], e['vuelta_actual'], user['id']), one=True)
-            votadas.append({'eleccion': e, 'certificado': cert})
-        else:
-            pendientes.append(e)
+    pendientes = [e['eleccion'] for e in elegibles if not e['ya_voto']]
+    votadas = [{'eleccion': e['eleccion'], 'certificado': e['certificado']}
+               for e in elegibles if e['ya_voto']]
     
     # Si solo hay 1 pendiente, ir directo a la boleta
     if len(pendientes) == 1 and not votadas:
@@ -66,78 +56,105 @@ def votar_eleccion(election_id):
     if user['rol'] != 'VOTANTE':
         return redirect(url_for('admin.dashboard'))
     
-    selected_election = query_db("SELECT * FROM elecciones WHERE id=%s AND activa=TRUE", (election_id,), one=True)
-    if not selected_election:
+    estado = estado_eleccion(user['id'], election_id)
+    if not estado:
         flash("Elección no disponible.", "error")
         return redirect(url_for('voter.votar'))
     
     # Verificar elegibilidad
-    if not selected_election['todos_habilitados']:
-        habilitado = query_db(
-            "SELECT votante_id FROM eleccion_votantes WHERE election_id=%s AND votante_id=%s",
-            (election_id, user['id']), one=True)
-        if not habilitado:
-            flash("No estás habilitado para esta elección.", "error")
-            return redirect(url_for('voter.votar'))
+    if not estado['elegible']:
+        flash("No estás habilitado para esta elección.", "error")
+        return redirect(url_for('voter.votar'))
     
-    eid = selected_election['id']
-    vuelta = selected_election['vuelta_actual']
+    selected_election = estado['eleccion']
     
     # Verificar si ya votó
-    ya_voto = query_db("SELECT id FROM votos WHERE election_id=%s AND vuelta=%s AND votante_id=%s LIMIT 1", 
-                       (eid, vuelta, user['id']), one=True)
-    
-    if ya_voto:
-        cert = query_db("SELECT * FROM certificados WHERE election_id=%s AND vuelta=%s AND votante_id=%s",
-                        (eid, vuelta, user['id']), one=True)
-        return render_template('voter/ya_voto.html', certificado=cert)
-    
-    # Obtener cargos y candidatos
-    cargos = query_db("""
-        SELECT c.* FROM cargos c 
-        JOIN eleccion_cargos ec ON c.id = ec.cargo_id 
-        WHERE ec.election_id = %s
-    """, (eid,))
-    
-    datos_boleta = []
-    for cargo in cargos:
-        if vuelta == 1:
-            candidatos = query_db("SELECT * FROM candidatos WHERE election_id=%s AND cargo_id=%s AND estado='ACTIVO'", (eid, cargo['id']))
-        else:
-            candidatos = query_db("""
-                SELECT c.* FROM candidatos c
-                JOIN candidatos_vuelta cv ON c.id = cv.original_candidato_id
-                WHERE cv.election_id=%s AND cv.cargo_id=%s AND cv.vuelta=2
-            """, (eid, cargo['id']))
-            
-        datos_boleta.append({
-            'cargo': cargo,
-            'candidatos': candidatos
-        })
-        
-    return render_template('voter/boleta.html', eleccion=selected_election, boleta=datos_boleta)
+    if estado['ya_voto']:
+        return render_template('voter/ya_voto.html', certificado=estado['certificado'])
+    
+    # La boleta no cambia mientras no cambie (elección, vuelta, boleta_version): 304 sin armarla
+    etag = etag_de('boleta', election_id, selected_election['vuelta_actual'],
+                   selected_election['boleta_version'], *_version_usuario())
+    resp = no_modificado(etag)
+    if resp:
+        return resp
+    
+    # Boleta precompilada: sin consultas por cargo
+    datos_boleta = obtener_boleta(selected_election)
+    
+    resp = make_response(render_template('voter/boleta.html', eleccion=selected_election, boleta=datos_boleta))
+    return validadores(resp, etag)
+
+# Voto completo en un solo round-trip: elegibilidad, votos, conteos, certificado (y su hoja en el
+# registro de recibos), auditoría y NOTIFY.
+# El doble voto se detecta por el UNIQUE de votos (ON CONFLICT DO NOTHING), no con un SELECT previo.
+VOTO_SQL = """
+    WITH e AS (
+        SELECT e.id FROM elecciones e
+        WHERE e.id = %(eid)s AND e.activa AND NOT e.cerrada AND e.vuelta_actual = %(vuelta)s
+          AND (e.todos_habilitados OR EXISTS (
+                SELECT 1 FROM eleccion_votantes ev WHERE ev.election_id = e.id AND ev.votante_id = %(uid)s))
+    ), sel (cargo_id, candidato_id) AS (
+        VALUES {valores}
+    ), validos AS (
+        SELECT sel.cargo_id, sel.candidato_id
+        FROM e
+        JOIN eleccion_cargos ec ON ec.election_id = e.id
+        JOIN sel ON sel.cargo_id = ec.cargo_id
+        JOIN candidatos cand ON cand.id = sel.candidato_id AND cand.election_id = e.id AND cand.cargo_id = sel.cargo_id
+        WHERE (%(vuelta)s = 1 AND cand.estado = 'ACTIVO')
+           OR EXISTS (SELECT 1 FROM candidatos_vuelta cv
+                      WHERE cv.original_candidato_id = cand.id AND cv.vuelta = %(vuelta)s)
+    ), v AS (
+        INSERT INTO votos (election_id, cargo_id, candidato_id, votante_id, vuelta)
+        SELECT %(eid)s, cargo_id, candidato_id, %(uid)s, %(vuelta)s FROM validos
+        ON CONFLICT (election_id, cargo_id, vuelta, votante_id) DO NOTHING
+        RETURNING cargo_id, candidato_id
+    ), t AS (
+        INSERT INTO conteos (election_id, vuelta, cargo_id, candidato_id, votos)
+        SELECT %(eid)s, %(vuelta)s, cargo_id, candidato_id, 1 FROM v
+        ORDER BY cargo_id, candidato_id
+        ON CONFLICT (election_id, vuelta, cargo_id, candidato_id) DO UPDATE SET votos = conteos.votos + 1
+    ), completo AS (
+        -- Solo una boleta que se registró entera emite certificado: un voto duplicado o
+        -- incompleto no debe tomar el lock de recibos_log (lo liberaría recién el rollback)
+        SELECT e.id FROM e
+        WHERE (SELECT COUNT(*) FROM v) = (SELECT COUNT(*) FROM sel)
+          AND (SELECT COUNT(*) FROM v) = (SELECT COUNT(*) FROM eleccion_cargos ec WHERE ec.election_id = e.id)
+    ), c AS (
+        -- El certificado entra como hoja del registro de recibos (app/recibos.py)
+        INSERT INTO certificados (codigo, election_id, votante_id, vuelta, contenido_hash, hoja)
+        SELECT %(codigo)s, id, %(uid)s, %(vuelta)s, %(raw)s, recibos_agregar(id, %(vuelta)s, %(codigo)s) FROM completo
+    ), a AS (
+        INSERT INTO auditoria (evento, detalle, usuario_id, ip_origen)
+        SELECT 'VOTO_EMITIDO', 'Voto completo eleccion ' || id, %(uid)s, %(ip)s FROM completo
+    )
+    SELECT (SELECT COUNT(*) FROM e) AS habilitado,
+           (SELECT COUNT(*) FROM eleccion_cargos WHERE election_id = %(eid)s) AS cargos,
+           (SELECT COUNT(*) FROM validos) AS validos,
+           (SELECT COUNT(*) FROM v) AS insertados,
+           -- NOTIFY transaccional: solo llega a los listeners si el voto hace commit
+           (SELECT COUNT(pg_notify('votos_emitidos', json_build_object(
+                'e', id, 'v', %(vuelta)s,
+                'sel', (SELECT json_agg(json_build_array(cargo_id, candidato_id)) FROM v))::text))
+            FROM e) AS notificado
+"""
 
 @bp.route('/confirmar', methods=['POST'])
 @login_required
 def confirmar_voto():
     user = g.user
-    eid = request.form['election_id']
-    vuelta = request.form['vuelta']
-    
-    # Validaciones server-side rápidas
-    cargos_ids = request.form.getlist('cargo_ids') # IDs de cargos que SE DEBEN votar
     
     # Iniciar Transacción manual
     db = get_db()
     cur = db.cursor()
     
     try:
-        # Verificar doble voto again (bloqueo)
-        cur.execute("SELECT id FROM votos WHERE election_id=%s AND vuelta=%s AND votante_id=%s LIMIT 1",
-                    (eid, vuelta, user['id']))
-        if cur.fetchone():
-            raise Exception("Ya has votado en esta elección.")
-
+        eid = int(request.form['election_id'])
+        vuelta = int(request.form['vuelta'])
+        
+        # Validaciones server-side rápidas
+        cargos_ids = request.form.getlist('cargo_ids') # IDs de cargos que SE DEBEN votar
         selections = []
         for cid in cargos_ids:
             field_name = f"candidato_{cid}"
@@ -145,30 +162,28 @@ def confirmar_voto():
             if not candidate_selected:
                 raise Exception(f"Falta seleccionar candidato para el cargo ID {cid}")
             
-            selections.append((eid, cid, candidate_selected, user['id'], vuelta))
+            selections.append((int(cid), int(candidate_selected)))
+        if not selections:
+            raise Exception("La boleta está vacía.")
         
-        # Insertar votos
-        for sel in selections:
-            cur.execute("""
-                INSERT INTO votos (election_id, cargo_id, candidato_id, votante_id, vuelta)
-                VALUES (%s, %s, %s, %s, %s)
-            """, sel)
-            
         # Generar Certificado
         # Hash simple de datos
         raw_data = f"{eid}-{vuelta}-{user['id']}-{datetime.datetime.now().isoformat()}"
         cert_code = hashlib.sha256(raw_data.encode()).hexdigest()
         
-        cur.execute("""
-            INSERT INTO certificados (codigo, election_id, votante_id, vuelta, contenido_hash)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (cert_code, eid, user['id'], vuelta, raw_data))
+        valores = ', '.join(cur.mogrify("(%s::int, %s::int)", sel).decode() for sel in selections)
+        cur.execute(VOTO_SQL.format(valores=valores),
+                    {'eid': eid, 'vuelta': vuelta, 'uid': user['id'], 'codigo': cert_code,
+                     'raw': raw_data, 'ip': request.remote_addr})
+        habilitado, total_cargos, validos, insertados, _ = cur.fetchone()
         
-        # Auditoria
-        cur.execute("""
-            INSERT INTO auditoria (evento, detalle, usuario_id, ip_origen)
-            VALUES (%s, %s, %s, %s)
-        """, ('VOTO_EMITIDO', f'Voto completo eleccion {eid}', user['id'], request.remote_addr))
+        if not habilitado:
+            raise Exception("Elección no disponible o no estás habilitado.")
+        if validos != len(selections) or validos != total_cargos:
+            raise Exception("La boleta no coincide con los cargos y candidatos de la elección.")
+        if insertados != validos:
+            # El UNIQUE(election_id, cargo_id, vuelta, votante_id) rechazó al menos un voto
+            raise Exception("Ya has votado en esta elección.")
         
         db.commit()
         return redirect(url_for('voter.certificado', codigo=cert_code))
@@ -183,6 +198,12 @@ def confirmar_voto():
 @bp.route('/certificado/<codigo>')
 @login_required
 def certificado(codigo):
+    # Un certificado emitido no cambia: el código basta como versión de los datos
+    etag = etag_de('certificado', codigo, *_version_usuario())
+    resp = no_modificado(etag)
+    if resp:
+        return resp
+    
     cert = query_db("SELECT * FROM certificados WHERE codigo=%s", (codigo,), one=True)
     if not cert:
         return "Certificado no encontrado", 404
@@ -190,4 +211,5 @@ def certificado(codigo):
     usuario = query_db("SELECT * FROM usuarios WHERE id=%s", (cert['votante_id'],), one=True)
     eleccion = query_db("SELECT * FROM elecciones WHERE id=%s", (cert['election_id'],), one=True)
     
-    return render_template('voter/certificado.html', certificado=cert, usuario=usuario, eleccion=eleccion)
+    resp = make_response(render_template('voter/certificado.html', certificado=cert, usuario=usuario, eleccion=eleccion))
+    return validadores(resp, etag, cert['fecha_emision'])
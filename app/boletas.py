@@ -0,0 +1,125 @@
+import psycopg2.extras
+from flask import current_app
+from app.db import get_db, query_db
+
+# Boletas precompiladas por (elección, vuelta).
+# La boleta no puede cambiar mientras la elección está activa, así que se construye una vez
+# (al activar o al generar la segunda vuelta), se guarda en la tabla `boletas` para que la
+# compartan todos los workers y cada worker la mantiene en memoria bajo la clave
+# (election_id, vuelta, boleta_version). `boleta_version` viaja en la fila de `elecciones`,
+# por lo que un hit no cuesta ninguna consulta.
+
+_CARGOS_CANDIDATOS = {
+    1: """
+        SELECT c.id AS cargo_id, c.nombre AS cargo_nombre, c.descripcion AS cargo_descripcion,
+               cand.id, cand.nombres, cand.partido, cand.genero, cand.foto_url
+        FROM eleccion_cargos ec
+        JOIN cargos c ON c.id = ec.cargo_id
+        LEFT JOIN candidatos cand
+               ON cand.election_id = ec.election_id AND cand.cargo_id = c.id AND cand.estado = 'ACTIVO'
+        WHERE ec.election_id = %s
+        ORDER BY c.id, cand.id
+    """,
+    2: """
+        SELECT c.id AS cargo_id, c.nombre AS cargo_nombre, c.descripcion AS cargo_descripcion,
+               cand.id, cand.nombres, cand.partido, cand.genero, cand.foto_url
+        FROM eleccion_cargos ec
+        JOIN cargos c ON c.id = ec.cargo_id
+        LEFT JOIN (candidatos_vuelta cv JOIN candidatos cand ON cand.id = cv.original_candidato_id)
+               ON cv.election_id = ec.election_id AND cv.cargo_id = c.id AND cv.vuelta = 2
+        WHERE ec.election_id = %s
+        ORDER BY c.id, cand.id
+    """,
+}
+
+def boleta_cache():
+    return current_app.extensions['boleta_cache']
+
+def construir_boleta(election_id, vuelta):
+    """Arma la boleta [{'cargo', 'candidatos'}] con una sola consulta."""
+    boleta = []
+    por_cargo = {}
+    for row in query_db(_CARGOS_CANDIDATOS[2 if vuelta > 1 else 1], (election_id,)):
+        item = por_cargo.get(row['cargo_id'])
+        if item is None:
+            item = {'cargo': {'id': row['cargo_id'], 'nombre': row['cargo_nombre'],
+                              'descripcion': row['cargo_descripcion']},
+                    'candidatos': []}
+            por_cargo[row['cargo_id']] = item
+            boleta.append(item)
+        if row['id'] is not None:
+            item['candidatos'].append({'id': row['id'], 'nombres': row['nombres'], 'partido': row['partido'],
+                                       'genero': row['genero'], 'foto_url': row['foto_url']})
+    return boleta
+
+def _guardar(cur, election_id, vuelta, version, boleta):
+    cur.execute("""
+        INSERT INTO boletas (election_id, vuelta, version, contenido)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (election_id, vuelta)
+        DO UPDATE SET version = EXCLUDED.version, contenido = EXCLUDED.contenido, generada_en = CURRENT_TIMESTAMP
+        WHERE boletas.version <= EXCLUDED.version
+    """, (election_id, vuelta, version, psycopg2.extras.Json(boleta)))
+
+def publicar_boleta(election_id, vuelta, commit=True):
+    """Construye la boleta, la guarda con una versión nueva y la deja caliente en este worker."""
+    boleta = construir_boleta(election_id, vuelta)
+    db = get_db()
+    cur = db.cursor()
+    try:
+        cur.execute("UPDATE elecciones SET boleta_version = boleta_version + 1 WHERE id = %s RETURNING boleta_version",
+                    (election_id,))
+        version = cur.fetchone()[0]
+        _guardar(cur, election_id, vuelta, version, boleta)
+        if commit:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+    boleta_cache().set((election_id, vuelta, version), boleta)
+    return boleta
+
+def invalidar_boleta(election_id):
+    """Descarta las boletas guardadas de la elección; la próxima activación las reconstruye."""
+    db = get_db()
+    cur = db.cursor()
+    try:
+        cur.execute("DELETE FROM boletas WHERE election_id = %s", (election_id,))
+        cur.execute("UPDATE elecciones SET boleta_version = boleta_version + 1 WHERE id = %s", (election_id,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+
+def obtener_boleta(eleccion):
+    """Boleta de la vuelta actual: memoria del worker, luego tabla `boletas`, y solo si falta se construye."""
+    eid, vuelta, version = eleccion['id'], eleccion['vuelta_actual'], eleccion['boleta_version']
+    clave = (eid, vuelta, version)
+    cache = boleta_cache()
+    boleta = cache.get(clave)
+    if boleta is not None:
+        return boleta
+
+    row = query_db("SELECT contenido FROM boletas WHERE election_id=%s AND vuelta=%s AND version=%s",
+                   (eid, vuelta, version), one=True)
+    if row:
+        boleta = row['contenido']
+    else:
+        # Elección activada antes de existir la boleta precompilada: se guarda con la versión actual
+        boleta = construir_boleta(eid, vuelta)
+        db = get_db()
+        cur = db.cursor()
+        try:
+            _guardar(cur, eid, vuelta, version, boleta)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cur.close()
+    cache.set(clave, boleta)
+    return boleta
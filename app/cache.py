@@ -0,0 +1,59 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Cache en memoria del proceso, acotada (LRU) y con expiración por TTL."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave, default=None):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return item[1]
+
+    def set(self, clave, valor, ttl=None):
+        expira_en = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._datos[clave] = (expira_en, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'tamano': len(self._datos),
+                    'max': self.maxsize, 'ratio': round(self.hits / total, 3) if total else 0.0}
+
+
+def init_caches(app):
+    """Crea las caches por worker según la configuración de la app."""
+    app.extensions['user_cache'] = LRUCache(maxsize=app.config['USER_CACHE_SIZE'],
+                                            ttl=app.config['USER_CACHE_TTL'])
+    # Las boletas son inmutables por versión: el TTL solo acota la memoria de elecciones viejas
+    app.extensions['boleta_cache'] = LRUCache(maxsize=app.config['BOLETA_CACHE_SIZE'], ttl=3600)
+    # Metadatos de elecciones para la verificación pública de certificados
+    app.extensions['eleccion_cache'] = LRUCache(maxsize=256, ttl=app.config['ELECCION_CACHE_TTL'])
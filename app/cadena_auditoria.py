@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import click
+import psycopg2
+import psycopg2.extras
+from flask import current_app
+from app.db import get_db, DictCursorContado
+from app.firmas import firmar, verificar_firma
+
+# Cadena de hashes sobre `auditoria`.
+# Los eventos se insertan como siempre (escritor por lotes, sync, o dentro de VOTO_SQL) y un
+# hilo por worker los "sella" cada AUDIT_SELLO_INTERVALO segundos: en orden de id les asigna
+# una posición consecutiva y hash = SHA-256(hash anterior || posición || contenido). Así el voto
+# no espera a la cadena y solo un sellador a la vez (advisory lock) extiende la cabeza guardada
+# en `auditoria_cadena`. Cada AUDIT_CHECKPOINT_EVENTOS eventos (o AUDIT_CHECKPOINT_INTERVALO
+# segundos) se firma un checkpoint (posición, hash).
+#
+# La verificación parte del último checkpoint ya verificado y recorre en streaming solo los
+# eventos posteriores: un evento editado cambia su hash y uno borrado deja un hueco en las
+# posiciones. `--completa` vuelve a recorrer desde el primer evento.
+
+GENESIS = bytes(32)
+FILAS_POR_FETCH = 2000
+_LOCK_ID = 7340025  # pg_try_advisory_xact_lock del sellado
+
+
+def contenido(posicion, evento_id, evento, detalle, usuario_id, ip_origen, fecha_evento):
+    """Representación canónica de un evento para la cadena."""
+    fecha = fecha_evento.isoformat() if fecha_evento else None
+    return json.dumps([posicion, evento_id, evento, detalle, usuario_id, ip_origen, fecha],
+                      ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def encadenar(anterior, posicion, *evento):
+    return hashlib.sha256(anterior + contenido(posicion, *evento)).digest()
+
+def mensaje_checkpoint(posicion, hash_):
+    return f"auditoria|{posicion}|{hash_.hex()}".encode('ascii')
+
+
+def _crear_checkpoint(cur, posicion, hash_):
+    cur.execute("""
+        INSERT INTO auditoria_checkpoints (posicion, hash, firma) VALUES (%s, %s, %s)
+        ON CONFLICT (posicion) DO NOTHING
+    """, (posicion, psycopg2.Binary(hash_), firmar(mensaje_checkpoint(posicion, hash_))))
+
+def sellar(lote=5000, checkpoint_eventos=10000, checkpoint_intervalo=3600):
+    """Sella los eventos pendientes en lotes. Devuelve cuántos selló (0 si otro worker está sellando)."""
+    db = get_db()
+    cur = db.cursor(cursor_factory=DictCursorContado)
+    total = 0
+    try:
+        while True:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS libre", (_LOCK_ID,))
+            if not cur.fetchone()['libre']:
+                db.rollback()
+                return total
+            cur.execute("INSERT INTO auditoria_cadena (posicion, hash) VALUES (0, %s) ON CONFLICT DO NOTHING",
+                        (psycopg2.Binary(GENESIS),))
+            cur.execute("SELECT posicion, hash FROM auditoria_cadena FOR UPDATE")
+            cabeza = cur.fetchone()
+            posicion, anterior = cabeza['posicion'], bytes(cabeza['hash'])
+
+            cur.execute("""
+                SELECT id, evento, detalle, usuario_id, ip_origen, fecha_evento FROM auditoria
+                WHERE hash IS NULL ORDER BY id LIMIT %s
+            """, (lote,))
+            sellos = []
+            for ev in cur.fetchall():
+                posicion += 1
+                anterior = encadenar(anterior, posicion, ev['id'], ev['evento'], ev['detalle'],
+                                     ev['usuario_id'], ev['ip_origen'], ev['fecha_evento'])
+                sellos.append((ev['id'], ev['fecha_evento'], posicion, psycopg2.Binary(anterior)))
+            if sellos:
+                psycopg2.extras.execute_values(cur, """
+                    UPDATE auditoria a SET cadena_pos = s.pos, hash = s.hash
+                    FROM (VALUES %s) AS s (id, fecha, pos, hash)
+                    WHERE a.id = s.id AND a.fecha_evento IS NOT DISTINCT FROM s.fecha
+                """, sellos, template="(%s, %s::timestamp, %s::bigint, %s::bytea)", page_size=len(sellos))
+                cur.execute("UPDATE auditoria_cadena SET posicion = %s, hash = %s, sellada_en = LOCALTIMESTAMP",
+                            (posicion, psycopg2.Binary(anterior)))
+
+            # Checkpoint cada N eventos o cada intervalo, si hubo eventos nuevos
+            cur.execute("""
+                SELECT COALESCE(MAX(posicion), 0) AS posicion,
+                       EXTRACT(EPOCH FROM LOCALTIMESTAMP - MAX(creado_en)) AS edad
+                FROM auditoria_checkpoints
+            """)
+            ultimo = cur.fetchone()
+            if posicion > ultimo['posicion'] and (posicion - ultimo['posicion'] >= checkpoint_eventos
+                                                  or ultimo['edad'] is None or ultimo['edad'] >= checkpoint_intervalo):
+                _crear_checkpoint(cur, posicion, anterior)
+            db.commit()
+            total += len(sellos)
+            if len(sellos) < lote:
+                return total
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def verificar_cadena(completa=False):
+    """Recorre la cadena desde el último checkpoint verificado (o desde el inicio) hasta la cabeza.
+
+    Marca como verificados los checkpoints que pasa y guarda el resultado en `auditoria_cadena`.
+    Devuelve {'desde', 'hasta', 'eventos', 'checkpoints', 'falla'}.
+    """
+    db = get_db()
+    cur = db.cursor(cursor_factory=DictCursorContado)
+    try:
+        cur.execute("SELECT posicion, hash FROM auditoria_cadena")
+        cabeza = cur.fetchone()
+        if cabeza is None:
+            db.rollback()
+            return {'desde': 0, 'hasta': 0, 'eventos': 0, 'checkpoints': 0, 'falla': None}
+        desde, anterior = 0, GENESIS
+        if not completa:
+            cur.execute("""
+                SELECT posicion, hash, firma FROM auditoria_checkpoints
+                WHERE verificado_en IS NOT NULL ORDER BY posicion DESC LIMIT 1
+            """)
+            punto = cur.fetchone()
+            # Con una firma inválida no se parte de él: se recorre desde el inicio y falla al llegar
+            if punto and verificar_firma(mensaje_checkpoint(punto['posicion'], bytes(punto['hash'])), punto['firma']):
+                desde, anterior = punto['posicion'], bytes(punto['hash'])
+        cur.execute("SELECT posicion, hash, firma FROM auditoria_checkpoints WHERE posicion > %s AND posicion <= %s",
+                    (desde, cabeza['posicion']))
+        checkpoints = {r['posicion']: r for r in cur.fetchall()}
+    finally:
+        cur.close()
+
+    falla, esperada, verificados = None, desde + 1, []
+    partida = desde == 0  # Desde un checkpoint, su evento debe seguir ahí y sin cambios
+    eventos = db.cursor(name='verificar_auditoria')
+    eventos.itersize = FILAS_POR_FETCH
+    try:
+        eventos.execute("""
+            SELECT cadena_pos, hash, id, evento, detalle, usuario_id, ip_origen, fecha_evento FROM auditoria
+            WHERE cadena_pos >= %s AND cadena_pos <= %s ORDER BY cadena_pos
+        """, (desde, cabeza['posicion']))
+        for row in eventos:
+            posicion, guardado = row[0], bytes(row[1])
+            if not partida:
+                if posicion != desde or guardado != anterior:
+                    falla = f"El evento #{desde} ya no coincide con su checkpoint."
+                    break
+                partida = True
+                continue
+            if posicion != esperada:
+                falla = f"Falta el evento #{esperada} de la cadena (sigue el #{posicion})."
+                break
+            anterior = encadenar(anterior, posicion, *row[2:])
+            if anterior != guardado:
+                falla = f"El evento #{posicion} (id {row[2]}) fue modificado."
+                break
+            cp = checkpoints.get(posicion)
+            if cp is not None:
+                if bytes(cp['hash']) != anterior or not verificar_firma(mensaje_checkpoint(posicion, anterior), cp['firma']):
+                    falla = f"El checkpoint #{posicion} no coincide con la cadena o su firma no es válida."
+                    break
+                verificados.append(posicion)
+            esperada += 1
+    finally:
+        eventos.close()
+        db.rollback()
+
+    if falla is None and not partida:
+        falla = f"El evento #{desde} ya no coincide con su checkpoint."
+    if falla is None and (esperada - 1 != cabeza['posicion'] or anterior != bytes(cabeza['hash'])):
+        falla = f"La cadena termina en #{esperada - 1} pero la cabeza registra #{cabeza['posicion']}."
+
+    cur = db.cursor()
+    try:
+        if verificados:
+            cur.execute("UPDATE auditoria_checkpoints SET verificado_en = LOCALTIMESTAMP WHERE posicion = ANY(%s)",
+                        (verificados,))
+        cur.execute("UPDATE auditoria_cadena SET verificada_hasta = %s, verificada_en = LOCALTIMESTAMP, falla = %s",
+                    (esperada - 1, falla))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+    return {'desde': desde, 'hasta': esperada - 1, 'eventos': esperada - 1 - desde,
+            'checkpoints': len(verificados), 'falla': falla}
+
+def estado_cadena(cur):
+    """Resumen para el dashboard: cabeza, pendientes de sellar, último checkpoint y última verificación."""
+    cur.execute("""
+        SELECT c.posicion, c.sellada_en, c.verificada_hasta, c.verificada_en, c.falla,
+               (SELECT COUNT(*) FROM auditoria WHERE hash IS NULL) AS sin_sellar,
+               (SELECT MAX(posicion) FROM auditoria_checkpoints) AS checkpoint
+        FROM auditoria_cadena c
+    """)
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {k: (str(v) if hasattr(v, 'isoformat') else v) for k, v in row.items()}
+
+
+class SelladorAuditoria:
+    """Hilo por worker que sella los eventos nuevos y verifica lo agregado; el advisory lock deja sellar a uno solo."""
+
+    def __init__(self, app, intervalo):
+        self.app = app
+        self.intervalo = intervalo
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {'sellados': 0, 'errores': 0}
+
+    def asegurar_hilo(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name='auditoria-sellado', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def _run(self):
+        config = self.app.config
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                with self.app.app_context():
+                    sellados = sellar(checkpoint_eventos=config['AUDIT_CHECKPOINT_EVENTOS'],
+                                      checkpoint_intervalo=config['AUDIT_CHECKPOINT_INTERVALO'])
+                    self.stats['sellados'] += sellados
+                    if sellados:
+                        # Incremental: solo lo posterior al último checkpoint verificado (estado del dashboard)
+                        verificar_cadena()
+            except Exception as e:
+                self.stats['errores'] += 1
+                self.app.logger.warning(f"No se pudo sellar la auditoría: {e}")
+
+
+def init_cadena_auditoria(app):
+    sellador = SelladorAuditoria(app, app.config['AUDIT_SELLO_INTERVALO'])
+    app.extensions['sellador_auditoria'] = sellador
+    # Cualquier request arranca el hilo del worker (los votos no pasan por registrar_evento)
+    app.before_request(sellador.asegurar_hilo)
+
+@click.command('verificar-auditoria')
+@click.option('--completa', is_flag=True, help='Recorrer toda la cadena, no solo desde el último checkpoint verificado.')
+def verificar_auditoria_command(completa):
+    """Sella los eventos pendientes y verifica la cadena de hashes de la auditoría."""
+    config = current_app.config
+    sellados = sellar(checkpoint_eventos=config['AUDIT_CHECKPOINT_EVENTOS'],
+                      checkpoint_intervalo=config['AUDIT_CHECKPOINT_INTERVALO'])
+    if sellados:
+        click.echo(f"  {sellados} eventos sellados.")
+    r = verificar_cadena(completa=completa)
+    click.echo(f"Eventos #{r['desde'] + 1}..#{r['hasta']} recorridos ({r['eventos']}), "
+               f"{r['checkpoints']} checkpoints verificados.")
+    if r['falla']:
+        raise click.ClickException(r['falla'])
+    click.echo("Cadena de auditoría íntegra.")
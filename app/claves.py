@@ -0,0 +1,98 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+import bcrypt
+from flask import current_app
+
+# Verificación de contraseñas fuera del hilo del request.
+# bcrypt.checkpw ocupa la CPU del worker; aquí corre en un pool de procesos acotado con
+# control de admisión: si ya hay BCRYPT_QUEUE verificaciones en curso o la respuesta tarda
+# más de BCRYPT_TIMEOUT, el login responde enseguida "intenta de nuevo" en vez de encolar.
+
+
+class VerificacionSaturada(Exception):
+    """El pool de bcrypt está lleno o no respondió a tiempo."""
+
+
+def costo_hash(hashed):
+    """Factor de costo de un hash bcrypt ('$2b$12$...' -> 12)."""
+    try:
+        return int(hashed.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def _verificar(password, hashed, rounds):
+    """Se ejecuta en un proceso del pool. Devuelve (ok, hash_nuevo_o_None)."""
+    if not bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8')):
+        return False, None
+    if costo_hash(hashed) != rounds:
+        return True, bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+    return True, None
+
+
+class VerificadorClaves:
+    def __init__(self, workers, cola, timeout, rounds):
+        self.workers = workers
+        self.cola = cola
+        self.timeout = timeout
+        self.rounds = rounds
+        self._cupos = threading.BoundedSemaphore(cola)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._en_curso = 0
+        self.stats = {'verificaciones': 0, 'rechazadas': 0, 'timeouts': 0, 'rehashes': 0}
+
+    def _executor(self):
+        # El pool del proceso padre no sirve tras un fork de gunicorn
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _liberar(self, _futuro=None):
+        with self._lock:
+            self._en_curso -= 1
+        self._cupos.release()
+
+    def verificar(self, password, hashed):
+        """(ok, hash_nuevo_o_None). Lanza VerificacionSaturada si no hay capacidad."""
+        if not self._cupos.acquire(blocking=False):
+            self.stats['rechazadas'] += 1
+            raise VerificacionSaturada()
+        with self._lock:
+            self._en_curso += 1
+        try:
+            futuro = self._executor().submit(_verificar, password, hashed, self.rounds)
+        except Exception:
+            self._liberar()
+            raise
+        # El cupo se devuelve cuando el proceso termina, aunque el request ya haya respondido
+        futuro.add_done_callback(self._liberar)
+        self.stats['verificaciones'] += 1
+        try:
+            ok, nuevo = futuro.result(timeout=self.timeout)
+        except FuturesTimeout:
+            futuro.cancel()
+            self.stats['timeouts'] += 1
+            raise VerificacionSaturada()
+        if nuevo:
+            self.stats['rehashes'] += 1
+        return ok, nuevo
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, en_curso=self._en_curso, capacidad=self.cola, workers=self.workers)
+
+
+def init_claves(app):
+    app.extensions['verificador_claves'] = VerificadorClaves(
+        workers=app.config['BCRYPT_WORKERS'],
+        cola=app.config['BCRYPT_QUEUE'],
+        timeout=app.config['BCRYPT_TIMEOUT'],
+        rounds=app.config['BCRYPT_ROUNDS'])
+
+def verificar_clave(password, hashed):
+    return current_app.extensions['verificador_claves'].verificar(password, hashed)
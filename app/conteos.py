@@ -0,0 +1,90 @@
+import click
+from app.db import get_db, query_db
+
+# Conteos mantenidos incrementalmente: (elección, vuelta, cargo, candidato) -> votos.
+# Se actualizan en la misma sentencia que inserta los votos (ver voter.VOTO_SQL), así que
+# resultados y segunda vuelta leen O(candidatos) filas en vez de agregar toda la tabla `votos`.
+
+def resultados_por_cargo(election_id, vuelta):
+    """{nombre_cargo: [candidatos con 'total']} ordenados por votos, en una sola consulta."""
+    rows = query_db("""
+        SELECT c.id AS cargo_id, c.nombre AS cargo, cand.id, cand.nombres, cand.partido, cand.genero,
+               cand.foto_url, COALESCE(t.votos, 0) AS total
+        FROM eleccion_cargos ec
+        JOIN cargos c ON c.id = ec.cargo_id
+        LEFT JOIN candidatos cand ON cand.election_id = ec.election_id AND cand.cargo_id = c.id
+        LEFT JOIN conteos t ON t.election_id = ec.election_id AND t.vuelta = %s
+                           AND t.cargo_id = c.id AND t.candidato_id = cand.id
+        WHERE ec.election_id = %s
+        ORDER BY c.id, total DESC, cand.id
+    """, (vuelta, election_id))
+    resultados = {}
+    for row in rows:
+        candidatos = resultados.setdefault(row['cargo'], [])
+        if row['id'] is not None:
+            candidatos.append(row)
+    return resultados
+
+def reconciliar(election_id=None, corregir=True):
+    """Compara `conteos` con lo que dice `votos` y, si se pide, reconstruye los conteos.
+
+    Devuelve la lista de diferencias [{election_id, vuelta, cargo_id, candidato_id, conteo, en_votos}].
+    """
+    filtro_v = "WHERE election_id = %(eid)s" if election_id is not None else ""
+    filtro_t = "WHERE t.election_id = %(eid)s" if election_id is not None else ""
+    params = {'eid': election_id}
+    drift = query_db(f"""
+        WITH reales AS (
+            SELECT election_id, vuelta, cargo_id, candidato_id, COUNT(*) AS votos
+            FROM votos {filtro_v}
+            GROUP BY election_id, vuelta, cargo_id, candidato_id
+        ), t AS (
+            SELECT * FROM conteos t {filtro_t}
+        )
+        SELECT COALESCE(r.election_id, t.election_id) AS election_id,
+               COALESCE(r.vuelta, t.vuelta) AS vuelta,
+               COALESCE(r.cargo_id, t.cargo_id) AS cargo_id,
+               COALESCE(r.candidato_id, t.candidato_id) AS candidato_id,
+               COALESCE(t.votos, 0) AS conteo, COALESCE(r.votos, 0) AS en_votos
+        FROM reales r
+        FULL OUTER JOIN t USING (election_id, vuelta, cargo_id, candidato_id)
+        WHERE COALESCE(t.votos, 0) <> COALESCE(r.votos, 0)
+        ORDER BY 1, 2, 3, 4
+    """, params)
+
+    if corregir and drift:
+        db = get_db()
+        cur = db.cursor()
+        try:
+            # Bloquea los incrementos concurrentes mientras se reconstruye
+            cur.execute("LOCK TABLE conteos IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute(f"DELETE FROM conteos {filtro_v}", params)
+            cur.execute(f"""
+                INSERT INTO conteos (election_id, vuelta, cargo_id, candidato_id, votos)
+                SELECT election_id, vuelta, cargo_id, candidato_id, COUNT(*)
+                FROM votos {filtro_v}
+                GROUP BY election_id, vuelta, cargo_id, candidato_id
+            """, params)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cur.close()
+    return drift
+
+@click.command('reconciliar-conteos')
+@click.option('--eleccion', 'election_id', type=int, default=None, help='Solo esta elección.')
+@click.option('--solo-reportar', is_flag=True, help='No corregir, solo mostrar diferencias.')
+def reconciliar_conteos_command(election_id, solo_reportar):
+    """Reconstruye los conteos desde la tabla votos e informa cualquier diferencia."""
+    drift = reconciliar(election_id, corregir=not solo_reportar)
+    for d in drift:
+        click.echo(f"  Elección {d['election_id']} vuelta {d['vuelta']} cargo {d['cargo_id']} "
+                   f"candidato {d['candidato_id']}: conteo={d['conteo']} votos={d['en_votos']}")
+    if not drift:
+        click.echo('Conteos consistentes con votos.')
+    elif solo_reportar:
+        click.echo(f'{len(drift)} diferencias encontradas (sin corregir).')
+    else:
+        click.echo(f'{len(drift)} diferencias corregidas.')
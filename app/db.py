@@ -1,34 +1,247 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.extensions
 import os
+import time
+import heapq
+import threading
 import click
 import bcrypt
-from flask import g, current_app
+from flask import g, current_app, has_app_context
+
+
+# --- Conteo y tiempo de consultas por request ---
+# Todas las conexiones del pool usan estos cursores, así que se miden tanto las consultas
+# de query_db/execute_db como las de cursores crudos (p. ej. confirmar_voto). Por request
+# quedan en `g`: db_queries, db_tiempo (segundos) y db_lentas, las LENTAS_POR_REQUEST
+# sentencias más lentas como (segundos, sql). Ver app/metricas.py.
+LENTAS_POR_REQUEST = 5
+MAX_SQL_LENTA = 300
+
+def _registrar_consulta(sql, duracion):
+    if not has_app_context():
+        return
+    g.db_queries = g.get('db_queries', 0) + 1
+    g.db_tiempo = g.get('db_tiempo', 0.0) + duracion
+    lentas = g.get('db_lentas')
+    if lentas is None:
+        lentas = g.db_lentas = []
+    if len(lentas) < LENTAS_POR_REQUEST or duracion > lentas[0][0]:
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        item = (duracion, ' '.join(str(sql).split())[:MAX_SQL_LENTA])
+        if len(lentas) < LENTAS_POR_REQUEST:
+            heapq.heappush(lentas, item)
+        else:
+            heapq.heapreplace(lentas, item)
+
+class _ContadorMixin:
+    def _medir(self, metodo, sql, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, *args)
+        finally:
+            _registrar_consulta(sql, time.perf_counter() - inicio)
+
+    def execute(self, query, vars=None):
+        # Si el request dejó una lista en g.db_sentencias, se guarda cada sentencia con sus
+        # parámetros (la usa scripts/presupuesto_consultas.py para pedir los EXPLAIN)
+        capturadas = g.get('db_sentencias') if has_app_context() else None
+        if capturadas is not None:
+            capturadas.append(self.mogrify(query, vars).decode('utf-8', 'replace'))
+        return self._medir(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._medir(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._medir(super().copy_expert, sql, file, size)
+
+class CursorContado(_ContadorMixin, psycopg2.extensions.cursor):
+    pass
+
+class DictCursorContado(_ContadorMixin, psycopg2.extras.RealDictCursor):
+    pass
+
+
+class PoolAgotado(Exception):
+    """Se agotó el tiempo de espera por una conexión libre del pool."""
+
+
+class PoolDB:
+    """Pool de conexiones thread-safe con espera acotada y health check."""
+
+    def __init__(self, minconn, maxconn, timeout, check_idle, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.conn_kwargs = conn_kwargs
+        self.pid = os.getpid()
+        self._libres = []  # (conexion, momento en que se devolvió)
+        self._en_uso = 0
+        self._cond = threading.Condition()
+        self.stats = {'checkouts': 0, 'esperas': 0, 'timeouts': 0,
+                      'errores': 0, 'creadas': 0, 'descartadas': 0}
+
+    def _conectar(self):
+        conn = psycopg2.connect(**self.conn_kwargs)
+        conn.autocommit = False  # Manejo manual de transacciones
+        self._contar('creadas')
+        return conn
+
+    def warmup(self):
+        """Abre las conexiones mínimas para que los primeros requests no paguen el handshake."""
+        with self._cond:
+            faltan = self.minconn - len(self._libres) - self._en_uso
+        for _ in range(max(faltan, 0)):
+            conn = self._conectar()
+            with self._cond:
+                self._libres.append((conn, time.monotonic()))
+
+    def _sana(self, conn, devuelta_en):
+        """Descarta conexiones rotas; las que llevan mucho tiempo ociosas se prueban con SELECT 1."""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - devuelta_en > self.check_idle:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _contar(self, clave):
+        with self._cond:
+            self.stats[clave] += 1
+
+    def _descartar(self, conn):
+        self._contar('descartadas')
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Entrega una conexión sana; espera como máximo `timeout` segundos si el pool está lleno."""
+        limite = time.monotonic() + self.timeout
+        with self._cond:
+            self.stats['checkouts'] += 1
+            while not self._libres and self._en_uso >= self.maxconn:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolAgotado(f"Sin conexiones libres tras {self.timeout}s")
+                self.stats['esperas'] += 1
+                self._cond.wait(restante)
+            self._en_uso += 1
+            libre = self._libres.pop() if self._libres else None
+
+        try:
+            if libre is not None:
+                conn, devuelta_en = libre
+                if self._sana(conn, devuelta_en):
+                    return conn
+                self._descartar(conn)
+            return self._conectar()
+        except Exception:
+            with self._cond:
+                self.stats['errores'] += 1
+                self._en_uso -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn):
+        """Devuelve la conexión al pool dejando la transacción limpia."""
+        reutilizable = not conn.closed
+        if reutilizable:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                reutilizable = False
+        with self._cond:
+            self._en_uso -= 1
+            if reutilizable and len(self._libres) < self.maxconn:
+                self._libres.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            if not reutilizable:
+                self._contar('errores')
+            self._descartar(conn)
+
+    def snapshot(self):
+        """Contadores y ocupación actual del pool."""
+        with self._cond:
+            return dict(self.stats, libres=len(self._libres), en_uso=self._en_uso,
+                        min=self.minconn, max=self.maxconn)
+
+    def closeall(self):
+        with self._cond:
+            libres, self._libres = self._libres, []
+        for conn, _ in libres:
+            self._descartar(conn)
+
+
+def _crear_pool():
+    return PoolDB(
+        minconn=int(os.getenv('DB_POOL_MIN', 2)),
+        maxconn=int(os.getenv('DB_POOL_MAX', 20)),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        check_idle=float(os.getenv('DB_POOL_CHECK_IDLE', 30)),
+        host=os.getenv('DB_HOST', 'localhost'),
+        database=os.getenv('DB_NAME', 'votacion_db'),
+        user=os.getenv('DB_USER', 'postgres'),
+        password=os.getenv('DB_PASS', 'password'),
+        port=os.getenv('DB_PORT', 5432),
+        sslmode=os.getenv('DB_SSLMODE', 'prefer'),
+        options='-c search_path=votacion,public',
+        cursor_factory=CursorContado
+    )
+
+_pool_lock = threading.Lock()
+
+def get_pool(app=None):
+    """Pool de la app. Se recrea si el proceso fue forkeado (p. ej. workers de gunicorn)."""
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.pid != os.getpid():
+                pool = _crear_pool()
+                app.extensions['db_pool'] = pool
+    return pool
+
+def init_pool(app):
+    """Crea el pool al construir la app y abre las conexiones mínimas."""
+    pool = get_pool(app)
+    try:
+        pool.warmup()
+    except psycopg2.Error as e:
+        # La app debe poder arrancar aunque la DB aún no esté disponible
+        app.logger.warning(f"No se pudo precalentar el pool de DB: {e}")
 
 def get_db():
-    """Conecta a la base de datos y adjunta la conexión al contexto global de Flask."""
+    """Toma una conexión del pool y la adjunta al contexto global de Flask."""
     if 'db' not in g:
         try:
-            g.db = psycopg2.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                database=os.getenv('DB_NAME', 'votacion_db'),
-                user=os.getenv('DB_USER', 'postgres'),
-                password=os.getenv('DB_PASS', 'password'),
-                port=os.getenv('DB_PORT', 5432),
-                sslmode=os.getenv('DB_SSLMODE', 'prefer'),
-                options='-c search_path=votacion,public'
-            )
-            g.db.autocommit = False # Manejo manual de transacciones
+            g.db = get_pool().getconn()
         except Exception as e:
             print(f"Error conectando a DB: {e}")
             raise e
     return g.db
 
 def close_db(e=None):
-    """Cierra la conexión al finalizar el request."""
+    """Devuelve la conexión al pool al finalizar el request."""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        get_pool().putconn(db)
 
 def init_db():
     """Inicializa la DB ejecutando schema.sql y seed.sql"""
@@ -42,6 +255,10 @@ def init_db():
     # Leer seed
     with current_app.open_resource('../db/seed.sql') as f:
         cursor.execute(f.read().decode('utf8'))
+    
+    # schema.sql ya trae el resultado de las migraciones
+    from app.migraciones import marcar_aplicadas
+    marcar_aplicadas(cursor)
         
     db.commit()
     cursor.close()
@@ -102,7 +319,7 @@ def init_db_command():
 def query_db(query, args=(), one=False):
     """Ejecuta una consulta y devuelve resultados como dict."""
     db = get_db()
-    cur = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur = db.cursor(cursor_factory=DictCursorContado)
     cur.execute(query, args)
     rv = cur.fetchall()
     cur.close()
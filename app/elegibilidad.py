@@ -0,0 +1,133 @@
+import io
+import csv
+from app.db import get_db
+
+# Listas de elegibilidad por elección (eleccion_votantes / eleccion_cargos).
+# En vez de borrar la lista y reinsertarla fila por fila con un commit cada una, se calcula
+# la diferencia contra lo que ya está guardado y se aplica en una sola transacción con
+# sentencias por lote (arrays y unnest). Las filas que no cambian no se tocan.
+
+LOTE_DEFAULT = 5000
+
+def _lotes(ids, tamano):
+    ids = list(ids)
+    for i in range(0, len(ids), tamano):
+        yield ids[i:i + tamano]
+
+def _aplicar_diferencia(cur, tabla, columna, election_id, agregar, quitar, tamano_lote):
+    """Inserta/borra por lotes; devuelve (agregados, quitados) reales."""
+    agregados = quitados = 0
+    for lote in _lotes(sorted(set(quitar) - set(agregar)), tamano_lote):
+        cur.execute(f"DELETE FROM {tabla} WHERE election_id = %s AND {columna} = ANY(%s)",
+                    (election_id, lote))
+        quitados += cur.rowcount
+    for lote in _lotes(sorted(set(agregar)), tamano_lote):
+        cur.execute(f"""
+            INSERT INTO {tabla} (election_id, {columna})
+            SELECT %s, x FROM unnest(%s::int[]) AS x
+            ON CONFLICT DO NOTHING
+        """, (election_id, lote))
+        agregados += cur.rowcount
+    return agregados, quitados
+
+def _en_transaccion(fn):
+    db = get_db()
+    cur = db.cursor()
+    try:
+        resultado = fn(cur)
+        db.commit()
+        return resultado
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+
+def actualizar_votantes(election_id, agregar=(), quitar=(), tamano_lote=LOTE_DEFAULT):
+    """Aplica altas y bajas de votantes habilitados. Devuelve {'agregados', 'quitados'}."""
+    agregar = {int(v) for v in agregar}
+    quitar = {int(v) for v in quitar}
+
+    def aplicar(cur):
+        a, q = _aplicar_diferencia(cur, 'eleccion_votantes', 'votante_id', election_id,
+                                   agregar, quitar, tamano_lote)
+        return {'agregados': a, 'quitados': q}
+    return _en_transaccion(aplicar)
+
+def sincronizar_cargos(election_id, cargo_ids):
+    """Deja en la elección exactamente `cargo_ids`. Devuelve {'agregados', 'quitados'}."""
+    deseados = {int(c) for c in cargo_ids}
+
+    def aplicar(cur):
+        cur.execute("SELECT cargo_id FROM eleccion_cargos WHERE election_id = %s", (election_id,))
+        actuales = {r[0] for r in cur.fetchall()}
+        a, q = _aplicar_diferencia(cur, 'eleccion_cargos', 'cargo_id', election_id,
+                                   deseados - actuales, actuales - deseados, LOTE_DEFAULT)
+        return {'agregados': a, 'quitados': q}
+    return _en_transaccion(aplicar)
+
+def _cedulas(lineas):
+    """Cédulas de un CSV: columna `cedula` si hay encabezado, si no la primera columna."""
+    lector = csv.reader(lineas)
+    for n, fila in enumerate(lector):
+        if not fila:
+            continue
+        valor = fila[0].strip()
+        if n == 0 and not any(ch.isdigit() for ch in valor):
+            # Encabezado: buscar la columna cedula
+            columnas = [c.strip().lower() for c in fila]
+            idx = columnas.index('cedula') if 'cedula' in columnas else 0
+            for fila in lector:
+                if len(fila) > idx and fila[idx].strip():
+                    yield fila[idx].strip()
+            return
+        if valor:
+            yield valor
+
+def habilitar_cohorte(election_id, lineas, reemplazar=False):
+    """Habilita en la elección a los votantes de un CSV de cédulas.
+
+    Con reemplazar=True la lista queda exactamente igual a la cohorte (se quitan los demás).
+    Los valores que no son exactamente 10 dígitos no se buscan: van a `invalidas`.
+    Devuelve {'leidas', 'agregados', 'quitados', 'no_encontradas', 'invalidas'}.
+    """
+    buf = io.StringIO()
+    leidas = 0
+    invalidas = []
+    for cedula in _cedulas(lineas):
+        leidas += 1
+        if len(cedula) != 10 or not cedula.isdigit():
+            invalidas.append(cedula)
+            continue
+        buf.write(cedula + '\n')
+    buf.seek(0)
+
+    def aplicar(cur):
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS _cohorte (cedula VARCHAR(10)) ON COMMIT DELETE ROWS
+        """)
+        cur.copy_expert("COPY _cohorte (cedula) FROM STDIN", buf)
+        cur.execute("""
+            SELECT DISTINCT c.cedula FROM _cohorte c
+            WHERE NOT EXISTS (SELECT 1 FROM usuarios u WHERE u.cedula = c.cedula AND u.rol = 'VOTANTE')
+            ORDER BY c.cedula
+        """)
+        no_encontradas = [r[0] for r in cur.fetchall()]
+        quitados = 0
+        if reemplazar:
+            cur.execute("""
+                DELETE FROM eleccion_votantes ev
+                WHERE ev.election_id = %s
+                  AND NOT EXISTS (SELECT 1 FROM _cohorte c JOIN usuarios u ON u.cedula = c.cedula
+                                  WHERE u.id = ev.votante_id)
+            """, (election_id,))
+            quitados = cur.rowcount
+        cur.execute("""
+            INSERT INTO eleccion_votantes (election_id, votante_id)
+            SELECT DISTINCT %s, u.id FROM _cohorte c JOIN usuarios u ON u.cedula = c.cedula
+            WHERE u.rol = 'VOTANTE'
+            ON CONFLICT DO NOTHING
+        """, (election_id,))
+        return {'leidas': leidas, 'agregados': cur.rowcount, 'quitados': quitados,
+                'no_encontradas': no_encontradas, 'invalidas': invalidas}
+    return _en_transaccion(aplicar)
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+from flask import current_app
+from app.db import get_pool
+
+# Resultados en vivo para admin.resultados.
+# confirmar_voto hace NOTIFY en el canal `votos_emitidos` al confirmar cada boleta (la
+# notificación solo se entrega si la transacción hace commit). Cada worker tiene un único
+# hilo con LISTEN que acumula los votos recibidos y, una vez por RESULTADOS_PUSH_INTERVAL,
+# reparte un delta agregado a todos los dashboards suscritos a esa elección (SSE).
+
+CANAL = 'votos_emitidos'
+
+
+class Suscriptor:
+    """Delta pendiente de un dashboard; se fusiona en lugar de encolarse, así nunca crece."""
+
+    def __init__(self, election_id):
+        self.election_id = election_id
+        self._lock = threading.Lock()
+        self._evento = threading.Event()
+        self._delta = None
+
+    def empujar(self, delta):
+        with self._lock:
+            if self._delta is None or self._delta['vuelta'] != delta['vuelta']:
+                self._delta = {'vuelta': delta['vuelta'], 'votantes': 0, 'votos': {}}
+            self._delta['votantes'] += delta['votantes']
+            for cand, n in delta['votos'].items():
+                self._delta['votos'][cand] = self._delta['votos'].get(cand, 0) + n
+        self._evento.set()
+
+    def esperar(self, timeout):
+        """Devuelve el delta acumulado o None si se cumplió el timeout."""
+        if not self._evento.wait(timeout):
+            return None
+        with self._lock:
+            delta, self._delta = self._delta, None
+            self._evento.clear()
+        return delta
+
+
+class DifusorResultados:
+    def __init__(self, app, intervalo):
+        self.app = app
+        self.intervalo = intervalo
+        self._suscriptores = {}  # election_id -> set(Suscriptor)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.stats = {'notificaciones': 0, 'envios': 0, 'reconexiones': 0}
+
+    def _asegurar_hilo(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name='resultados-listener', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def suscribir(self, election_id):
+        self._asegurar_hilo()
+        sub = Suscriptor(election_id)
+        with self._lock:
+            self._suscriptores.setdefault(election_id, set()).add(sub)
+        return sub
+
+    def desuscribir(self, sub):
+        with self._lock:
+            subs = self._suscriptores.get(sub.election_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._suscriptores[sub.election_id]
+
+    def total_suscriptores(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._suscriptores.values())
+
+    def _conectar(self):
+        conn = psycopg2.connect(**get_pool(self.app).conn_kwargs)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        cur.execute(f"LISTEN {CANAL}")
+        cur.close()
+        return conn
+
+    def _acumular(self, pendientes, payload):
+        datos = json.loads(payload)
+        eid = datos['e']
+        delta = pendientes.get(eid)
+        if delta is None or delta['vuelta'] != datos['v']:
+            delta = pendientes[eid] = {'vuelta': datos['v'], 'votantes': 0, 'votos': {}}
+        delta['votantes'] += 1
+        for _cargo, cand in datos['sel'] or []:
+            delta['votos'][cand] = delta['votos'].get(cand, 0) + 1
+
+    def _emitir(self, pendientes):
+        for eid, delta in pendientes.items():
+            with self._lock:
+                subs = list(self._suscriptores.get(eid, ()))
+            for sub in subs:
+                sub.empujar(delta)
+            self.stats['envios'] += len(subs)
+
+    def _run(self):
+        conn = None
+        pendientes = {}
+        proximo = time.monotonic() + self.intervalo
+        while True:
+            try:
+                if conn is None:
+                    conn = self._conectar()
+                espera = max(0.0, proximo - time.monotonic())
+                if select.select([conn], [], [], espera)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        self.stats['notificaciones'] += 1
+                        self._acumular(pendientes, conn.notifies.pop(0).payload)
+            except Exception as e:
+                self.app.logger.warning(f"Listener de resultados sin conexión: {e}")
+                self.stats['reconexiones'] += 1
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+                conn = None
+                time.sleep(min(self.intervalo * 5, 5))
+            # Un solo envío por intervalo, con todos los votos llegados en ese lapso
+            if time.monotonic() >= proximo:
+                if pendientes:
+                    self._emitir(pendientes)
+                    pendientes = {}
+                proximo = time.monotonic() + self.intervalo
+
+
+def init_en_vivo(app):
+    app.extensions['difusor_resultados'] = DifusorResultados(app, app.config['RESULTADOS_PUSH_INTERVAL'])
+
+def stream_resultados(election_id, heartbeat=15):
+    """Generador SSE con los deltas de conteo y participación de una elección."""
+    difusor = current_app.extensions['difusor_resultados']
+    sub = difusor.suscribir(election_id)
+
+    def generar():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                delta = sub.esperar(heartbeat)
+                if delta is None:
+                    yield ": ping\n\n"  # Mantiene viva la conexión a través de proxies
+                else:
+                    yield f"data: {json.dumps(delta)}\n\n"
+        finally:
+            difusor.desuscribir(sub)
+
+    return generar()
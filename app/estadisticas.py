@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+import psycopg2.extras
+from flask import current_app
+from app.db import get_db, query_db, DictCursorContado
+from app.cadena_auditoria import estado_cadena
+
+# Estadísticas del panel de administración.
+# En vez de contar `votos` completo en cada visita, un hilo por worker recalcula cada
+# DASHBOARD_STATS_TTL segundos una foto de las estadísticas y la guarda en la tabla
+# `estadisticas`, compartida por todos los workers. Un advisory lock hace que solo uno la
+# recalcule por intervalo. Los votos salen de los contadores mantenidos (`conteos`) y la
+# participación de `certificados`; el dashboard lee la foto con una sola consulta y muestra
+# su antigüedad (junto con el estado de la cadena de auditoría).
+
+CLAVE = 'dashboard'
+_LOCK_ID = 7340021  # pg_try_advisory_xact_lock del refresco
+
+_ELECCIONES_SQL = """
+    WITH u AS (SELECT COUNT(*) AS habilitados FROM usuarios WHERE rol = 'VOTANTE' AND habilitado = TRUE)
+    SELECT e.id, e.titulo, e.activa, e.cerrada, e.vuelta_actual,
+           (SELECT COALESCE(SUM(t.votos), 0) FROM conteos t
+            WHERE t.election_id = e.id AND t.vuelta = e.vuelta_actual) AS votos,
+           (SELECT COUNT(*) FROM certificados c
+            WHERE c.election_id = e.id AND c.vuelta = e.vuelta_actual) AS votaron,
+           CASE WHEN e.todos_habilitados THEN (SELECT habilitados FROM u)
+                ELSE (SELECT COUNT(*) FROM eleccion_votantes ev WHERE ev.election_id = e.id)
+           END AS habilitados
+    FROM elecciones e
+    ORDER BY e.activa DESC, e.fecha_inicio DESC
+    LIMIT 20
+"""
+
+def calcular(cur):
+    """Foto de las estadísticas (dict serializable a JSON)."""
+    cur.execute("""
+        SELECT (SELECT COALESCE(SUM(votos), 0) FROM conteos) AS votos,
+               (SELECT COUNT(*) FROM elecciones WHERE activa = TRUE) AS elecciones,
+               (SELECT COUNT(*) FROM usuarios WHERE rol = 'VOTANTE') AS usuarios
+    """)
+    stats = dict(cur.fetchone())
+
+    cur.execute(_ELECCIONES_SQL)
+    elecciones = []
+    for row in cur.fetchall():
+        e = dict(row)
+        e['participacion'] = round(e['votaron'] / e['habilitados'] * 100, 1) if e['habilitados'] else 0
+        elecciones.append(e)
+
+    cur.execute("""
+        SELECT evento, detalle, ip_origen, fecha_evento, cadena_pos FROM auditoria ORDER BY fecha_evento DESC LIMIT 10
+    """)
+    auditoria = [dict(r, fecha_evento=str(r['fecha_evento'])) for r in cur.fetchall()]
+    return {'stats': stats, 'elecciones': elecciones, 'auditoria': auditoria, 'cadena': estado_cadena(cur)}
+
+def refrescar(ttl, forzar=False):
+    """Recalcula la foto si está vencida y ningún otro worker lo está haciendo. True si la recalculó."""
+    db = get_db()
+    cur = db.cursor(cursor_factory=DictCursorContado)
+    try:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS libre", (_LOCK_ID,))
+        if not cur.fetchone()['libre']:
+            db.rollback()
+            return False
+        if not forzar:
+            cur.execute("""
+                SELECT 1 FROM estadisticas
+                WHERE clave = %s AND calculada_en > LOCALTIMESTAMP - make_interval(secs => %s)
+            """, (CLAVE, ttl * 0.9))
+            if cur.fetchone():
+                db.rollback()
+                return False
+        contenido = calcular(cur)
+        cur.execute("""
+            INSERT INTO estadisticas (clave, contenido, calculada_en) VALUES (%s, %s, LOCALTIMESTAMP)
+            ON CONFLICT (clave) DO UPDATE SET contenido = EXCLUDED.contenido, calculada_en = EXCLUDED.calculada_en
+        """, (CLAVE, psycopg2.extras.Json(contenido)))
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+class RefrescoEstadisticas:
+    """Hilo por worker que mantiene fresca la foto del dashboard."""
+
+    def __init__(self, app, ttl):
+        self.app = app
+        self.ttl = ttl
+        self._pid = None
+        self._lock = threading.Lock()
+        self.stats = {'refrescos': 0, 'errores': 0}
+
+    def asegurar_hilo(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    threading.Thread(target=self._run, name='estadisticas-refresco', daemon=True).start()
+                    self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.ttl)
+            try:
+                with self.app.app_context():
+                    if refrescar(self.ttl):
+                        self.stats['refrescos'] += 1
+            except Exception as e:
+                self.stats['errores'] += 1
+                self.app.logger.warning(f"No se pudieron refrescar las estadísticas: {e}")
+
+
+def init_estadisticas(app):
+    app.extensions['refresco_estadisticas'] = RefrescoEstadisticas(app, app.config['DASHBOARD_STATS_TTL'])
+
+def obtener_estadisticas():
+    """Foto vigente con su antigüedad en segundos ('edad'); la calcula en línea solo si falta o quedó muy vieja."""
+    refresco = current_app.extensions['refresco_estadisticas']
+    refresco.asegurar_hilo()
+    consulta = """
+        SELECT contenido, calculada_en, EXTRACT(EPOCH FROM LOCALTIMESTAMP - calculada_en) AS edad
+        FROM estadisticas WHERE clave = %s
+    """
+    row = query_db(consulta, (CLAVE,), one=True)
+    # Sin foto, o el hilo de refresco no está corriendo en ningún worker
+    if row is None or row['edad'] > refresco.ttl * 5:
+        refrescar(refresco.ttl, forzar=True)
+        row = query_db(consulta, (CLAVE,), one=True) or row
+    if row is None:
+        # Otro worker tiene el lock del primer cálculo: se responde con una foto sin guardar
+        cur = get_db().cursor(cursor_factory=DictCursorContado)
+        try:
+            return dict(calcular(cur), calculada_en=None, edad=0)
+        finally:
+            cur.close()
+    return dict(row['contenido'], calculada_en=row['calculada_en'], edad=int(row['edad']))
@@ -0,0 +1,52 @@
+from flask import g
+from app.db import query_db
+
+# Elegibilidad, voto y certificado de un votante en todas las elecciones activas, en una sola consulta.
+ESTADO_SQL = """
+    SELECT e.*,
+           (e.todos_habilitados OR ev.votante_id IS NOT NULL) AS elegible,
+           EXISTS (
+               SELECT 1 FROM votos v
+               WHERE v.election_id = e.id AND v.vuelta = e.vuelta_actual AND v.votante_id = %(uid)s
+           ) AS ya_voto,
+           c.id AS cert_id, c.codigo AS cert_codigo, c.fecha_emision AS cert_fecha_emision,
+           c.contenido_hash AS cert_contenido_hash
+    FROM elecciones e
+    LEFT JOIN eleccion_votantes ev ON ev.election_id = e.id AND ev.votante_id = %(uid)s
+    LEFT JOIN certificados c ON c.election_id = e.id AND c.vuelta = e.vuelta_actual AND c.votante_id = %(uid)s
+    WHERE e.activa = TRUE
+    ORDER BY e.id
+"""
+
+_CAMPOS_ESTADO = ('elegible', 'ya_voto', 'cert_id', 'cert_codigo', 'cert_fecha_emision', 'cert_contenido_hash')
+
+def resolver_estado(user_id):
+    """Devuelve [{'eleccion', 'elegible', 'ya_voto', 'certificado'}] para las elecciones activas.
+
+    El resultado se memoriza en `g`, así un mismo request nunca lo resuelve dos veces.
+    """
+    cache = g.setdefault('estado_votante', {})
+    if user_id in cache:
+        return cache[user_id]
+
+    estados = []
+    for row in query_db(ESTADO_SQL, {'uid': user_id}):
+        eleccion = {k: v for k, v in row.items() if k not in _CAMPOS_ESTADO}
+        certificado = None
+        if row['cert_id'] is not None:
+            certificado = {'id': row['cert_id'], 'codigo': row['cert_codigo'],
+                           'election_id': eleccion['id'], 'votante_id': user_id,
+                           'vuelta': eleccion['vuelta_actual'],
+                           'fecha_emision': row['cert_fecha_emision'],
+                           'contenido_hash': row['cert_contenido_hash']}
+        estados.append({'eleccion': eleccion, 'elegible': row['elegible'],
+                        'ya_voto': row['ya_voto'], 'certificado': certificado})
+    cache[user_id] = estados
+    return estados
+
+def estado_eleccion(user_id, election_id):
+    """Estado del votante en una elección activa concreta, o None si no está activa."""
+    for estado in resolver_estado(user_id):
+        if estado['eleccion']['id'] == election_id:
+            return estado
+    return None
@@ -0,0 +1,63 @@
+import os
+from flask import current_app
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+
+# Firmas Ed25519 de lo que el sistema publica (raíces del registro de recibos, etc.).
+# La clave privada vive en FIRMA_CLAVE_ARCHIVO (PEM, por defecto en instance/); si no existe
+# se genera una la primera vez. Cualquiera puede verificar con la clave pública, que se
+# publica en /verificar/clave-publica.
+
+_claves = {}  # ruta -> clave privada cargada
+
+
+def _ruta():
+    return current_app.config['FIRMA_CLAVE_ARCHIVO'] or os.path.join(current_app.instance_path, 'firma_ed25519.pem')
+
+def _crear(ruta):
+    """Genera la clave con O_EXCL: si dos workers compiten, solo uno la escribe."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    pem = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    try:
+        fd = os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pem)
+    current_app.logger.warning(f"Se generó una clave de firma nueva en {ruta}")
+
+def clave_privada():
+    ruta = _ruta()
+    clave = _claves.get(ruta)
+    if clave is None:
+        if not os.path.exists(ruta):
+            _crear(ruta)
+        with open(ruta, 'rb') as f:
+            clave = serialization.load_pem_private_key(f.read(), password=None)
+        _claves[ruta] = clave
+    return clave
+
+def clave_publica_pem():
+    return clave_privada().public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo).decode('ascii')
+
+def firmar(mensaje):
+    """Firma (hex) de `mensaje` (bytes)."""
+    return clave_privada().sign(mensaje).hex()
+
+def verificar_firma(mensaje, firma, clave_publica=None):
+    """True si `firma` (hex) corresponde a `mensaje`; por defecto con la clave pública propia."""
+    if clave_publica is None:
+        publica = clave_privada().public_key()
+    elif isinstance(clave_publica, Ed25519PublicKey):
+        publica = clave_publica
+    else:
+        publica = serialization.load_pem_public_key(clave_publica.encode('ascii') if isinstance(clave_publica, str)
+                                                    else clave_publica)
+    try:
+        publica.verify(bytes.fromhex(firma), mensaje)
+        return True
+    except (InvalidSignature, ValueError):
+        return False
@@ -0,0 +1,129 @@
+import io
+import os
+import hashlib
+from flask import Blueprint, current_app, send_from_directory, url_for, abort
+from markupsafe import Markup, escape
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Fotos de candidatos.
+# Cada subida se decodifica y valida con Pillow, se recorta cuadrada y se re-codifica en unos
+# pocos tamaños fijos, en JPEG y WebP. Los archivos se nombran con el hash del contenido
+# (`<hash>_<tamaño>.<ext>`), así que una misma foto subida dos veces se guarda una sola vez y
+# un nombre nunca cambia de contenido: se sirven desde /fotos con caché inmutable de un año.
+# `candidatos.foto_url` guarda solo el hash; los valores viejos con extensión ('uuid.jpg')
+# se siguen sirviendo tal cual desde static.
+
+TAMANOS = {'sm': 64, 'md': 160, 'lg': 320}
+FORMATOS_ENTRADA = ('JPEG', 'PNG', 'GIF', 'WEBP')
+MAX_PIXELES = 40_000_000  # Evita bombas de descompresión
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+bp = Blueprint('fotos', __name__, url_prefix='/fotos')
+
+
+class FotoInvalida(ValueError):
+    """El archivo subido no es una imagen aceptable; el mensaje es apto para el admin."""
+
+
+def directorio():
+    return os.path.join(current_app.static_folder, 'uploads', 'candidatos')
+
+def _decodificar(datos):
+    if len(datos) > current_app.config['FOTO_MAX_BYTES']:
+        raise FotoInvalida(f"La imagen supera {current_app.config['FOTO_MAX_BYTES'] // (1024 * 1024)} MB.")
+    try:
+        img = Image.open(io.BytesIO(datos))
+        if img.format not in FORMATOS_ENTRADA:
+            raise FotoInvalida("Formato de imagen no válido. Use JPG, PNG, GIF o WEBP.")
+        if img.width * img.height > MAX_PIXELES:
+            raise FotoInvalida("La imagen tiene demasiados píxeles.")
+        img.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise FotoInvalida("El archivo no es una imagen válida.")
+    # Respeta la orientación EXIF de las fotos de celular y descarta el resto de metadatos
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Transparencias sobre fondo blanco (JPEG no tiene canal alfa)
+        img = img.convert('RGBA')
+        fondo = Image.new('RGB', img.size, (255, 255, 255))
+        fondo.paste(img, mask=img.getchannel('A'))
+        return fondo
+    return img.convert('RGB')
+
+def procesar_foto(archivo):
+    """Valida la subida (FileStorage) y genera sus variantes. Devuelve el hash para foto_url."""
+    datos = archivo.read()
+    img = _decodificar(datos)
+    nombre = hashlib.sha256(datos).hexdigest()[:32]
+
+    destino = directorio()
+    os.makedirs(destino, exist_ok=True)
+    for tamano, px in TAMANOS.items():
+        variante = None
+        for ext, opciones in (('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+                              ('webp', {'format': 'WEBP', 'quality': 80, 'method': 6})):
+            ruta = os.path.join(destino, f"{nombre}_{tamano}.{ext}")
+            if os.path.exists(ruta):
+                continue  # Mismo contenido ya procesado
+            if variante is None:
+                variante = ImageOps.fit(img, (px, px), Image.LANCZOS)
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            variante.save(temporal, **opciones)
+            os.replace(temporal, ruta)
+    return nombre
+
+def es_procesada(foto_url):
+    return bool(foto_url) and '.' not in foto_url
+
+def eliminar_si_huerfana(foto_url, en_uso):
+    """Borra los archivos de una foto si ya ningún candidato la usa (`en_uso`: bool)."""
+    if not foto_url or en_uso:
+        return
+    if es_procesada(foto_url):
+        archivos = [f"{foto_url}_{t}.{ext}" for t in TAMANOS for ext in ('jpg', 'webp')]
+    else:
+        archivos = [os.path.basename(foto_url)]
+    for nombre in archivos:
+        ruta = os.path.join(directorio(), nombre)
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+def foto_candidato(cand, px=80, **attrs):
+    """<picture> con WebP y JPEG en los tamaños fijos; el navegador elige según `px` y la densidad."""
+    alt = attrs.pop('alt', cand.get('nombres', ''))
+    extra = ''.join(f' {k}="{escape(v)}"' for k, v in attrs.items())
+    foto_url = cand.get('foto_url')
+    if not foto_url or not es_procesada(foto_url):
+        if foto_url:
+            src = url_for('static', filename='uploads/candidatos/' + foto_url)
+        else:
+            avatar = 'img/avatar_female.png' if cand.get('genero') == 'F' else 'img/avatar_male.png'
+            src = url_for('static', filename=avatar)
+        return Markup(f'<img src="{escape(src)}" alt="{escape(alt)}" width="{px}" height="{px}"{extra}>')
+
+    def srcset(ext):
+        return ', '.join(f"{url_for('fotos.servir', nombre=f'{foto_url}_{t}.{ext}')} {w}w" for t, w in TAMANOS.items())
+
+    # La variante más chica que cubre el doble de px sirve de src por defecto
+    base = next((t for t, w in TAMANOS.items() if w >= px * 2), 'lg')
+    return Markup(
+        f'<picture>'
+        f'<source type="image/webp" srcset="{escape(srcset("webp"))}" sizes="{px}px">'
+        f'<img src="{escape(url_for("fotos.servir", nombre=f"{foto_url}_{base}.jpg"))}" '
+        f'srcset="{escape(srcset("jpg"))}" sizes="{px}px" alt="{escape(alt)}" width="{px}" height="{px}" '
+        f'loading="lazy" decoding="async"{extra}>'
+        f'</picture>'
+    )
+
+@bp.route('/<nombre>')
+def servir(nombre):
+    """Variantes procesadas: el nombre depende del contenido, así que nunca caducan."""
+    if '_' not in nombre or not nombre.endswith(('.jpg', '.webp')):
+        abort(404)
+    resp = send_from_directory(directorio(), nombre, max_age=31536000)
+    resp.headers['Cache-Control'] = CACHE_INMUTABLE
+    return resp
+
+def init_fotos(app):
+    app.register_blueprint(bp)
+    app.add_template_global(foto_candidato)
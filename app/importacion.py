@@ -0,0 +1,187 @@
+import io
+import os
+import csv
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import click
+import bcrypt
+from flask import current_app
+from app.db import get_db, query_db
+
+# Importación masiva de votantes desde CSV.
+# Las filas se leen y validan en streaming, las cédulas que ya existen se descartan antes de
+# hashear, las claves se hashean en un pool de procesos (bcrypt es CPU puro) y cada lote se escribe con COPY a una tabla temporal seguida de un
+# único INSERT ... ON CONFLICT, en vez de un INSERT + commit por votante.
+
+LOTE_DEFAULT = 1000
+
+def cedula_valida(cedula):
+    """Cédula ecuatoriana: 10 dígitos, provincia válida y dígito verificador (módulo 10)."""
+    if len(cedula) != 10 or not cedula.isdigit():
+        return False
+    provincia = int(cedula[:2])
+    if not (1 <= provincia <= 24 or provincia == 30) or int(cedula[2]) > 5:
+        return False
+    total = 0
+    for i, d in enumerate(cedula[:9]):
+        v = int(d) * (2 if i % 2 == 0 else 1)
+        total += v - 9 if v > 9 else v
+    return (10 - total % 10) % 10 == int(cedula[9])
+
+def _validar_fila(row, verificar_digito):
+    cedula = (row.get('cedula') or '').strip()
+    if len(cedula) != 10 or not cedula.isdigit():
+        raise ValueError(f"Cédula inválida: {cedula}")
+    if verificar_digito and not cedula_valida(cedula):
+        raise ValueError(f"Dígito verificador inválido: {cedula}")
+
+    nombres = (row.get('nombres') or '').strip()
+    apellidos = (row.get('apellidos') or '').strip()
+    if not nombres or not apellidos:
+        raise ValueError("Nombres y apellidos son obligatorios")
+    if len(nombres) > 100 or len(apellidos) > 100:
+        raise ValueError("Nombres o apellidos demasiado largos")
+
+    fecha = (row.get('fecha_nacimiento') or '').strip()
+    try:
+        datetime.date.fromisoformat(fecha)
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {fecha}")
+
+    # Validar password (simple)
+    clave = row.get('clave') or ''
+    if len(clave) < 8:
+        raise ValueError("Clave muy corta")
+
+    habilitado = (row.get('habilitado') or 'true').strip().lower() == 'true'
+    return {'cedula': cedula, 'nombres': nombres, 'apellidos': apellidos,
+            'fecha_nacimiento': fecha, 'clave': clave, 'habilitado': habilitado}
+
+def _hash_claves(claves, rounds):
+    """Se ejecuta en un proceso del pool."""
+    return [bcrypt.hashpw(c.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8') for c in claves]
+
+def _filas_validas(lector, resultado, verificar_digito):
+    for row in lector:
+        resultado['procesadas'] += 1
+        try:
+            yield _validar_fila(row, verificar_digito)
+        except ValueError as e:
+            resultado['errores'].append(f"Línea {lector.line_num} ({(row.get('cedula') or '?').strip()}): {e}")
+
+def _lotes(filas, tamano):
+    lote = []
+    for f in filas:
+        lote.append(f)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def _nuevas(filas):
+    """Quita del lote las cédulas repetidas y las que ya están en `usuarios`, para no pagar
+    bcrypt por filas que el ON CONFLICT descartaría. Devuelve (filas nuevas, descartadas)."""
+    existentes = {r['cedula'] for r in query_db(
+        "SELECT cedula FROM usuarios WHERE cedula = ANY(%s)", ([f['cedula'] for f in filas],))}
+    nuevas = []
+    for f in filas:
+        if f['cedula'] not in existentes:
+            existentes.add(f['cedula'])
+            nuevas.append(f)
+    return nuevas, len(filas) - len(nuevas)
+
+def _escribir_lote(db, filas, hashes):
+    """COPY del lote a la tabla temporal y merge con ON CONFLICT en una sola transacción."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for f, h in zip(filas, hashes):
+        writer.writerow((f['cedula'], f['nombres'], f['apellidos'], f['fecha_nacimiento'], h,
+                         't' if f['habilitado'] else 'f'))
+    buf.seek(0)
+
+    cur = db.cursor()
+    try:
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS _import_usuarios (
+                cedula VARCHAR(10), nombres VARCHAR(100), apellidos VARCHAR(100),
+                fecha_nacimiento DATE, clave VARCHAR(255), habilitado BOOLEAN
+            ) ON COMMIT DELETE ROWS
+        """)
+        cur.copy_expert("COPY _import_usuarios FROM STDIN WITH (FORMAT csv)", buf)
+        cur.execute("""
+            INSERT INTO usuarios (cedula, nombres, apellidos, fecha_nacimiento, clave, rol, habilitado)
+            SELECT cedula, nombres, apellidos, fecha_nacimiento, clave, 'VOTANTE', habilitado
+            FROM _import_usuarios
+            ON CONFLICT (cedula) DO NOTHING
+        """)
+        insertadas = cur.rowcount
+        db.commit()
+        return insertadas
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+
+def importar_votantes(lineas, progreso=None, tamano_lote=LOTE_DEFAULT, workers=None, verificar_digito=False,
+                      rounds=12, arranque=None):
+    """Importa votantes desde un iterable de líneas CSV.
+
+    Devuelve {'procesadas', 'insertadas', 'duplicadas', 'errores'}; `progreso(resultado)` se
+    llama después de escribir cada lote. `arranque` es el método de inicio de los procesos
+    ('spawn', 'forkserver'; por defecto el de la plataforma).
+    """
+    workers = workers or os.cpu_count() or 1
+    resultado = {'procesadas': 0, 'insertadas': 0, 'duplicadas': 0, 'errores': []}
+    lector = csv.DictReader(lineas)
+    db = get_db()
+
+    def escribir(filas, futuros):
+        hashes = [h for fut in futuros for h in fut.result()]
+        insertadas = _escribir_lote(db, filas, hashes)
+        resultado['insertadas'] += insertadas
+        resultado['duplicadas'] += len(filas) - insertadas
+        if progreso:
+            progreso(resultado)
+
+    contexto = multiprocessing.get_context(arranque) if arranque else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+        anterior = None
+        for filas in _lotes(_filas_validas(lector, resultado, verificar_digito), tamano_lote):
+            filas, duplicadas = _nuevas(filas)
+            resultado['duplicadas'] += duplicadas
+            if not filas:
+                continue
+            # Repartir el lote entre los procesos y escribir el lote anterior mientras se hashea este
+            paso = max(1, -(-len(filas) // workers))
+            futuros = [pool.submit(_hash_claves, [f['clave'] for f in filas[i:i + paso]], rounds)
+                       for i in range(0, len(filas), paso)]
+            if anterior:
+                escribir(*anterior)
+            anterior = (filas, futuros)
+        if anterior:
+            escribir(*anterior)
+    return resultado
+
+@click.command('import-votantes')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--lote', default=LOTE_DEFAULT, show_default=True, help='Filas por transacción.')
+@click.option('--workers', default=None, type=int, help='Procesos para bcrypt (por defecto, núcleos).')
+@click.option('--verificar-digito/--sin-digito', default=None,
+              help='Validar provincia y dígito verificador (por defecto, IMPORT_VERIFICAR_DIGITO).')
+def importar_votantes_command(archivo, lote, workers, verificar_digito):
+    """Importa un padrón de votantes desde CSV (cedula, nombres, apellidos, fecha_nacimiento, clave, habilitado)."""
+    def progreso(r):
+        click.echo(f"  Procesadas: {r['procesadas']}  Insertadas: {r['insertadas']}  "
+                   f"Duplicadas: {r['duplicadas']}  Errores: {len(r['errores'])}")
+
+    if verificar_digito is None:
+        verificar_digito = current_app.config['IMPORT_VERIFICAR_DIGITO']
+    with open(archivo, encoding='utf-8-sig', newline='') as f:
+        r = importar_votantes(f, progreso=progreso, tamano_lote=lote, workers=workers,
+                              verificar_digito=verificar_digito, rounds=current_app.config['BCRYPT_ROUNDS'])
+    for error in r['errores']:
+        click.echo(f"  {error}", err=True)
+    click.echo(f"Importación terminada. Insertados: {r['insertadas']}. Errores: {len(r['errores'])}")
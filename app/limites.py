@@ -0,0 +1,31 @@
+import time
+import threading
+from app.cache import LRUCache
+
+# Limitador de tasa por cliente (token bucket) en memoria del worker.
+# Cada cliente tiene `rafaga` fichas que se reponen a `por_minuto` por minuto; un request
+# gasta `costo` fichas. Con N workers el límite efectivo es a lo sumo N veces el configurado.
+
+
+class LimitadorTasa:
+    def __init__(self, por_minuto, rafaga, max_clientes=10000):
+        self.tasa = por_minuto / 60.0
+        self.rafaga = rafaga
+        # Un cliente inactivo el tiempo de recargar la ráfaga completa ya no necesita estado
+        self._cubos = LRUCache(maxsize=max_clientes, ttl=max(rafaga / self.tasa, 1.0))
+        self._lock = threading.Lock()
+        self.stats = {'permitidos': 0, 'rechazados': 0}
+
+    def consumir(self, cliente, costo=1):
+        """0 si se permite; si no, segundos a esperar."""
+        ahora = time.monotonic()
+        with self._lock:
+            fichas, antes = self._cubos.get(cliente, (self.rafaga, ahora))
+            fichas = min(self.rafaga, fichas + (ahora - antes) * self.tasa)
+            if fichas < costo:
+                self._cubos.set(cliente, (fichas, ahora))
+                self.stats['rechazados'] += 1
+                return max(1, int((costo - fichas) / self.tasa + 0.999))
+            self._cubos.set(cliente, (fichas - costo, ahora))
+            self.stats['permitidos'] += 1
+            return 0
@@ -0,0 +1,227 @@
+import os
+import hmac
+import time
+import heapq
+import bisect
+import threading
+from flask import Blueprint, current_app, g, request, Response, jsonify, abort
+
+# Métricas por request y exportación en formato Prometheus (/admin/metricas).
+# Cada request registra su duración, cuántas consultas hizo y cuánto tiempo pasó en la DB
+# (medido por los cursores de app/db.py) en histogramas por endpoint, y a los administradores (o
+# al scraper con METRICAS_TOKEN) les devuelve el resumen en la cabecera Server-Timing; a nadie
+# más, porque el tiempo en la DB por request serviría de oráculo de tiempos. Los requests más
+# lentos que METRICAS_REQUEST_LENTO dejan en el log sus sentencias más lentas. A los histogramas se suman los contadores que ya llevan el pool,
+# las caches, el pool de bcrypt, la auditoría, el difusor de resultados y el limitador.
+# Todo es por worker: con varios workers cada scrape ve el worker que lo atiende (etiqueta pid).
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+MAX_LENTAS = 20
+
+bp = Blueprint('metricas', __name__, url_prefix='/admin/metricas')
+
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.cuentas = [0] * len(buckets)  # No acumuladas; el exportador las acumula
+        self.total = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        i = bisect.bisect_left(self.buckets, valor)
+        if i < len(self.buckets):
+            self.cuentas[i] += 1
+        self.total += 1
+        self.suma += valor
+
+
+class Metricas:
+    """Histogramas por (endpoint, método) y las sentencias más lentas vistas por el worker."""
+
+    def __init__(self, lento):
+        self.lento = lento
+        self._lock = threading.Lock()
+        self._endpoints = {}  # (endpoint, metodo) -> {'duracion', 'db', 'consultas'}
+        self._respuestas = {}  # (endpoint, metodo, status) -> cantidad
+        self._lentas = []  # heap (segundos, endpoint, sql)
+
+    def registrar(self, endpoint, metodo, status, duracion, consultas, tiempo_db, lentas):
+        with self._lock:
+            h = self._endpoints.get((endpoint, metodo))
+            if h is None:
+                h = self._endpoints[(endpoint, metodo)] = {
+                    'duracion': Histograma(BUCKETS_SEGUNDOS), 'db': Histograma(BUCKETS_SEGUNDOS),
+                    'consultas': Histograma(BUCKETS_CONSULTAS)}
+            h['duracion'].observar(duracion)
+            h['db'].observar(tiempo_db)
+            h['consultas'].observar(consultas)
+            clave = (endpoint, metodo, status)
+            self._respuestas[clave] = self._respuestas.get(clave, 0) + 1
+            for segundos, sql in lentas:
+                item = (segundos, endpoint, sql)
+                if len(self._lentas) < MAX_LENTAS:
+                    heapq.heappush(self._lentas, item)
+                elif segundos > self._lentas[0][0]:
+                    heapq.heapreplace(self._lentas, item)
+
+    def lentas(self):
+        with self._lock:
+            return sorted(self._lentas, reverse=True)
+
+    def copia(self):
+        with self._lock:
+            endpoints = {k: {n: (h.buckets, list(h.cuentas), h.total, h.suma) for n, h in v.items()}
+                         for k, v in self._endpoints.items()}
+            return endpoints, dict(self._respuestas)
+
+
+def _etiquetas(**etiquetas):
+    def escapar(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in etiquetas.items()) + '}'
+
+def _metrica(lineas, nombre, tipo, ayuda, muestras):
+    lineas.append(f"# HELP {nombre} {ayuda}")
+    lineas.append(f"# TYPE {nombre} {tipo}")
+    for etiquetas, valor in muestras:
+        lineas.append(f"{nombre}{_etiquetas(**etiquetas) if etiquetas else ''} {valor}")
+
+def _histogramas(lineas, endpoints):
+    for nombre, clave, ayuda in (
+            ('votacion_request_segundos', 'duracion', 'Duración de los requests por endpoint.'),
+            ('votacion_request_db_segundos', 'db', 'Tiempo en la base de datos por request.'),
+            ('votacion_request_consultas', 'consultas', 'Sentencias SQL por request.')):
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for (endpoint, metodo), hs in sorted(endpoints.items()):
+            buckets, cuentas, total, suma = hs[clave]
+            acumulado = 0
+            for le, n in zip(buckets, cuentas):
+                acumulado += n
+                lineas.append(f"{nombre}_bucket{_etiquetas(endpoint=endpoint, metodo=metodo, le=le)} {acumulado}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(endpoint=endpoint, metodo=metodo, le='+Inf')} {total}")
+            lineas.append(f"{nombre}_sum{_etiquetas(endpoint=endpoint, metodo=metodo)} {suma:.6f}")
+            lineas.append(f"{nombre}_count{_etiquetas(endpoint=endpoint, metodo=metodo)} {total}")
+
+# Componentes que ya llevan contadores en `stats`: extensión -> prefijo de la métrica
+_CONTADORES = (
+    ('db_pool', 'db_pool', 'Eventos del pool de conexiones.'),
+    ('verificador_claves', 'bcrypt', 'Verificaciones de contraseña en el pool de procesos.'),
+    ('audit_writer', 'auditoria', 'Escritor asíncrono de auditoría.'),
+    ('sellador_auditoria', 'auditoria_sellado', 'Sellado de la cadena de auditoría.'),
+    ('generador_actas', 'actas', 'Actas de resultados generadas en segundo plano.'),
+    ('difusor_resultados', 'difusor', 'Difusor de resultados en vivo.'),
+    ('limitador_verificacion', 'limitador', 'Limitador de la verificación pública.'),
+    ('refresco_estadisticas', 'estadisticas', 'Refresco de las estadísticas del dashboard.'),
+)
+
+def _componentes(lineas, app):
+    ext = app.extensions
+    for clave, prefijo, ayuda in _CONTADORES:
+        comp = ext.get(clave)
+        if comp is None:
+            continue
+        # `stats` solo tiene contadores; la ocupación actual va aparte como gauge
+        stats = dict(comp.stats)
+        _metrica(lineas, f"votacion_{prefijo}_total", 'counter', ayuda,
+                 [({'evento': k}, v) for k, v in sorted(stats.items())])
+
+    pool = ext.get('db_pool')
+    if pool is not None and pool.pid == os.getpid():
+        s = pool.snapshot()
+        _metrica(lineas, 'votacion_db_pool_conexiones', 'gauge', 'Conexiones del pool por estado.',
+                 [({'estado': 'en_uso'}, s['en_uso']), ({'estado': 'libres'}, s['libres'])])
+        _metrica(lineas, 'votacion_db_pool_max', 'gauge', 'Máximo de conexiones del pool.', [(None, s['max'])])
+
+    caches = [(n, ext[n].stats()) for n in ('user_cache', 'boleta_cache', 'eleccion_cache') if n in ext]
+    if caches:
+        _metrica(lineas, 'votacion_cache_consultas_total', 'counter', 'Aciertos y fallos de las caches del worker.',
+                 [({'cache': n, 'resultado': r}, s[k]) for n, s in caches for r, k in (('hit', 'hits'), ('miss', 'misses'))])
+        _metrica(lineas, 'votacion_cache_entradas', 'gauge', 'Entradas en cada cache.',
+                 [({'cache': n}, s['tamano']) for n, s in caches])
+        _metrica(lineas, 'votacion_cache_capacidad', 'gauge', 'Capacidad de cada cache.',
+                 [({'cache': n}, s['max']) for n, s in caches])
+
+    claves = ext.get('verificador_claves')
+    if claves is not None:
+        s = claves.snapshot()
+        _metrica(lineas, 'votacion_bcrypt_en_curso', 'gauge', 'Verificaciones de bcrypt en cola o en curso.',
+                 [(None, s['en_curso'])])
+        _metrica(lineas, 'votacion_bcrypt_capacidad', 'gauge', 'Máximo de verificaciones admitidas a la vez.',
+                 [(None, s['capacidad'])])
+
+    writer = ext.get('audit_writer')
+    if writer is not None:
+        _metrica(lineas, 'votacion_auditoria_cola', 'gauge', 'Eventos de auditoría en cola sin escribir.',
+                 [(None, writer.cola.qsize())])
+
+    difusor = ext.get('difusor_resultados')
+    if difusor is not None:
+        _metrica(lineas, 'votacion_sse_suscriptores', 'gauge', 'Streams de resultados abiertos en el worker.',
+                 [(None, difusor.total_suscriptores())])
+
+def exportar(app):
+    """Texto en formato de exposición de Prometheus (0.0.4)."""
+    lineas = []
+    _metrica(lineas, 'votacion_worker', 'gauge', 'Worker que atendió el scrape.', [({'pid': os.getpid()}, 1)])
+    endpoints, respuestas = app.extensions['metricas'].copia()
+    _metrica(lineas, 'votacion_respuestas_total', 'counter', 'Respuestas por endpoint, método y código.',
+             [({'endpoint': e, 'metodo': m, 'status': s}, n) for (e, m, s), n in sorted(respuestas.items())])
+    _histogramas(lineas, endpoints)
+    _componentes(lineas, app)
+    return '\n'.join(lineas) + '\n'
+
+
+def _autorizado():
+    """Sesión de administrador o `Authorization: Bearer <METRICAS_TOKEN>` (para el scraper)."""
+    token = current_app.config['METRICAS_TOKEN']
+    enviado = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(enviado.encode(), f"Bearer {token}".encode()):
+        return True
+    return g.get('user') is not None and g.user['rol'] == 'ADMIN'
+
+@bp.route('')
+def prometheus():
+    if not _autorizado():
+        abort(403)
+    return Response(exportar(current_app), mimetype='text/plain; version=0.0.4; charset=utf-8',
+                    headers={'Cache-Control': 'no-store'})
+
+@bp.route('/lentas')
+def lentas():
+    """Sentencias más lentas vistas por este worker (JSON)."""
+    if not _autorizado():
+        abort(403)
+    return jsonify(pid=os.getpid(), lentas=[{'segundos': round(s, 6), 'endpoint': e, 'sql': sql}
+                                            for s, e, sql in current_app.extensions['metricas'].lentas()])
+
+
+def init_metricas(app):
+    metricas = Metricas(lento=app.config['METRICAS_REQUEST_LENTO'])
+    app.extensions['metricas'] = metricas
+    app.register_blueprint(bp)
+
+    @app.before_request
+    def iniciar_medicion():
+        g.inicio_request = time.perf_counter()
+
+    @app.after_request
+    def registrar_request(resp):
+        inicio = g.pop('inicio_request', None)
+        if inicio is None:
+            return resp
+        duracion = time.perf_counter() - inicio
+        consultas, tiempo_db = g.get('db_queries', 0), g.get('db_tiempo', 0.0)
+        lentas = sorted(g.get('db_lentas') or [], reverse=True)
+        endpoint = request.endpoint or 'sin_ruta'
+        metricas.registrar(endpoint, request.method, resp.status_code, duracion, consultas, tiempo_db, lentas)
+        if _autorizado():
+            resp.headers['Server-Timing'] = (f'app;dur={duracion * 1000:.1f}, '
+                                             f'db;dur={tiempo_db * 1000:.1f};desc="{consultas} consultas"')
+        if duracion >= metricas.lento:
+            detalle = '; '.join(f"{s * 1000:.0f} ms {sql[:120]}" for s, sql in lentas[:3])
+            app.logger.warning(f"Request lento {request.method} {request.path}: {duracion * 1000:.0f} ms, "
+                               f"{consultas} consultas, {tiempo_db * 1000:.0f} ms en DB. {detalle}")
+        return resp
@@ -0,0 +1,150 @@
+import os
+import re
+import click
+import psycopg2
+from flask import current_app
+from app.db import get_pool
+
+# Migraciones versionadas y no destructivas en db/migrations/NNNN_nombre.sql.
+# `init-db` recrea todo desde schema.sql (que ya incluye las migraciones) y las marca como
+# aplicadas; `migrate-db` aplica en orden las pendientes sobre una base con datos.
+#
+# Encabezados opcionales en el archivo:
+#   -- migracion: sin-transaccion      sentencias una a una en autocommit (CREATE INDEX CONCURRENTLY)
+#   -- migracion: opcional <grupo>     solo se aplica con --opcional <grupo>
+
+_ARCHIVO = re.compile(r'^(\d{4})_(\w+)\.sql$')
+_LOCK_ID = 7340017  # pg_advisory_lock: un solo runner a la vez
+_IDENT = r'(?:"[^"]+"|\w+)'
+_CREATE_INDEX = re.compile(rf'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?'
+                           rf'({_IDENT}(?:\.{_IDENT})?)', re.IGNORECASE)
+
+
+def _directorio():
+    return os.path.join(current_app.root_path, '..', 'db', 'migrations')
+
+def listar_migraciones():
+    """[{'version', 'nombre', 'sql', 'sin_transaccion', 'opcional'}] en orden de versión."""
+    migraciones = []
+    for archivo in sorted(os.listdir(_directorio())):
+        m = _ARCHIVO.match(archivo)
+        if not m:
+            continue
+        with open(os.path.join(_directorio(), archivo), encoding='utf-8') as f:
+            sql = f.read()
+        opciones = re.findall(r'^--\s*migracion:\s*(.+)$', sql, re.MULTILINE)
+        opcional = next((o.split()[1] for o in opciones if o.startswith('opcional')), None)
+        migraciones.append({'version': int(m.group(1)), 'nombre': m.group(2), 'sql': sql,
+                            'sin_transaccion': 'sin-transaccion' in opciones, 'opcional': opcional})
+    return migraciones
+
+def _sentencias(sql):
+    """Parte un archivo en sentencias (solo para migraciones sin transacción, sin bloques $$)."""
+    sin_comentarios = re.sub(r'--[^\n]*', '', sql)
+    return [s.strip() for s in sin_comentarios.split(';') if s.strip()]
+
+def _asegurar_tabla(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INT PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def marcar_aplicadas(cur):
+    """Registra como aplicadas las migraciones no opcionales (base recién creada con schema.sql)."""
+    _asegurar_tabla(cur)
+    for m in listar_migraciones():
+        if m['opcional'] is None:
+            cur.execute("INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                        (m['version'], m['nombre']))
+
+def _indices_creados(sentencias):
+    """Nombres (tal como se escribieron) de los índices que crean las sentencias."""
+    return [m.group(1) for s in sentencias for m in [_CREATE_INDEX.match(s)] if m]
+
+def _indices_invalidos(cur, nombres):
+    """Cuáles de `nombres` quedaron inválidos (CREATE INDEX CONCURRENTLY interrumpido).
+
+    Solo los de esta migración: un índice inválido ajeno (otro esquema, u otro CONCURRENTLY
+    todavía en curso) no debe bloquearla.
+    """
+    if not nombres:
+        return []
+    cur.execute("""
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid
+          AND i.indexrelid IN (SELECT to_regclass(n)::oid FROM unnest(%s::text[]) AS n)
+    """, (nombres,))
+    return [r[0] for r in cur.fetchall()]
+
+def _aplicar(conn, m):
+    cur = conn.cursor()
+    try:
+        if m['sin_transaccion']:
+            conn.autocommit = True
+            sentencias = _sentencias(m['sql'])
+            for sentencia in sentencias:
+                cur.execute(sentencia)
+            invalidos = _indices_invalidos(cur, _indices_creados(sentencias))
+            if invalidos:
+                raise click.ClickException(
+                    f"Índices inválidos tras la migración {m['version']:04d}: {', '.join(invalidos)}. "
+                    "Bórralos con DROP INDEX CONCURRENTLY y vuelve a ejecutar.")
+            conn.autocommit = False
+            cur.execute("INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                        (m['version'], m['nombre']))
+        else:
+            cur.execute(m['sql'])
+            cur.execute("INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                        (m['version'], m['nombre']))
+        conn.commit()
+    except Exception:
+        if not conn.autocommit:
+            conn.rollback()
+        conn.autocommit = False
+        raise
+    finally:
+        cur.close()
+
+def migrar(opcionales=(), hasta=None, simular=False, log=click.echo):
+    """Aplica las migraciones pendientes. Devuelve la lista de versiones aplicadas."""
+    # Conexión propia: las migraciones sin transacción necesitan autocommit
+    conn = psycopg2.connect(**get_pool().conn_kwargs)
+    aplicadas = []
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (_LOCK_ID,))
+        _asegurar_tabla(cur)
+        conn.commit()
+        cur.execute("SELECT version FROM schema_migraciones")
+        hechas = {r[0] for r in cur.fetchall()}
+        conn.commit()
+        cur.close()
+
+        for m in listar_migraciones():
+            if m['version'] in hechas or (hasta is not None and m['version'] > hasta):
+                continue
+            if m['opcional'] is not None and m['opcional'] not in opcionales:
+                continue
+            etiqueta = f"{m['version']:04d}_{m['nombre']}"
+            if simular:
+                log(f"  Pendiente: {etiqueta}")
+                continue
+            log(f"  Aplicando {etiqueta}...")
+            _aplicar(conn, m)
+            aplicadas.append(m['version'])
+    finally:
+        conn.close()  # Libera también el advisory lock
+    return aplicadas
+
+@click.command('migrate-db')
+@click.option('--opcional', 'opcionales', multiple=True, help='Grupo de migraciones opcionales (ej: particionado).')
+@click.option('--hasta', type=int, default=None, help='Aplicar solo hasta esta versión.')
+@click.option('--simular', is_flag=True, help='Solo listar las migraciones pendientes.')
+def migrate_db_command(opcionales, hasta, simular):
+    """Aplica las migraciones pendientes de db/migrations sin borrar datos."""
+    aplicadas = migrar(opcionales=opcionales, hasta=hasta, simular=simular)
+    if not simular:
+        click.echo(f"Migraciones aplicadas: {len(aplicadas)}.")
@@ -0,0 +1,124 @@
+import io
+import csv
+import json
+from app.db import get_db, query_db
+from app.votantes import codificar_cursor, decodificar_cursor
+
+# Participación y listas de votantes (sufragaron / pendientes) de una elección.
+# "Votó" se resuelve con `certificados` (una fila por votante, elección y vuelta) y los
+# pendientes con un anti-join NOT EXISTS en lugar de NOT IN (SELECT DISTINCT ...). Las listas
+# se sirven por páginas (keyset) o se exportan en streaming con un cursor del lado del servidor.
+
+TIPOS = ('sufragaron', 'pendientes')
+LIMITE_MAX = 500
+FILAS_POR_FETCH = 2000
+
+_VOTO_EXISTE = """
+    EXISTS (SELECT 1 FROM certificados c
+            WHERE c.election_id = %(eid)s AND c.vuelta = %(vuelta)s AND c.votante_id = u.id)
+"""
+
+def _universo(eleccion):
+    """FROM/WHERE de los votantes habilitados para la elección."""
+    if eleccion['todos_habilitados']:
+        return "FROM usuarios u WHERE u.rol = 'VOTANTE' AND u.habilitado = TRUE"
+    return ("FROM eleccion_votantes ev JOIN usuarios u ON u.id = ev.votante_id "
+            "WHERE ev.election_id = %(eid)s")
+
+def _consulta(eleccion, tipo, cursor=None):
+    """(sql, params) de la lista pedida, ordenada para keyset."""
+    params = {'eid': eleccion['id'], 'vuelta': eleccion['vuelta_actual']}
+    if tipo == 'sufragaron':
+        sql = """
+            SELECT u.id, u.cedula, u.nombres, u.apellidos, u.genero, c.fecha_emision AS fecha_voto, c.id AS cert_id
+            FROM certificados c JOIN usuarios u ON u.id = c.votante_id
+            WHERE c.election_id = %(eid)s AND c.vuelta = %(vuelta)s
+        """
+        if cursor:
+            sql += " AND (c.fecha_emision, c.id) < (%(c_fecha)s, %(c_id)s)"
+            params.update(c_fecha=cursor[0], c_id=cursor[1])
+        sql += " ORDER BY c.fecha_emision DESC, c.id DESC"
+    else:
+        sql = f"""
+            SELECT u.id, u.cedula, u.nombres, u.apellidos, u.genero
+            {_universo(eleccion)} AND NOT {_VOTO_EXISTE}
+        """
+        if cursor:
+            sql += " AND (u.apellidos, u.nombres, u.id) > (%(c_ape)s, %(c_nom)s, %(c_id)s)"
+            params.update(c_ape=cursor[0], c_nom=cursor[1], c_id=cursor[2])
+        sql += " ORDER BY u.apellidos, u.nombres, u.id"
+    return sql, params
+
+def contar_participacion(eleccion):
+    """(votaron, habilitados) de la vuelta actual en una sola consulta."""
+    params = {'eid': eleccion['id'], 'vuelta': eleccion['vuelta_actual']}
+    row = query_db(f"""
+        SELECT (SELECT COUNT(*) FROM certificados c
+                WHERE c.election_id = %(eid)s AND c.vuelta = %(vuelta)s) AS votaron,
+               (SELECT COUNT(*) {_universo(eleccion)}) AS habilitados
+    """, params, one=True)
+    return row['votaron'], row['habilitados']
+
+def pagina_votantes(eleccion, tipo, despues=None, limite=100):
+    """Una página de la lista `tipo` y el cursor de la siguiente (o None)."""
+    limite = max(1, min(int(limite), LIMITE_MAX))
+    cursor = decodificar_cursor(despues, 2 if tipo == 'sufragaron' else 3) if despues else None
+    sql, params = _consulta(eleccion, tipo, cursor)
+    params['limite'] = limite + 1
+    rows = query_db(sql + " LIMIT %(limite)s", params)
+
+    siguiente = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        u = rows[-1]
+        valores = ((u['fecha_voto'].isoformat(), u['cert_id']) if tipo == 'sufragaron'
+                   else (u['apellidos'], u['nombres'], u['id']))
+        siguiente = codificar_cursor(valores)
+    return rows, siguiente
+
+def _filas(eleccion, tipo):
+    """Itera la lista completa con un cursor con nombre: solo FILAS_POR_FETCH filas en memoria."""
+    sql, params = _consulta(eleccion, tipo)
+    db = get_db()
+    cur = db.cursor(name=f"export_{tipo}_{eleccion['id']}")
+    cur.itersize = FILAS_POR_FETCH
+    try:
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+        db.rollback()  # Solo lectura: cierra la transacción del cursor
+
+def exportar_votantes(eleccion, tipo, formato='csv'):
+    """Generador con la lista en CSV o JSON (arreglo), fila a fila."""
+    estado = 'sufragó' if tipo == 'sufragaron' else ('no sufragó' if eleccion['cerrada'] else 'pendiente')
+    if formato == 'json':
+        yield '['
+        for i, row in enumerate(_filas(eleccion, tipo)):
+            item = {'cedula': row[1], 'nombres': row[2], 'apellidos': row[3], 'genero': row[4], 'estado': estado}
+            if tipo == 'sufragaron':
+                item['fecha_voto'] = row[5].isoformat() if row[5] else None
+            yield (',' if i else '') + json.dumps(item, ensure_ascii=False)
+        yield ']'
+        return
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def volcar():
+        dato = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return dato
+
+    encabezado = ['cedula', 'nombres', 'apellidos', 'genero', 'estado']
+    writer.writerow(encabezado + (['fecha_voto'] if tipo == 'sufragaron' else []))
+    for i, row in enumerate(_filas(eleccion, tipo), 1):
+        fila = [row[1], row[2], row[3], row[4], estado]
+        if tipo == 'sufragaron':
+            fila.append(row[5].isoformat(sep=' ', timespec='seconds') if row[5] else '')
+        writer.writerow(fila)
+        if i % FILAS_POR_FETCH == 0:
+            yield volcar()
+    yield volcar()
@@ -0,0 +1,275 @@
+import hashlib
+import click
+import psycopg2
+from app.db import get_db, query_db, DictCursorContado
+from app.firmas import firmar, verificar_firma
+
+# Registro de recibos: los certificados de cada (elección, vuelta) forman un árbol de Merkle
+# append-only con la estructura de RFC 6962:
+#   hoja = SHA-256(0x00 || código)      nodo = SHA-256(0x01 || izquierdo || derecho)
+# La función SQL recibos_agregar() (db/schema.sql) agrega la hoja en la misma sentencia que
+# emite el voto (voter.VOTO_SQL): guarda la hoja y cada subárbol perfecto que se completa en
+# `recibos_nodos` y mantiene en `recibos_log` la frontera (un subárbol por bit del tamaño).
+# Agregar cuesta O(log n) filas, la raíz sale de la frontera y una prueba de inclusión lee
+# O(log n) nodos guardados. Al cerrar la vuelta la raíz se firma (Ed25519, app/firmas.py) y el
+# registro deja de aceptar hojas.
+
+MAX_PROBLEMAS = 20
+
+
+class RegistroInconsistente(Exception):
+    """Faltan nodos del árbol que deberían existir para el tamaño registrado."""
+
+
+def hash_hoja(codigo):
+    return hashlib.sha256(b'\x00' + bytes.fromhex(codigo)).digest()
+
+def hash_nodo(izquierdo, derecho):
+    return hashlib.sha256(b'\x01' + izquierdo + derecho).digest()
+
+def mensaje_raiz(election_id, vuelta, tamano, raiz):
+    """Lo que se firma al cerrar una vuelta."""
+    return f"recibos|{election_id}|{vuelta}|{tamano}|{raiz.hex()}".encode('ascii')
+
+def _corte(n):
+    """Mayor potencia de 2 menor que n (n > 1): tamaño del subárbol izquierdo."""
+    return 1 << ((n - 1).bit_length() - 1)
+
+def _subarboles(a, b):
+    """Subárboles perfectos guardados, (nivel, indice), que componen el rango de hojas [a, b)."""
+    n = b - a
+    if n & (n - 1) == 0:
+        nivel = n.bit_length() - 1
+        return [(nivel, a >> nivel)]
+    k = _corte(n)
+    return _subarboles(a, a + k) + _subarboles(a + k, b)
+
+def _hash_rango(a, b, nodos):
+    n = b - a
+    if n & (n - 1) == 0:
+        nivel = n.bit_length() - 1
+        return nodos[(nivel, a >> nivel)]
+    k = _corte(n)
+    return hash_nodo(_hash_rango(a, a + k, nodos), _hash_rango(a + k, b, nodos))
+
+def _ruta(m, a, b):
+    """Rangos hermanos de la hoja m en [a, b), de abajo hacia arriba."""
+    if b - a == 1:
+        return []
+    k = _corte(b - a)
+    if m < a + k:
+        return _ruta(m, a, a + k) + [(a + k, b)]
+    return _ruta(m, a + k, b) + [(a, a + k)]
+
+def _raiz(tamano, nodos):
+    return _hash_rango(0, tamano, nodos) if tamano else hashlib.sha256(b'').digest()
+
+def raiz_de_frontera(frontera):
+    """Raíz del árbol a partir de la frontera (del nivel más bajo al más alto)."""
+    raiz = None
+    for h in frontera:
+        if h is not None:
+            raiz = bytes(h) if raiz is None else hash_nodo(bytes(h), raiz)
+    return raiz if raiz is not None else hashlib.sha256(b'').digest()
+
+def _leer_nodos(election_id, vuelta, claves):
+    """{(nivel, indice): hash} de los nodos pedidos, en una sola consulta."""
+    claves = sorted(set(claves))
+    rows = query_db("""
+        SELECT n.nivel, n.indice, n.hash
+        FROM unnest(%s::smallint[], %s::bigint[]) AS k(nivel, indice)
+        JOIN recibos_nodos n ON n.election_id = %s AND n.vuelta = %s
+                            AND n.nivel = k.nivel AND n.indice = k.indice
+    """, ([c[0] for c in claves], [c[1] for c in claves], election_id, vuelta))
+    nodos = {(r['nivel'], r['indice']): bytes(r['hash']) for r in rows}
+    if len(nodos) != len(claves):
+        raise RegistroInconsistente(
+            f"Faltan {len(claves) - len(nodos)} nodos del registro de la elección {election_id} vuelta {vuelta}")
+    return nodos
+
+def verificar_inclusion(hoja, indice, tamano, ruta, raiz):
+    """Comprueba una prueba de inclusión (RFC 9162, 2.1.3.2). Todos los hashes en bytes."""
+    if indice >= tamano:
+        return False
+    fn, sn = indice, tamano - 1
+    r = hoja
+    for p in ruta:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            r = hash_nodo(p, r)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            r = hash_nodo(r, p)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and r == raiz
+
+def prueba_inclusion(codigo):
+    """Prueba de inclusión del certificado contra la raíz firmada (o la actual si la vuelta sigue abierta)."""
+    row = query_db("""
+        SELECT c.election_id, c.vuelta, c.hoja, l.tamano, l.raiz, l.firma, l.firmada_en
+        FROM certificados c
+        JOIN recibos_log l ON l.election_id = c.election_id AND l.vuelta = c.vuelta
+        WHERE c.codigo = %s
+    """, (codigo,), one=True)
+    if row is None or row['hoja'] is None:
+        return None
+    indice, tamano = row['hoja'], row['tamano']
+    rangos = _ruta(indice, 0, tamano)
+    claves = [(0, indice)] + [c for a, b in rangos for c in _subarboles(a, b)]
+    if row['firma'] is None:
+        claves += _subarboles(0, tamano)
+    nodos = _leer_nodos(row['election_id'], row['vuelta'], claves)
+
+    ruta = [_hash_rango(a, b, nodos) for a, b in rangos]
+    raiz = bytes(row['raiz']) if row['firma'] else _raiz(tamano, nodos)
+    hoja = nodos[(0, indice)]
+    return {
+        'codigo': codigo, 'eleccion': row['election_id'], 'vuelta': row['vuelta'],
+        'indice': indice, 'tamano': tamano, 'hoja': hoja.hex(), 'ruta': [h.hex() for h in ruta],
+        'raiz': raiz.hex(), 'firma': row['firma'],
+        'firmada_en': row['firmada_en'].isoformat() if row['firmada_en'] else None,
+        'valida': hoja == hash_hoja(codigo) and verificar_inclusion(hoja, indice, tamano, ruta, raiz),
+    }
+
+
+def firmar_raiz(election_id, vuelta, commit=True):
+    """Firma la raíz de la vuelta y cierra su registro. Idempotente: devuelve {'tamano', 'raiz', 'firma'}."""
+    db = get_db()
+    cur = db.cursor(cursor_factory=DictCursorContado)
+    try:
+        cur.execute("INSERT INTO recibos_log (election_id, vuelta) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                    (election_id, vuelta))
+        # Espera a los votos en curso: el registro se firma con todas sus hojas
+        cur.execute("""
+            SELECT tamano, frontera, raiz, firma FROM recibos_log
+            WHERE election_id = %s AND vuelta = %s FOR UPDATE
+        """, (election_id, vuelta))
+        log = cur.fetchone()
+        if log['firma'] is None:
+            raiz = raiz_de_frontera(log['frontera'])
+            firma = firmar(mensaje_raiz(election_id, vuelta, log['tamano'], raiz))
+            cur.execute("""
+                UPDATE recibos_log SET raiz = %s, firma = %s, firmada_en = LOCALTIMESTAMP
+                WHERE election_id = %s AND vuelta = %s
+            """, (psycopg2.Binary(raiz), firma, election_id, vuelta))
+        else:
+            raiz, firma = bytes(log['raiz']), log['firma']
+        if commit:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+    return {'tamano': log['tamano'], 'raiz': raiz.hex(), 'firma': firma}
+
+def firmar_raices(election_id):
+    """Firma las vueltas terminadas: todas si la elección está cerrada, si no las anteriores a la actual."""
+    eleccion = query_db("SELECT vuelta_actual, cerrada FROM elecciones WHERE id = %s", (election_id,), one=True)
+    if not eleccion:
+        return {}
+    ultima = eleccion['vuelta_actual'] if eleccion['cerrada'] else eleccion['vuelta_actual'] - 1
+    return {v: firmar_raiz(election_id, v) for v in range(1, ultima + 1)}
+
+
+def verificar_registro(election_id, vuelta, desde=0):
+    """Verifica el registro de una vuelta contra su raíz firmada sin reconstruir el árbol.
+
+    - La raíz se recompone con los O(log n) subárboles guardados y se compara con la frontera
+      y con la raíz firmada (y su firma).
+    - Los certificados ocupan exactamente las hojas 0..n-1.
+    - Las hojas desde `desde` coinciden con el hash de su código y cada nodo que las cubre con el
+      hash de sus hijos (en SQL, sin traer el árbol). Con `desde` = tamaño de una verificación
+      anterior solo se revisa lo agregado después.
+
+    Devuelve {'tamano', 'raiz', 'firmada', 'problemas': [...]}.
+    """
+    problemas = []
+    log = query_db("SELECT tamano, frontera, raiz, firma FROM recibos_log WHERE election_id = %s AND vuelta = %s",
+                   (election_id, vuelta), one=True)
+    tamano = log['tamano'] if log else 0
+
+    raiz = _raiz(tamano, _leer_nodos(election_id, vuelta, _subarboles(0, tamano)) if tamano else {})
+    if log and raiz_de_frontera(log['frontera']) != raiz:
+        problemas.append("La frontera del registro no coincide con los nodos guardados.")
+    firmada = bool(log and log['firma'])
+    if firmada:
+        if bytes(log['raiz']) != raiz:
+            problemas.append("La raíz firmada no coincide con los nodos guardados.")
+        if not verificar_firma(mensaje_raiz(election_id, vuelta, tamano, bytes(log['raiz'])), log['firma']):
+            problemas.append("La firma de la raíz no es válida.")
+
+    params = {'eid': election_id, 'vuelta': vuelta, 'desde': desde}
+    c = query_db("""
+        SELECT COUNT(*) AS certificados, COUNT(hoja) AS con_hoja, COUNT(DISTINCT hoja) AS distintas,
+               MIN(hoja) AS minima, MAX(hoja) AS maxima,
+               (SELECT COUNT(*) FROM recibos_nodos
+                WHERE election_id = %(eid)s AND vuelta = %(vuelta)s AND nivel = 0) AS hojas
+        FROM certificados WHERE election_id = %(eid)s AND vuelta = %(vuelta)s
+    """, params, one=True)
+    if c['con_hoja'] != c['certificados']:
+        problemas.append(f"{c['certificados'] - c['con_hoja']} certificados no están en el registro.")
+    if (c['distintas'] != c['con_hoja'] or c['distintas'] != tamano or c['hojas'] != tamano
+            or (tamano and (c['minima'] != 0 or c['maxima'] != tamano - 1))):
+        problemas.append(f"El registro tiene {tamano} hojas ({c['hojas']} guardadas) "
+                         f"pero hay {c['distintas']} posiciones distintas en {c['certificados']} certificados.")
+
+    for row in query_db(r"""
+        SELECT c.hoja FROM certificados c
+        LEFT JOIN recibos_nodos n ON n.election_id = c.election_id AND n.vuelta = c.vuelta
+                                 AND n.nivel = 0 AND n.indice = c.hoja
+        WHERE c.election_id = %(eid)s AND c.vuelta = %(vuelta)s AND c.hoja >= %(desde)s
+          AND n.hash IS DISTINCT FROM sha256('\x00'::bytea || decode(c.codigo, 'hex'))
+        ORDER BY c.hoja LIMIT %(limite)s
+    """, dict(params, limite=MAX_PROBLEMAS)):
+        problemas.append(f"La hoja {row['hoja']} no corresponde a su certificado.")
+
+    for row in query_db(r"""
+        SELECT p.nivel, p.indice FROM recibos_nodos p
+        LEFT JOIN recibos_nodos i ON i.election_id = p.election_id AND i.vuelta = p.vuelta
+                                 AND i.nivel = p.nivel - 1 AND i.indice = 2 * p.indice
+        LEFT JOIN recibos_nodos d ON d.election_id = p.election_id AND d.vuelta = p.vuelta
+                                 AND d.nivel = p.nivel - 1 AND d.indice = 2 * p.indice + 1
+        WHERE p.election_id = %(eid)s AND p.vuelta = %(vuelta)s AND p.nivel > 0
+          AND ((p.indice + 1) << p.nivel) > %(desde)s
+          AND p.hash IS DISTINCT FROM sha256('\x01'::bytea || i.hash || d.hash)
+        ORDER BY p.nivel, p.indice LIMIT %(limite)s
+    """, dict(params, limite=MAX_PROBLEMAS)):
+        problemas.append(f"El nodo (nivel {row['nivel']}, índice {row['indice']}) no coincide con sus hijos.")
+
+    return {'tamano': tamano, 'raiz': raiz.hex(), 'firmada': firmada, 'problemas': problemas}
+
+@click.command('verificar-recibos')
+@click.option('--eleccion', 'election_id', type=int, required=True, help='Elección a verificar.')
+@click.option('--vuelta', type=int, default=None, help='Solo esta vuelta.')
+@click.option('--desde', type=int, default=0, help='Revisar solo las hojas desde esta posición (verificación anterior).')
+@click.option('--firmar', is_flag=True, help='Firmar antes las vueltas terminadas que aún no tienen raíz firmada.')
+def verificar_recibos_command(election_id, vuelta, desde, firmar):
+    """Verifica el registro de recibos de una elección contra su raíz firmada."""
+    if firmar:
+        for v, r in firmar_raices(election_id).items():
+            click.echo(f"  Vuelta {v}: raíz {r['raiz']} ({r['tamano']} recibos) firmada.")
+    if vuelta is not None:
+        vueltas = [vuelta]
+    else:
+        vueltas = [r['vuelta'] for r in query_db("""
+            SELECT vuelta FROM recibos_log WHERE election_id = %s
+            UNION SELECT DISTINCT vuelta FROM certificados WHERE election_id = %s
+            ORDER BY vuelta
+        """, (election_id, election_id))]
+    fallas = 0
+    for v in vueltas:
+        r = verificar_registro(election_id, v, desde)
+        estado = 'firmada' if r['firmada'] else 'SIN FIRMAR'
+        click.echo(f"Vuelta {v}: {r['tamano']} recibos, raíz {r['raiz']} ({estado}).")
+        for p in r['problemas']:
+            click.echo(f"  ✗ {p}")
+        fallas += len(r['problemas'])
+        if not r['problemas']:
+            click.echo(f"  ✓ Registro íntegro. Próxima verificación incremental: --desde {r['tamano']}")
+    if fallas:
+        raise click.ClickException(f"{fallas} problemas encontrados.")
@@ -0,0 +1,137 @@
+import os
+import gzip
+import hashlib
+import datetime
+from flask import current_app, request, session, make_response
+try:
+    import brotli
+except ImportError:  # Opcional: sin el paquete `brotli` se comprime solo con gzip
+    brotli = None
+
+# Capa HTTP común a todas las respuestas:
+# - Validadores condicionales (ETag / Last-Modified) para páginas que solo cambian cuando
+#   cambian sus datos: la vista calcula la clave y responde 304 antes de renderizar.
+# - Compresión gzip/brotli de respuestas de texto.
+# - URLs de estáticos con ?v=<hash del archivo>, servidas con caché inmutable.
+
+COMPRIMIBLES = ('text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+                'application/javascript', 'text/javascript', 'image/svg+xml')
+MAX_ESTATICO_COMPRIMIBLE = 1024 * 1024
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+_hashes_estaticos = {}  # ruta -> (mtime, hash)
+
+
+def _version_plantillas(app):
+    """Hash y fecha de las plantillas: una plantilla nueva invalida todos los ETag."""
+    h = hashlib.sha1()
+    ultima = 0.0
+    carpeta = os.path.join(app.root_path, app.template_folder)
+    for raiz, _dirs, archivos in sorted(os.walk(carpeta)):
+        for nombre in sorted(archivos):
+            ruta = os.path.join(raiz, nombre)
+            with open(ruta, 'rb') as f:
+                h.update(f.read())
+            ultima = max(ultima, os.path.getmtime(ruta))
+    return h.hexdigest()[:12], datetime.datetime.fromtimestamp(int(ultima), datetime.timezone.utc)
+
+def etag_de(*partes):
+    """ETag débil (la representación varía con la compresión) a partir de la versión de los datos."""
+    crudo = '|'.join(str(p) for p in (current_app.config['VERSION_PLANTILLAS'],) + partes)
+    return hashlib.sha1(crudo.encode('utf-8')).hexdigest()[:20]
+
+def _normalizar(ultima_modificacion):
+    """UTC, sin microsegundos y nunca anterior a las plantillas con que se renderiza."""
+    if ultima_modificacion is None:
+        return None
+    if ultima_modificacion.tzinfo is None:
+        ultima_modificacion = ultima_modificacion.replace(tzinfo=datetime.timezone.utc)
+    return max(ultima_modificacion.replace(microsecond=0), current_app.config['FECHA_PLANTILLAS'])
+
+def no_modificado(etag, ultima_modificacion=None):
+    """Respuesta 304 si el cliente ya tiene esta versión, o None para seguir con la vista.
+
+    Con mensajes flash pendientes nunca hay 304: se perderían sin mostrarse.
+    """
+    if session.get('_flashes'):
+        return None
+    ultima_modificacion = _normalizar(ultima_modificacion)
+    if request.if_none_match:
+        coincide = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and ultima_modificacion is not None:
+        coincide = request.if_modified_since >= ultima_modificacion
+    else:
+        coincide = False
+    if not coincide:
+        return None
+    resp = make_response('', 304)
+    return validadores(resp, etag, ultima_modificacion)
+
+def validadores(resp, etag, ultima_modificacion=None, privado=True):
+    """Agrega ETag/Last-Modified; `no-cache` obliga a revalidar (barato gracias al 304)."""
+    resp.set_etag(etag, weak=True)
+    ultima_modificacion = _normalizar(ultima_modificacion)
+    if ultima_modificacion is not None:
+        resp.last_modified = ultima_modificacion
+    resp.headers['Cache-Control'] = f"{'private' if privado else 'public'}, no-cache"
+    return resp
+
+
+def _hash_estatico(static_folder, filename):
+    ruta = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(ruta)
+    except OSError:
+        return None
+    item = _hashes_estaticos.get(ruta)
+    if item is None or item[0] != mtime:
+        with open(ruta, 'rb') as f:
+            item = (mtime, hashlib.md5(f.read()).hexdigest()[:10])
+        _hashes_estaticos[ruta] = item
+    return item[1]
+
+def _comprimir(resp):
+    if (resp.status_code != 200 or 'Content-Encoding' in resp.headers or resp.mimetype not in COMPRIMIBLES
+            or (resp.is_streamed and not resp.direct_passthrough)):
+        return resp
+    aceptadas = request.accept_encodings
+    codificacion = 'br' if brotli is not None and aceptadas['br'] else ('gzip' if aceptadas['gzip'] else None)
+    resp.vary.add('Accept-Encoding')
+    if codificacion is None:
+        return resp
+    if resp.direct_passthrough:
+        # Estáticos de texto (CSS): se leen en memoria solo si son chicos
+        if (resp.content_length or 0) > MAX_ESTATICO_COMPRIMIBLE:
+            return resp
+        resp.direct_passthrough = False
+    datos = resp.get_data()
+    if len(datos) < current_app.config['COMPRESION_MIN_BYTES']:
+        return resp
+    if codificacion == 'br':
+        datos = brotli.compress(datos, quality=5)
+    else:
+        datos = gzip.compress(datos, compresslevel=current_app.config['COMPRESION_NIVEL'])
+    resp.set_data(datos)
+    resp.headers['Content-Encoding'] = codificacion
+    etag, debil = resp.get_etag()
+    if etag and not debil:
+        resp.set_etag(etag, weak=True)  # Un ETag fuerte identifica bytes exactos, no la versión sin comprimir
+    return resp
+
+
+def init_respuestas(app):
+    app.config['VERSION_PLANTILLAS'], app.config['FECHA_PLANTILLAS'] = _version_plantillas(app)
+
+    @app.url_defaults
+    def version_estaticos(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            v = _hash_estatico(app.static_folder, values['filename'])
+            if v:
+                values['v'] = v
+
+    @app.after_request
+    def cache_y_compresion(resp):
+        if request.endpoint == 'static' and request.args.get('v') and resp.status_code == 200:
+            # El nombre versionado cambia con el contenido: se puede cachear para siempre
+            resp.headers['Cache-Control'] = CACHE_INMUTABLE
+        return _comprimir(resp)
@@ -0,0 +1,91 @@
+import psycopg2.extras
+from app.db import get_db, DictCursorContado
+from app.boletas import publicar_boleta
+from app.recibos import firmar_raiz
+
+# Generación de la segunda vuelta.
+# Los finalistas de todos los cargos salen de una sola consulta con funciones de ventana
+# sobre `conteos` (vuelta 1) y se insertan en bloque en la misma transacción que cambia
+# `vuelta_actual` y publica la boleta de la vuelta 2: o queda todo hecho o no queda nada.
+#
+# Empates en el corte (SEGUNDA_VUELTA_EMPATE):
+#   incluir    -> pasan todos los empatados en el segundo puesto (puede haber 3+ finalistas)
+#   antiguedad -> desempata el candidato inscrito primero (id menor)
+#   bloquear   -> no se genera la vuelta; el admin debe resolver el empate
+
+REGLAS_EMPATE = ('incluir', 'antiguedad', 'bloquear')
+FINALISTAS = 2
+
+_RANKING_SQL = """
+    SELECT ec.cargo_id, c.nombre AS cargo_nombre, t.candidato_id, t.votos,
+           RANK() OVER (PARTITION BY ec.cargo_id ORDER BY t.votos DESC) AS puesto,
+           ROW_NUMBER() OVER (PARTITION BY ec.cargo_id ORDER BY t.votos DESC, t.candidato_id) AS orden
+    FROM eleccion_cargos ec
+    JOIN cargos c ON c.id = ec.cargo_id
+    JOIN conteos t ON t.election_id = ec.election_id AND t.cargo_id = ec.cargo_id
+                  AND t.vuelta = 1 AND t.votos > 0
+    WHERE ec.election_id = %s
+    ORDER BY ec.cargo_id, orden
+"""
+
+
+class SegundaVueltaError(Exception):
+    """La elección no puede pasar a segunda vuelta; el mensaje es apto para el admin."""
+
+
+def _finalistas(filas, regla):
+    """Elige finalistas por cargo. Devuelve ([(cargo_id, candidato_id)], {cargo: empatados})."""
+    elegidos = []
+    empates = {}
+    for f in filas:
+        if f['puesto'] > FINALISTAS:
+            continue
+        if regla == 'incluir' or f['orden'] <= FINALISTAS:
+            elegidos.append((f['cargo_id'], f['candidato_id']))
+        # El corte cae dentro de un grupo empatado
+        if f['orden'] > FINALISTAS:
+            empates.setdefault(f['cargo_nombre'], 0)
+            empates[f['cargo_nombre']] += 1
+    return elegidos, empates
+
+def generar_segunda_vuelta(election_id, regla='incluir'):
+    """Pasa la elección a vuelta 2 en una transacción. Devuelve {'finalistas', 'empates'}."""
+    if regla not in REGLAS_EMPATE:
+        raise ValueError(f"Regla de empate desconocida: {regla}")
+    db = get_db()
+    cur = db.cursor(cursor_factory=DictCursorContado)
+    try:
+        # Bloquea la fila: dos clics simultáneos no generan la vuelta dos veces
+        cur.execute("""
+            SELECT vuelta_actual, tiene_segunda_vuelta FROM elecciones WHERE id = %s FOR UPDATE
+        """, (election_id,))
+        eleccion = cur.fetchone()
+        if not eleccion or eleccion['vuelta_actual'] != 1 or not eleccion['tiene_segunda_vuelta']:
+            raise SegundaVueltaError("La elección no cumple condiciones para segunda vuelta.")
+
+        # La vuelta 1 termina aquí: su registro de recibos se cierra con la raíz firmada antes del
+        # ranking. Cerrar el registro espera a los votos que ya agregaron su recibo, así que en
+        # READ COMMITTED el ranking ve todos los votos que quedaron dentro de la raíz firmada.
+        firmar_raiz(election_id, 1, commit=False)
+
+        cur.execute(_RANKING_SQL, (election_id,))
+        elegidos, empates = _finalistas(cur.fetchall(), regla)
+        if empates and regla == 'bloquear':
+            raise SegundaVueltaError(
+                f"Empate en el corte de finalistas en: {', '.join(sorted(empates))}. Resuélvelo antes de continuar.")
+
+        # Restos de un intento anterior no deben mezclarse con los finalistas actuales
+        cur.execute("DELETE FROM candidatos_vuelta WHERE election_id = %s AND vuelta = 2", (election_id,))
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO candidatos_vuelta (original_candidato_id, election_id, cargo_id, vuelta) VALUES %s
+        """, [(cand, election_id, cargo) for cargo, cand in elegidos], template="(%s, %s, %s, 2)")
+        cur.execute("UPDATE elecciones SET vuelta_actual = 2 WHERE id = %s", (election_id,))
+        # La boleta de la vuelta 2 se publica en la misma transacción (lee lo recién insertado)
+        publicar_boleta(election_id, 2, commit=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cur.close()
+    return {'finalistas': len(elegidos), 'empates': empates}
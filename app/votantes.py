@@ -0,0 +1,75 @@
+import json
+import base64
+from app.db import query_db
+
+# Búsqueda paginada de usuarios con keyset (apellidos, nombres, id).
+# A diferencia de OFFSET, cada página cuesta lo mismo sin importar cuán adentro del padrón
+# esté, y se apoya en los índices idx_usuarios_orden / *_prefijo de schema.sql.
+
+LIMITE_MAX = 200
+
+def codificar_cursor(valores):
+    """Cursor opaco para la URL a partir de los valores de la última fila de la página."""
+    crudo = json.dumps(list(valores), default=str)
+    return base64.urlsafe_b64encode(crudo.encode('utf-8')).decode('ascii')
+
+def decodificar_cursor(cursor, n):
+    """Lista de `n` valores o None si el cursor es inválido."""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    return valores if isinstance(valores, list) and len(valores) == n else None
+
+def buscar_usuarios(q=None, rol='VOTANTE', habilitado=None, election_id=None, asignado=None,
+                    despues=None, limite=50):
+    """Una página de usuarios y el cursor de la siguiente (o None si no hay más).
+
+    - q: prefijo de cédula (si es numérico) o de apellidos.
+    - election_id: agrega la columna `asignado`; con asignado=True/False filtra por ella.
+    """
+    limite = max(1, min(int(limite), LIMITE_MAX))
+    condiciones = []
+    params = {'eid': election_id, 'limite': limite + 1}
+
+    if rol:
+        condiciones.append("u.rol = %(rol)s")
+        params['rol'] = rol
+    if habilitado is not None:
+        condiciones.append("u.habilitado = %(habilitado)s")
+        params['habilitado'] = habilitado
+    if q:
+        q = q.strip()
+        if q.isdigit():
+            condiciones.append("u.cedula LIKE %(prefijo)s")
+        else:
+            condiciones.append("lower(u.apellidos) LIKE lower(%(prefijo)s)")
+        params['prefijo'] = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+    asignado_sql = "FALSE"
+    if election_id is not None:
+        asignado_sql = ("EXISTS (SELECT 1 FROM eleccion_votantes ev "
+                        "WHERE ev.election_id = %(eid)s AND ev.votante_id = u.id)")
+        if asignado is not None:
+            condiciones.append(asignado_sql if asignado else f"NOT {asignado_sql}")
+
+    cursor = decodificar_cursor(despues, 3) if despues else None
+    if cursor:
+        condiciones.append("(u.apellidos, u.nombres, u.id) > (%(c_ape)s, %(c_nom)s, %(c_id)s)")
+        params.update(c_ape=cursor[0], c_nom=cursor[1], c_id=cursor[2])
+
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    rows = query_db(f"""
+        SELECT u.id, u.cedula, u.nombres, u.apellidos, u.genero, u.rol, u.habilitado, u.fecha_creacion,
+               {asignado_sql} AS asignado
+        FROM usuarios u
+        {where}
+        ORDER BY u.apellidos, u.nombres, u.id
+        LIMIT %(limite)s
+    """, params)
+
+    siguiente = None
+    if len(rows) > limite:
+        rows = rows[:limite]
+        siguiente = codificar_cursor((rows[-1]['apellidos'], rows[-1]['nombres'], rows[-1]['id']))
+    return rows, siguiente
@@ -0,0 +1,35 @@
+-- Lleva una base creada con el schema.sql original al esquema actual sin borrar datos.
+-- Todas las sentencias son idempotentes: en una base ya al día no cambian nada.
+
+ALTER TABLE elecciones ADD COLUMN IF NOT EXISTS boleta_version INT NOT NULL DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS boletas (
+    election_id INT REFERENCES elecciones(id) ON DELETE CASCADE,
+    vuelta INT NOT NULL,
+    version INT NOT NULL,
+    contenido JSONB NOT NULL,
+    generada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (election_id, vuelta)
+);
+
+CREATE TABLE IF NOT EXISTS conteos (
+    election_id INT REFERENCES elecciones(id) ON DELETE CASCADE,
+    vuelta INT NOT NULL,
+    cargo_id INT REFERENCES cargos(id) ON DELETE CASCADE,
+    candidato_id INT REFERENCES candidatos(id) ON DELETE CASCADE,
+    votos INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (election_id, vuelta, cargo_id, candidato_id)
+);
+
+-- Conteos de los votos emitidos antes de existir la tabla
+INSERT INTO conteos (election_id, vuelta, cargo_id, candidato_id, votos)
+SELECT election_id, vuelta, cargo_id, candidato_id, COUNT(*)
+FROM votos
+GROUP BY election_id, vuelta, cargo_id, candidato_id
+ON CONFLICT DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS estadisticas (
+    clave VARCHAR(50) PRIMARY KEY,
+    contenido JSONB NOT NULL,
+    calculada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,21 @@
+-- migracion: sin-transaccion
+-- Índices de las consultas calientes, construidos con CONCURRENTLY para no bloquear escrituras.
+-- Si una construcción falla queda un índice inválido: el runner lo informa y hay que borrarlo
+-- (DROP INDEX CONCURRENTLY) antes de reintentar.
+
+-- Participación por vuelta y anti-join de pendientes
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_certificados_votante ON certificados(election_id, vuelta, votante_id);
+
+-- Boleta de la vuelta 1 y validaciones de activación
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_candidatos_cargo_estado ON candidatos(election_id, cargo_id, estado);
+
+-- Últimos eventos del dashboard y recorridos por fecha
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_auditoria_fecha ON auditoria(fecha_evento);
+
+-- Búsqueda y paginación keyset de votantes
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuarios_orden ON usuarios(apellidos, nombres, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuarios_cedula_prefijo ON usuarios(cedula varchar_pattern_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuarios_apellidos_prefijo ON usuarios(lower(apellidos) text_pattern_ops);
+
+-- Duplicaba la clave primaria (election_id, votante_id)
+DROP INDEX CONCURRENTLY IF EXISTS idx_eleccion_votantes;
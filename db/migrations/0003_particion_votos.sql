@@ -0,0 +1,40 @@
+-- migracion: opcional particionado
+-- Particiona `votos` por elección (HASH de election_id, 8 particiones). Reescribe la tabla
+-- con un bloqueo exclusivo: aplicar en una ventana sin votación en curso.
+--   flask --app app migrate-db --opcional particionado
+
+LOCK TABLE votos IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE votos RENAME TO votos_sin_particionar;
+
+CREATE TABLE votos (
+    id INT NOT NULL DEFAULT nextval('votos_id_seq'),
+    election_id INT NOT NULL,
+    cargo_id INT,
+    candidato_id INT,
+    votante_id INT,
+    vuelta INT NOT NULL,
+    fecha_voto TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY HASH (election_id);
+
+DO $$
+BEGIN
+    FOR i IN 0..7 LOOP
+        EXECUTE format('CREATE TABLE votos_p%s PARTITION OF votos FOR VALUES WITH (MODULUS 8, REMAINDER %s)', i, i);
+    END LOOP;
+END $$;
+
+INSERT INTO votos SELECT id, election_id, cargo_id, candidato_id, votante_id, vuelta, fecha_voto
+FROM votos_sin_particionar;
+
+ALTER SEQUENCE votos_id_seq OWNED BY votos.id;
+DROP TABLE votos_sin_particionar;
+
+-- La clave de partición debe formar parte de las restricciones únicas
+ALTER TABLE votos ADD CONSTRAINT votos_pkey PRIMARY KEY (id, election_id);
+ALTER TABLE votos ADD CONSTRAINT votos_election_id_cargo_id_vuelta_votante_id_key
+    UNIQUE (election_id, cargo_id, vuelta, votante_id);
+ALTER TABLE votos ADD CONSTRAINT votos_election_id_fkey FOREIGN KEY (election_id) REFERENCES elecciones(id);
+ALTER TABLE votos ADD CONSTRAINT votos_cargo_id_fkey FOREIGN KEY (cargo_id) REFERENCES cargos(id);
+ALTER TABLE votos ADD CONSTRAINT votos_candidato_id_fkey FOREIGN KEY (candidato_id) REFERENCES candidatos(id);
+ALTER TABLE votos ADD CONSTRAINT votos_votante_id_fkey FOREIGN KEY (votante_id) REFERENCES usuarios(id);
+CREATE INDEX idx_votos_candidato ON votos(election_id, cargo_id, vuelta, candidato_id);
@@ -0,0 +1,45 @@
+-- migracion: opcional particionado
+-- Particiona `auditoria` por mes de fecha_evento: los recorridos por fecha solo leen las
+-- particiones del rango y los meses viejos se pueden archivar con DETACH PARTITION. Crea
+-- particiones desde el primer evento hasta 24 meses adelante, más una DEFAULT de respaldo.
+-- Reescribe la tabla con un bloqueo exclusivo. Copia todas las columnas (también las de la
+-- cadena de auditoría si 0006 ya se aplicó).
+
+LOCK TABLE auditoria IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE auditoria RENAME TO auditoria_sin_particionar;
+
+CREATE TABLE auditoria (LIKE auditoria_sin_particionar INCLUDING DEFAULTS) PARTITION BY RANGE (fecha_evento);
+ALTER TABLE auditoria ALTER COLUMN fecha_evento SET NOT NULL;
+
+DO $$
+DECLARE
+    mes DATE := date_trunc('month', COALESCE((SELECT MIN(fecha_evento) FROM auditoria_sin_particionar),
+                                             CURRENT_TIMESTAMP));
+    hasta DATE := date_trunc('month', CURRENT_TIMESTAMP) + INTERVAL '24 months';
+BEGIN
+    WHILE mes <= hasta LOOP
+        EXECUTE format('CREATE TABLE auditoria_%s PARTITION OF auditoria FOR VALUES FROM (%L) TO (%L)',
+                       to_char(mes, 'YYYYMM'), mes, mes + INTERVAL '1 month');
+        mes := mes + INTERVAL '1 month';
+    END LOOP;
+END $$;
+CREATE TABLE auditoria_default PARTITION OF auditoria DEFAULT;
+
+UPDATE auditoria_sin_particionar SET fecha_evento = CURRENT_TIMESTAMP WHERE fecha_evento IS NULL;
+INSERT INTO auditoria SELECT * FROM auditoria_sin_particionar;
+
+ALTER SEQUENCE auditoria_id_seq OWNED BY auditoria.id;
+DROP TABLE auditoria_sin_particionar;
+
+ALTER TABLE auditoria ADD CONSTRAINT auditoria_pkey PRIMARY KEY (id, fecha_evento);
+ALTER TABLE auditoria ADD CONSTRAINT auditoria_usuario_id_fkey
+    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE SET NULL;
+CREATE INDEX idx_auditoria_fecha ON auditoria(fecha_evento);
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+               WHERE table_name = 'auditoria' AND column_name = 'cadena_pos') THEN
+        CREATE INDEX idx_auditoria_cadena ON auditoria(cadena_pos);
+        CREATE INDEX idx_auditoria_sin_sellar ON auditoria(id) WHERE hash IS NULL;
+    END IF;
+END $$;
@@ -0,0 +1,73 @@
+-- Registro de recibos (árbol de Merkle por elección y vuelta, ver app/recibos.py).
+-- Agrega los certificados ya emitidos en orden de emisión; sus raíces quedan sin firmar hasta
+-- `flask verificar-recibos --eleccion N --firmar` (elecciones ya cerradas) o el cierre.
+
+ALTER TABLE certificados ADD COLUMN IF NOT EXISTS hoja BIGINT;
+
+CREATE TABLE IF NOT EXISTS recibos_log (
+    election_id INT REFERENCES elecciones(id),
+    vuelta INT NOT NULL,
+    tamano BIGINT NOT NULL DEFAULT 0,
+    frontera BYTEA[] NOT NULL DEFAULT '{}',  -- frontera[nivel + 1]: subárbol perfecto pendiente de ese nivel
+    raiz BYTEA,                             -- raíz firmada al cerrar la vuelta; desde entonces no crece
+    firma TEXT,
+    firmada_en TIMESTAMP,
+    PRIMARY KEY (election_id, vuelta)
+);
+
+CREATE TABLE IF NOT EXISTS recibos_nodos (
+    election_id INT,
+    vuelta INT,
+    nivel SMALLINT NOT NULL,  -- 0 = hoja; el nodo (nivel, indice) cubre las hojas [indice * 2^nivel, (indice + 1) * 2^nivel)
+    indice BIGINT NOT NULL,
+    hash BYTEA NOT NULL,
+    PRIMARY KEY (election_id, vuelta, nivel, indice),
+    FOREIGN KEY (election_id, vuelta) REFERENCES recibos_log(election_id, vuelta)
+);
+
+-- Agrega el código de un certificado como hoja y devuelve su posición. Guarda la hoja y cada
+-- subárbol perfecto que se completa (O(log n) filas) y actualiza la frontera. El FOR UPDATE
+-- ordena las hojas de una misma vuelta; una vuelta con raíz firmada ya no acepta hojas.
+CREATE OR REPLACE FUNCTION recibos_agregar(p_eid INT, p_vuelta INT, p_codigo TEXT) RETURNS BIGINT AS $$
+DECLARE
+    v_tamano BIGINT;
+    v_frontera BYTEA[];
+    v_firma TEXT;
+    v_hash BYTEA;
+    v_nivel INT := 0;
+BEGIN
+    INSERT INTO recibos_log (election_id, vuelta) VALUES (p_eid, p_vuelta) ON CONFLICT DO NOTHING;
+    SELECT tamano, frontera, firma INTO v_tamano, v_frontera, v_firma
+    FROM recibos_log WHERE election_id = p_eid AND vuelta = p_vuelta FOR UPDATE;
+    IF v_firma IS NOT NULL THEN
+        RAISE EXCEPTION 'El registro de recibos de la elección % vuelta % ya está cerrado', p_eid, p_vuelta;
+    END IF;
+
+    v_hash := sha256('\x00'::bytea || decode(p_codigo, 'hex'));
+    INSERT INTO recibos_nodos VALUES (p_eid, p_vuelta, 0, v_tamano, v_hash);
+    -- Suma binaria: cada bit encendido del tamaño es un subárbol que se fusiona con el nuevo
+    WHILE (v_tamano >> v_nivel) & 1 = 1 LOOP
+        v_hash := sha256('\x01'::bytea || v_frontera[v_nivel + 1] || v_hash);
+        v_frontera[v_nivel + 1] := NULL;
+        v_nivel := v_nivel + 1;
+        INSERT INTO recibos_nodos VALUES (p_eid, p_vuelta, v_nivel, v_tamano >> v_nivel, v_hash);
+    END LOOP;
+    v_frontera[v_nivel + 1] := v_hash;
+
+    UPDATE recibos_log SET tamano = v_tamano + 1, frontera = v_frontera
+    WHERE election_id = p_eid AND vuelta = p_vuelta;
+    RETURN v_tamano;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN SELECT id, election_id, vuelta, codigo FROM certificados WHERE hoja IS NULL ORDER BY id LOOP
+        UPDATE certificados SET hoja = recibos_agregar(r.election_id, r.vuelta, r.codigo) WHERE id = r.id;
+    END LOOP;
+END;
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_certificados_hoja ON certificados(election_id, vuelta, hoja);
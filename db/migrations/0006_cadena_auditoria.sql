@@ -0,0 +1,27 @@
+-- Cadena de hashes sobre `auditoria` (ver app/cadena_auditoria.py).
+-- Los eventos existentes quedan sin sellar; el primer sellado los encadena en orden de id.
+-- Funciona igual con `auditoria` particionada (0004).
+
+ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS cadena_pos BIGINT;
+ALTER TABLE auditoria ADD COLUMN IF NOT EXISTS hash BYTEA;
+
+CREATE TABLE IF NOT EXISTS auditoria_cadena (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    posicion BIGINT NOT NULL,
+    hash BYTEA NOT NULL,
+    sellada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    verificada_hasta BIGINT,
+    verificada_en TIMESTAMP,
+    falla TEXT
+);
+
+CREATE TABLE IF NOT EXISTS auditoria_checkpoints (
+    posicion BIGINT PRIMARY KEY,
+    hash BYTEA NOT NULL,
+    firma TEXT NOT NULL,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    verificado_en TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_auditoria_cadena ON auditoria(cadena_pos);
+CREATE INDEX IF NOT EXISTS idx_auditoria_sin_sellar ON auditoria(id) WHERE hash IS NULL;
@@ -0,0 +1,20 @@
+-- Actas de resultados firmadas por elección y vuelta (ver app/actas.py).
+-- Las elecciones ya cerradas no tienen acta: `flask generar-actas --eleccion N` las genera.
+
+CREATE TABLE IF NOT EXISTS actas (
+    election_id INT REFERENCES elecciones(id) ON DELETE CASCADE,
+    vuelta INT NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'PENDIENTE',
+    progreso INT NOT NULL DEFAULT 0,
+    total INT NOT NULL DEFAULT 0,
+    contenido TEXT,
+    hash VARCHAR(64),
+    firma TEXT,
+    error TEXT,
+    solicitada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    actualizada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    generada_en TIMESTAMP,
+    PRIMARY KEY (election_id, vuelta)
+);
+
+CREATE INDEX IF NOT EXISTS idx_actas_pendientes ON actas(solicitada_en) WHERE estado <> 'LISTA';
@@ -1,4 +1,14 @@
 -- Eliminar tablas si existen (orden inverso a dependencias)
+DROP TABLE IF EXISTS schema_migraciones;
+DROP TABLE IF EXISTS actas;
+DROP TABLE IF EXISTS auditoria_checkpoints;
+DROP TABLE IF EXISTS auditoria_cadena;
+DROP TABLE IF EXISTS recibos_nodos;
+DROP TABLE IF EXISTS recibos_log;
+DROP FUNCTION IF EXISTS recibos_agregar(INT, INT, TEXT);
+DROP TABLE IF EXISTS boletas;
+DROP TABLE IF EXISTS conteos;
+DROP TABLE IF EXISTS estadisticas;
 DROP TABLE IF EXISTS auditoria;
 DROP TABLE IF EXISTS certificados;
 DROP TABLE IF EXISTS votos;
@@ -35,7 +45,8 @@ CREATE TABLE elecciones (
     cerrada BOOLEAN DEFAULT FALSE,
     vuelta_actual INT DEFAULT 1,
     tiene_segunda_vuelta BOOLEAN DEFAULT FALSE,
-    todos_habilitados BOOLEAN DEFAULT TRUE
+    todos_habilitados BOOLEAN DEFAULT TRUE,
+    boleta_version INT NOT NULL DEFAULT 0 -- Cambia cada vez que se publica o invalida la boleta
 );
 
 -- 3. Tabla de Cargos (Globales, pero se asocian a elecciones)
@@ -102,7 +113,8 @@ CREATE TABLE certificados (
     votante_id INT REFERENCES usuarios(id),
     vuelta INT NOT NULL,
     fecha_emision TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    contenido_hash TEXT
+    contenido_hash TEXT,
+    hoja BIGINT  -- Posición en el registro de recibos de (election_id, vuelta)
 );
 
 -- 10. Auditoría
@@ -112,10 +124,152 @@ CREATE TABLE auditoria (
     detalle TEXT,
     usuario_id INT REFERENCES usuarios(id) ON DELETE SET NULL,
     ip_origen VARCHAR(45),
-    fecha_evento TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    fecha_evento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    cadena_pos BIGINT,  -- Posición y hash en la cadena de auditoría (NULL hasta que se sella)
+    hash BYTEA
+);
+
+-- 11. Boletas precompiladas (inmutables mientras la elección está activa)
+CREATE TABLE boletas (
+    election_id INT REFERENCES elecciones(id) ON DELETE CASCADE,
+    vuelta INT NOT NULL,
+    version INT NOT NULL,
+    contenido JSONB NOT NULL,
+    generada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (election_id, vuelta)
+);
+
+-- 12. Conteos incrementales (se actualizan en la misma transacción que el voto)
+CREATE TABLE conteos (
+    election_id INT REFERENCES elecciones(id) ON DELETE CASCADE,
+    vuelta INT NOT NULL,
+    cargo_id INT REFERENCES cargos(id) ON DELETE CASCADE,
+    candidato_id INT REFERENCES candidatos(id) ON DELETE CASCADE,
+    votos INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (election_id, vuelta, cargo_id, candidato_id)
+);
+
+-- 13. Estadísticas precalculadas del dashboard (una fila por clave, compartida por los workers)
+CREATE TABLE estadisticas (
+    clave VARCHAR(50) PRIMARY KEY,
+    contenido JSONB NOT NULL,
+    calculada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 14. Migraciones aplicadas (ver db/migrations y `flask migrate-db`)
+CREATE TABLE schema_migraciones (
+    version INT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 15. Registro de recibos: árbol de Merkle append-only por (elección, vuelta) (ver app/recibos.py)
+CREATE TABLE recibos_log (
+    election_id INT REFERENCES elecciones(id),
+    vuelta INT NOT NULL,
+    tamano BIGINT NOT NULL DEFAULT 0,
+    frontera BYTEA[] NOT NULL DEFAULT '{}',  -- frontera[nivel + 1]: subárbol perfecto pendiente de ese nivel
+    raiz BYTEA,                             -- raíz firmada al cerrar la vuelta; desde entonces no crece
+    firma TEXT,
+    firmada_en TIMESTAMP,
+    PRIMARY KEY (election_id, vuelta)
+);
+
+CREATE TABLE recibos_nodos (
+    election_id INT,
+    vuelta INT,
+    nivel SMALLINT NOT NULL,  -- 0 = hoja; el nodo (nivel, indice) cubre las hojas [indice * 2^nivel, (indice + 1) * 2^nivel)
+    indice BIGINT NOT NULL,
+    hash BYTEA NOT NULL,
+    PRIMARY KEY (election_id, vuelta, nivel, indice),
+    FOREIGN KEY (election_id, vuelta) REFERENCES recibos_log(election_id, vuelta)
+);
+
+-- Agrega el código de un certificado como hoja y devuelve su posición. Guarda la hoja y cada
+-- subárbol perfecto que se completa (O(log n) filas) y actualiza la frontera. El FOR UPDATE
+-- ordena las hojas de una misma vuelta; una vuelta con raíz firmada ya no acepta hojas.
+CREATE FUNCTION recibos_agregar(p_eid INT, p_vuelta INT, p_codigo TEXT) RETURNS BIGINT AS $$
+DECLARE
+    v_tamano BIGINT;
+    v_frontera BYTEA[];
+    v_firma TEXT;
+    v_hash BYTEA;
+    v_nivel INT := 0;
+BEGIN
+    INSERT INTO recibos_log (election_id, vuelta) VALUES (p_eid, p_vuelta) ON CONFLICT DO NOTHING;
+    SELECT tamano, frontera, firma INTO v_tamano, v_frontera, v_firma
+    FROM recibos_log WHERE election_id = p_eid AND vuelta = p_vuelta FOR UPDATE;
+    IF v_firma IS NOT NULL THEN
+        RAISE EXCEPTION 'El registro de recibos de la elección % vuelta % ya está cerrado', p_eid, p_vuelta;
+    END IF;
+
+    v_hash := sha256('\x00'::bytea || decode(p_codigo, 'hex'));
+    INSERT INTO recibos_nodos VALUES (p_eid, p_vuelta, 0, v_tamano, v_hash);
+    -- Suma binaria: cada bit encendido del tamaño es un subárbol que se fusiona con el nuevo
+    WHILE (v_tamano >> v_nivel) & 1 = 1 LOOP
+        v_hash := sha256('\x01'::bytea || v_frontera[v_nivel + 1] || v_hash);
+        v_frontera[v_nivel + 1] := NULL;
+        v_nivel := v_nivel + 1;
+        INSERT INTO recibos_nodos VALUES (p_eid, p_vuelta, v_nivel, v_tamano >> v_nivel, v_hash);
+    END LOOP;
+    v_frontera[v_nivel + 1] := v_hash;
+
+    UPDATE recibos_log SET tamano = v_tamano + 1, frontera = v_frontera
+    WHERE election_id = p_eid AND vuelta = p_vuelta;
+    RETURN v_tamano;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 16. Cadena de hashes de la auditoría (ver app/cadena_auditoria.py)
+CREATE TABLE auditoria_cadena (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- Una sola fila: la cabeza de la cadena
+    posicion BIGINT NOT NULL,
+    hash BYTEA NOT NULL,
+    sellada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    verificada_hasta BIGINT,
+    verificada_en TIMESTAMP,
+    falla TEXT
+);
+
+CREATE TABLE auditoria_checkpoints (
+    posicion BIGINT PRIMARY KEY,
+    hash BYTEA NOT NULL,
+    firma TEXT NOT NULL,
+    creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    verificado_en TIMESTAMP
+);
+
+-- 17. Actas de resultados firmadas por elección y vuelta (ver app/actas.py)
+CREATE TABLE actas (
+    election_id INT REFERENCES elecciones(id) ON DELETE CASCADE,
+    vuelta INT NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'PENDIENTE',  -- PENDIENTE, GENERANDO, LISTA, ERROR
+    progreso INT NOT NULL DEFAULT 0,                   -- Cargos procesados de `total`
+    total INT NOT NULL DEFAULT 0,
+    contenido TEXT,                                    -- JSON canónico: exactamente lo que se firma
+    hash VARCHAR(64),
+    firma TEXT,
+    error TEXT,
+    solicitada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    actualizada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    generada_en TIMESTAMP,
+    PRIMARY KEY (election_id, vuelta)
 );
 
 -- Indices
 CREATE INDEX idx_votos_candidato ON votos(election_id, cargo_id, vuelta, candidato_id);
 CREATE INDEX idx_usuarios_cedula ON usuarios(cedula);
-CREATE INDEX idx_eleccion_votantes ON eleccion_votantes(election_id, votante_id);
+-- Búsqueda y paginación keyset de votantes (admin.usuarios / admin.api_votantes)
+CREATE INDEX idx_usuarios_orden ON usuarios(apellidos, nombres, id);
+CREATE INDEX idx_usuarios_cedula_prefijo ON usuarios(cedula varchar_pattern_ops);
+CREATE INDEX idx_usuarios_apellidos_prefijo ON usuarios(lower(apellidos) text_pattern_ops);
+-- Participación por vuelta y anti-join de pendientes (app/participacion.py)
+CREATE INDEX idx_certificados_votante ON certificados(election_id, vuelta, votante_id);
+CREATE INDEX idx_candidatos_cargo_estado ON candidatos(election_id, cargo_id, estado);
+CREATE INDEX idx_auditoria_fecha ON auditoria(fecha_evento);
+CREATE UNIQUE INDEX idx_certificados_hoja ON certificados(election_id, vuelta, hoja);
+-- Recorrido de la cadena y eventos pendientes de sellar
+CREATE INDEX idx_auditoria_cadena ON auditoria(cadena_pos);
+CREATE INDEX idx_auditoria_sin_sellar ON auditoria(id) WHERE hash IS NULL;
+-- Actas que el generador en segundo plano todavía tiene que tomar
+CREATE INDEX idx_actas_pendientes ON actas(solicitada_en) WHERE estado <> 'LISTA';
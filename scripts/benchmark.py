@@ -0,0 +1,247 @@
+"""Benchmark de carga del flujo de votación.
+
+Siembra la base configurada en .env con N votantes y M elecciones activas (usando
+init_db/seed_users) y recorre la app Flask real con C votantes concurrentes:
+
+    /auth/login -> /votar/ -> /votar/<id> -> /votar/confirmar   (por cada elección)
+    /admin/resultados/<id>                                      (un admin refrescando)
+
+Reporta p50/p95/p99, throughput y consultas por request de cada endpoint y guarda el
+resultado en JSON para comparar corridas:
+
+    python scripts/benchmark.py --votantes 2000 --elecciones 3 --concurrencia 50 \\
+        --salida bench.json --comparar bench_anterior.json --confirmar
+
+ATENCIÓN: init_db borra y recrea todas las tablas de la base configurada.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import subprocess
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import bcrypt
+import psycopg2.extras
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark de carga del flujo de votación")
+    p.add_argument('--votantes', type=int, default=500)
+    p.add_argument('--elecciones', type=int, default=2)
+    p.add_argument('--candidatos', type=int, default=3, help='Candidatos por cargo')
+    p.add_argument('--concurrencia', type=int, default=20)
+    p.add_argument('--refrescos-admin', type=int, default=50, help='GETs a resultados por elección')
+    p.add_argument('--salida', default='bench_output.json')
+    p.add_argument('--comparar', default=None, help='JSON de una corrida anterior')
+    p.add_argument('--confirmar', action='store_true', help='Confirma que se puede borrar la base')
+    return p.parse_args()
+
+
+def sembrar(app, n_votantes, n_elecciones, n_candidatos):
+    """Recrea la base y siembra votantes, elecciones, cargos y candidatos. Devuelve los ids."""
+    from app.db import init_db, seed_users, get_db, query_db
+    from app.boletas import publicar_boleta
+
+    with app.app_context():
+        init_db()
+        seed_users()
+        db = get_db()
+        cur = db.cursor()
+
+        clave = bcrypt.hashpw(b'bench1234', bcrypt.gensalt()).decode('utf-8')
+        filas = [(f"9{i:09d}", f"Votante {i}", "Bench", '2000-01-01', clave) for i in range(n_votantes)]
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO usuarios (cedula, nombres, apellidos, fecha_nacimiento, clave, rol, habilitado)
+            VALUES %s ON CONFLICT (cedula) DO NOTHING
+        """, filas, template="(%s, %s, %s, %s, %s, 'VOTANTE', TRUE)")
+
+        cargos = [r['id'] for r in query_db("SELECT id FROM cargos ORDER BY id")]
+        elecciones = []
+        for e in range(n_elecciones):
+            cur.execute("""
+                INSERT INTO elecciones (titulo, fecha_inicio, fecha_fin)
+                VALUES (%s, NOW(), NOW() + INTERVAL '1 day') RETURNING id
+            """, (f"Benchmark {e + 1}",))
+            eid = cur.fetchone()[0]
+            for cid in cargos:
+                cur.execute("INSERT INTO eleccion_cargos (election_id, cargo_id) VALUES (%s, %s)", (eid, cid))
+                for k in range(n_candidatos):
+                    cur.execute("""
+                        INSERT INTO candidatos (election_id, cargo_id, nombres, partido, genero)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, (eid, cid, f"Candidato {k + 1}", f"Lista {k + 1}", 'MF'[k % 2]))
+            cur.execute("UPDATE elecciones SET activa = TRUE WHERE id = %s", (eid,))
+            elecciones.append(eid)
+        db.commit()
+        cur.close()
+
+        for eid in elecciones:
+            publicar_boleta(eid, 1)
+        boletas = {eid: query_db("""
+            SELECT cargo_id, MIN(id) AS candidato_id FROM candidatos WHERE election_id = %s GROUP BY cargo_id
+        """, (eid,)) for eid in elecciones}
+    return [f[0] for f in filas], boletas
+
+
+class Registro:
+    """Latencias y consultas por endpoint, thread-safe."""
+
+    def __init__(self):
+        self.datos = {}
+        self.lock = threading.Lock()
+
+    def medir(self, endpoint, fn, ok=None):
+        """Mide `fn`; cuenta error si responde >= 400 o si `ok(resp)` dice que no tuvo efecto."""
+        t0 = time.perf_counter()
+        resp = fn()
+        ms = (time.perf_counter() - t0) * 1000
+        consultas = int(resp.headers.get('X-DB-Queries', 0))
+        with self.lock:
+            d = self.datos.setdefault(endpoint, {'ms': [], 'consultas': [], 'errores': 0})
+            d['ms'].append(ms)
+            d['consultas'].append(consultas)
+            if resp.status_code >= 400 or (ok is not None and not ok(resp)):
+                d['errores'] += 1
+        return resp
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    orden = sorted(valores)
+    k = (len(orden) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(orden) - 1)
+    return orden[f] + (orden[c] - orden[f]) * (k - f)
+
+
+def redirige_a(ruta, prefijo=False):
+    """Éxito = redirección a `ruta`: un login fallido responde 200 y un voto rechazado vuelve a /votar/."""
+    def ok(resp):
+        destino = urlparse(resp.headers.get('Location', '')).path
+        return resp.status_code in (301, 302, 303) and (destino.startswith(ruta) if prefijo else destino == ruta)
+    return ok
+
+
+def flujo_votante(app, registro, cedula, boletas):
+    client = app.test_client()
+    registro.medir('/auth/login', lambda: client.post('/auth/login', data={'cedula': cedula, 'password': 'bench1234'}),
+                   ok=redirige_a('/votar/'))
+    registro.medir('/votar/', lambda: client.get('/votar/'))
+    for eid, seleccion in boletas.items():
+        registro.medir('/votar/<id>', lambda: client.get(f'/votar/{eid}'))
+        form = {'election_id': eid, 'vuelta': 1, 'cargo_ids': [s['cargo_id'] for s in seleccion]}
+        for s in seleccion:
+            form[f"candidato_{s['cargo_id']}"] = s['candidato_id']
+        registro.medir('/votar/confirmar', lambda: client.post('/votar/confirmar', data=form),
+                       ok=redirige_a('/votar/certificado/', prefijo=True))
+
+
+def flujo_admin(app, registro, elecciones, refrescos):
+    client = app.test_client()
+    client.post('/auth/login', data={'cedula': '0000000001', 'password': 'admin123'})
+    for _ in range(refrescos):
+        for eid in elecciones:
+            registro.medir('/admin/resultados/<id>', lambda: client.get(f'/admin/resultados/{eid}'),
+                           ok=lambda resp: resp.status_code == 200)
+
+
+def resumir(registro, duracion):
+    resumen = {}
+    for endpoint, d in sorted(registro.datos.items()):
+        resumen[endpoint] = {
+            'requests': len(d['ms']),
+            'errores': d['errores'],
+            'p50_ms': round(percentil(d['ms'], 50), 2),
+            'p95_ms': round(percentil(d['ms'], 95), 2),
+            'p99_ms': round(percentil(d['ms'], 99), 2),
+            'throughput_rps': round(len(d['ms']) / duracion, 2) if duracion else 0.0,
+            'consultas_por_request': round(sum(d['consultas']) / len(d['consultas']), 2) if d['consultas'] else 0.0,
+        }
+    return resumen
+
+
+def comparar(actual, anterior):
+    print(f"\nComparación con corrida anterior ({anterior['meta']['fecha']}):")
+    for endpoint, r in actual['endpoints'].items():
+        base = anterior['endpoints'].get(endpoint)
+        if not base:
+            continue
+        for clave in ('p95_ms', 'throughput_rps', 'consultas_por_request'):
+            if base[clave]:
+                delta = (r[clave] - base[clave]) / base[clave] * 100
+                print(f"  {endpoint:26} {clave:22} {base[clave]:>9} -> {r[clave]:>9} ({delta:+.1f}%)")
+
+
+def main():
+    args = parse_args()
+    if not args.confirmar:
+        sys.exit("El benchmark BORRA la base configurada en .env. Ejecuta con --confirmar.")
+
+    os.environ.setdefault('DB_POOL_MAX', str(args.concurrencia + 5))
+    from app import create_app
+    app = create_app()
+
+    @app.after_request
+    def exponer_consultas(resp):
+        from flask import g
+        resp.headers['X-DB-Queries'] = str(g.get('db_queries', 0))
+        return resp
+
+    print(f"Sembrando {args.votantes} votantes y {args.elecciones} elecciones...")
+    cedulas, boletas = sembrar(app, args.votantes, args.elecciones, args.candidatos)
+
+    registro = Registro()
+    print(f"Ejecutando con concurrencia {args.concurrencia}...")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrencia + 1) as pool:
+        admin = pool.submit(flujo_admin, app, registro, list(boletas), args.refrescos_admin)
+        futuros = [pool.submit(flujo_votante, app, registro, c, boletas) for c in cedulas]
+        for f in futuros + [admin]:
+            f.result()
+    duracion = time.perf_counter() - t0
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    resultado = {
+        'meta': {'fecha': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+                 'votantes': args.votantes, 'elecciones': args.elecciones, 'candidatos': args.candidatos,
+                 'concurrencia': args.concurrencia, 'duracion_s': round(duracion, 2),
+                 'votantes_por_s': round(args.votantes / duracion, 2) if duracion else 0.0},
+        'endpoints': resumir(registro, duracion),
+    }
+
+    print(f"\n{'Endpoint':26} {'req':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'q/req':>6}")
+    for endpoint, r in resultado['endpoints'].items():
+        print(f"{endpoint:26} {r['requests']:>6} {r['errores']:>4} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+              f"{r['p99_ms']:>8} {r['throughput_rps']:>8} {r['consultas_por_request']:>6}")
+    print(f"\nVotantes por segundo: {resultado['meta']['votantes_por_s']}")
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            comparar(resultado, json.load(f))
+
+    errores = sum(r['errores'] for r in resultado['endpoints'].values())
+    if errores:
+        sys.exit(f"\n{errores} requests fallaron (login rechazado, voto no registrado o error HTTP): "
+                 f"la corrida no es válida.")
+
+
+if __name__ == '__main__':
+    main()
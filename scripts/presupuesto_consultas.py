@@ -0,0 +1,348 @@
+"""Presupuesto de consultas por ruta (detecta patrones N+1).
+
+Siembra la base configurada en .env en varios tamaños (cada tamaño multiplica elecciones,
+cargos, candidatos y votantes) y recorre las rutas principales con el cliente de pruebas de
+Flask, contando las sentencias SQL de cada request (g.db_queries, ver app/db.py). Falla con
+código de salida 1 si alguna ruta:
+
+  - supera el presupuesto declarado en PRESUPUESTOS, o
+  - hace más consultas en un tamaño mayor que en el menor (la cantidad crece con los datos).
+
+Con --explain pide el EXPLAIN de cada sentencia y avisa las que hacen Seq Scan sobre tablas
+con más de --umbral-filas filas, marcando las que en el tamaño menor usaban índices:
+
+    python scripts/presupuesto_consultas.py --confirmar
+    python scripts/presupuesto_consultas.py --tamanos 1 4 16 --explain --salida consultas.json --confirmar
+
+ATENCIÓN: init_db borra y recrea todas las tablas de la base configurada.
+"""
+import os
+import sys
+import json
+import argparse
+import datetime
+import subprocess
+
+sys.path.append(os.getcwd())
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import bcrypt
+import psycopg2
+import psycopg2.extras
+
+# Consultas máximas por request (con las caches del worker ya cargadas). Si una ruta necesita
+# más, subir el número aquí en el mismo cambio que la justifica.
+PRESUPUESTOS = {
+    'index': 2,
+    'admin.dashboard': 4,
+    'admin.elecciones': 3,
+    'admin.eleccion_detalle': 8,
+    'admin.eleccion_detalle [save_votantes]': 5,
+    'admin.usuarios': 4,
+    'admin.api_votantes': 3,
+    'admin.resultados': 6,
+    'admin.resultados_votantes': 4,
+    'voter.votar': 3,
+    'voter.votar_eleccion': 5,
+    'voter.confirmar_voto': 4,
+    'voter.certificado': 4,
+    'verificacion.api': 4,
+    'verificacion.recibo': 5,
+}
+
+VOTANTES_POR_TAMANO = 150
+CODIGOS_VERIFICACION = 50
+SENTENCIAS_EXPLICABLES = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Presupuesto de consultas por ruta")
+    p.add_argument('--tamanos', type=int, nargs='+', default=[1, 3, 9],
+                   help='Multiplicadores de datos a sembrar (de menor a mayor)')
+    p.add_argument('--explain', action='store_true', help='Captura los planes y avisa los Seq Scan')
+    p.add_argument('--umbral-filas', type=int, default=1000,
+                   help='Filas a partir de las que un Seq Scan se reporta')
+    p.add_argument('--salida', default=None, help='JSON con conteos (y planes con --explain)')
+    p.add_argument('--confirmar', action='store_true', help='Confirma que se puede borrar la base')
+    return p.parse_args()
+
+
+def sembrar(app, k):
+    """Recrea la base con 1+k elecciones activas de 2k cargos y 2+k candidatos por cargo,
+    150k votantes (la mitad ya votó en la primera) y una elección en edición con lista de
+    votantes habilitados. Devuelve los datos que usan los recorridos."""
+    from app.db import init_db, seed_users, get_db, query_db
+    from app.boletas import publicar_boleta
+    from app.conteos import reconciliar
+
+    n_votantes = VOTANTES_POR_TAMANO * k
+    with app.app_context():
+        init_db()
+        seed_users()
+        db = get_db()
+        cur = db.cursor()
+
+        clave = bcrypt.hashpw(b'bench1234', bcrypt.gensalt()).decode('utf-8')
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO usuarios (cedula, nombres, apellidos, fecha_nacimiento, clave, rol, habilitado)
+            VALUES %s ON CONFLICT (cedula) DO NOTHING
+        """, [(f"9{i:09d}", f"Votante {i}", "Presupuesto", '2000-01-01', clave) for i in range(n_votantes)],
+            template="(%s, %s, %s, %s, %s, 'VOTANTE', TRUE)")
+        cargos = [r[0] for r in psycopg2.extras.execute_values(
+            cur, "INSERT INTO cargos (nombre) VALUES %s RETURNING id",
+            [(f"Cargo {c + 1}",) for c in range(2 * k)], fetch=True)]
+
+        elecciones = []
+        for e in range(k + 2):
+            cur.execute("""
+                INSERT INTO elecciones (titulo, fecha_inicio, fecha_fin)
+                VALUES (%s, NOW(), NOW() + INTERVAL '1 day') RETURNING id
+            """, (f"Presupuesto {e + 1}",))
+            eid = cur.fetchone()[0]
+            psycopg2.extras.execute_values(cur, "INSERT INTO eleccion_cargos (election_id, cargo_id) VALUES %s",
+                                           [(eid, cid) for cid in cargos])
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO candidatos (election_id, cargo_id, nombres, partido, genero) VALUES %s
+            """, [(eid, cid, f"Candidato {n + 1}", f"Lista {n + 1}", 'MF'[n % 2])
+                  for cid in cargos for n in range(k + 2)])
+            elecciones.append(eid)
+        activas, en_edicion = elecciones[:-1], elecciones[-1]
+        cur.execute("UPDATE elecciones SET activa = TRUE WHERE id = ANY(%s)", (activas,))
+
+        # Elección en edición con la mitad de los votantes habilitados por lista
+        cur.execute("UPDATE elecciones SET todos_habilitados = FALSE WHERE id = %s", (en_edicion,))
+        cur.execute("""
+            INSERT INTO eleccion_votantes (election_id, votante_id)
+            SELECT %s, id FROM usuarios WHERE rol = 'VOTANTE' AND id %% 2 = 0
+        """, (en_edicion,))
+        db.commit()
+        for eid in activas:
+            publicar_boleta(eid, 1)
+
+        # La mitad de los votantes ya votó en la primera elección (votos, certificados y recibos)
+        eid = activas[0]
+        cur.execute("""
+            WITH votantes AS (
+                SELECT id FROM usuarios WHERE rol = 'VOTANTE' AND cedula LIKE '9%%' AND id %% 2 = 1
+            ), elegidos AS (
+                SELECT cargo_id, MIN(id) AS candidato_id FROM candidatos WHERE election_id = %(eid)s GROUP BY cargo_id
+            )
+            INSERT INTO votos (election_id, cargo_id, candidato_id, votante_id, vuelta)
+            SELECT %(eid)s, e.cargo_id, e.candidato_id, v.id, 1 FROM votantes v CROSS JOIN elegidos e
+        """, {'eid': eid})
+        cur.execute("""
+            INSERT INTO certificados (codigo, election_id, votante_id, vuelta, hoja)
+            SELECT codigo, %(eid)s, id, 1, recibos_agregar(%(eid)s, 1, codigo)
+            FROM (SELECT id, encode(sha256(('presupuesto-' || id)::bytea), 'hex') AS codigo
+                  FROM usuarios WHERE rol = 'VOTANTE' AND cedula LIKE '9%%' AND id %% 2 = 1
+                  ORDER BY id) s
+        """, {'eid': eid})
+        db.commit()
+        reconciliar(eid, corregir=True)
+
+        cur.execute("ANALYZE")
+        db.commit()
+        cur.close()
+
+        votante = query_db("""
+            SELECT cedula FROM usuarios WHERE rol = 'VOTANTE' AND cedula LIKE '9%%' AND id %% 2 = 0
+            ORDER BY id LIMIT 1
+        """, one=True)['cedula']
+        boleta = query_db("""
+            SELECT cargo_id, MIN(id) AS candidato_id FROM candidatos WHERE election_id = %s GROUP BY cargo_id
+        """, (eid,))
+        codigos = [r['codigo'] for r in query_db(
+            "SELECT codigo FROM certificados WHERE election_id = %s ORDER BY id LIMIT %s",
+            (eid, CODIGOS_VERIFICACION))]
+        votantes_ids = [r['id'] for r in query_db(
+            "SELECT id FROM usuarios WHERE rol = 'VOTANTE' ORDER BY id")]
+    return {'eleccion': eid, 'en_edicion': en_edicion, 'votante': votante, 'boleta': boleta,
+            'codigos': codigos, 'votantes_ids': votantes_ids}
+
+
+class Medidor:
+    """Consultas (y sentencias, con --explain) de cada request medido."""
+
+    def __init__(self, app, capturar):
+        self.capturar = capturar
+        self.ultimo = None
+        self.rutas = {}  # ruta -> {'consultas', 'status', 'sentencias'}
+
+        @app.before_request
+        def iniciar_captura():
+            from flask import g
+            if self.capturar:
+                g.db_sentencias = []
+
+        @app.after_request
+        def guardar_conteo(resp):
+            from flask import g
+            self.ultimo = (g.get('db_queries', 0), list(g.get('db_sentencias') or []))
+            return resp
+
+    def medir(self, ruta, fn, repetir=True):
+        """Mide `fn`; con `repetir` la llama dos veces y se queda con la segunda (caches cargadas)."""
+        resp = fn()
+        if repetir:
+            resp = fn()
+        consultas, sentencias = self.ultimo
+        self.rutas[ruta] = {'consultas': consultas, 'status': resp.status_code, 'sentencias': sentencias}
+        return resp
+
+
+def recorrer(app, medidor, datos):
+    publico = app.test_client()
+    medidor.medir('index', lambda: publico.get('/'))
+
+    admin = app.test_client()
+    admin.post('/auth/login', data={'cedula': '0000000001', 'password': 'admin123'})
+    eid, en_edicion = datos['eleccion'], datos['en_edicion']
+    medidor.medir('admin.dashboard', lambda: admin.get('/admin/'))
+    medidor.medir('admin.elecciones', lambda: admin.get('/admin/elecciones'))
+    medidor.medir('admin.eleccion_detalle', lambda: admin.get(f'/admin/elecciones/{en_edicion}'))
+    medidor.medir('admin.eleccion_detalle [save_votantes]',
+                  lambda: admin.post(f'/admin/elecciones/{en_edicion}',
+                                     data={'action': 'save_votantes', 'agregar_ids': datos['votantes_ids']}))
+    medidor.medir('admin.usuarios', lambda: admin.get('/admin/usuarios'))
+    medidor.medir('admin.api_votantes', lambda: admin.get(f'/admin/api/votantes?election_id={en_edicion}'))
+    medidor.medir('admin.resultados', lambda: admin.get(f'/admin/resultados/{eid}'))
+    medidor.medir('admin.resultados_votantes', lambda: admin.get(f'/admin/resultados/{eid}/votantes'))
+
+    votante = app.test_client()
+    votante.post('/auth/login', data={'cedula': datos['votante'], 'password': 'bench1234'})
+    medidor.medir('voter.votar', lambda: votante.get('/votar/'))
+    medidor.medir('voter.votar_eleccion', lambda: votante.get(f'/votar/{eid}'))
+    form = {'election_id': eid, 'vuelta': 1, 'cargo_ids': [s['cargo_id'] for s in datos['boleta']]}
+    for s in datos['boleta']:
+        form[f"candidato_{s['cargo_id']}"] = s['candidato_id']
+    resp = medidor.medir('voter.confirmar_voto', lambda: votante.post('/votar/confirmar', data=form), repetir=False)
+    codigo = resp.headers.get('Location', '').rstrip('/').rsplit('/', 1)[-1]
+    medidor.medir('voter.certificado', lambda: votante.get(f'/votar/certificado/{codigo}'))
+
+    medidor.medir('verificacion.api', lambda: publico.post('/verificar/api', json={'codigos': datos['codigos']}))
+    medidor.medir('verificacion.recibo', lambda: publico.get(f'/verificar/recibo/{codigo}'))
+
+
+def seq_scans(plan):
+    """Tablas recorridas con Seq Scan en un plan JSON de EXPLAIN."""
+    tablas = set()
+    pendientes = [plan]
+    while pendientes:
+        nodo = pendientes.pop()
+        if nodo.get('Node Type') == 'Seq Scan':
+            tablas.add(nodo.get('Relation Name'))
+        pendientes.extend(nodo.get('Plans', []))
+    return tablas
+
+
+def explicar(app, rutas, umbral):
+    """EXPLAIN de las sentencias de cada ruta: {ruta: [{'sql', 'seq_scan': [tablas grandes]}]}."""
+    from app.db import get_db
+    planes = {}
+    with app.app_context():
+        db = get_db()
+        cur = db.cursor()
+        cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p')")
+        filas = {nombre: n for nombre, n in cur.fetchall()}
+        for ruta, r in rutas.items():
+            for sql in r['sentencias']:
+                if not sql.lstrip().upper().startswith(SENTENCIAS_EXPLICABLES):
+                    continue
+                try:
+                    cur.execute("EXPLAIN (FORMAT JSON) " + sql)
+                    plan = cur.fetchone()[0][0]['Plan']
+                except psycopg2.Error:
+                    db.rollback()
+                    continue
+                db.rollback()
+                grandes = sorted(t for t in seq_scans(plan) if filas.get(t, 0) >= umbral)
+                planes.setdefault(ruta, []).append({'sql': ' '.join(sql.split()), 'seq_scan': grandes,
+                                                    'plan': plan})
+        cur.close()
+    return planes
+
+
+def main():
+    args = parse_args()
+    if not args.confirmar:
+        sys.exit("El script BORRA la base configurada en .env. Ejecuta con --confirmar.")
+    tamanos = sorted(set(args.tamanos))
+
+    from app import create_app
+    app = create_app()
+
+    medidor = Medidor(app, args.explain)
+    por_tamano = {}
+    planes = {}
+    for k in tamanos:
+        print(f"Tamaño x{k}: sembrando {VOTANTES_POR_TAMANO * k} votantes, {k + 1} elecciones activas, "
+              f"{2 * k} cargos...")
+        datos = sembrar(app, k)
+        medidor.rutas = {}
+        recorrer(app, medidor, datos)
+        por_tamano[k] = medidor.rutas
+        if args.explain:
+            planes[k] = explicar(app, medidor.rutas, args.umbral_filas)
+
+    fallas = []
+    menor, mayor = tamanos[0], tamanos[-1]
+    print(f"\n{'Ruta':40} " + ' '.join(f"{'x' + str(k):>6}" for k in tamanos) + f" {'máx':>6}")
+    for ruta, presupuesto in PRESUPUESTOS.items():
+        conteos = [por_tamano[k].get(ruta, {}).get('consultas') for k in tamanos]
+        print(f"{ruta:40} " + ' '.join(f"{c if c is not None else '-':>6}" for c in conteos) + f" {presupuesto:>6}")
+        for k in tamanos:
+            r = por_tamano[k].get(ruta)
+            if r is None:
+                fallas.append(f"{ruta}: no se midió en x{k}")
+            elif r['status'] >= 400:
+                fallas.append(f"{ruta}: respondió {r['status']} en x{k}")
+            elif r['consultas'] > presupuesto:
+                fallas.append(f"{ruta}: {r['consultas']} consultas en x{k} (presupuesto {presupuesto})")
+        medidos = [c for c in conteos if c is not None]
+        if len(medidos) == len(tamanos) and max(medidos[1:], default=medidos[0]) > medidos[0]:
+            fallas.append(f"{ruta}: las consultas crecen con los datos ({' -> '.join(map(str, medidos))})")
+
+    if args.explain:
+        print(f"\nSeq Scan sobre tablas de más de {args.umbral_filas} filas (x{mayor}):")
+        antes = {(ruta, p['sql'][:200]) for ruta, ps in planes.get(menor, {}).items()
+                 for p in ps if not p['seq_scan']}
+        avisos = 0
+        for ruta, ps in planes.get(mayor, {}).items():
+            for p in ps:
+                if p['seq_scan']:
+                    avisos += 1
+                    cambio = ' (con índice en x%d)' % menor if (ruta, p['sql'][:200]) in antes else ''
+                    print(f"  {ruta}: {', '.join(p['seq_scan'])}{cambio}\n      {p['sql'][:160]}")
+        if not avisos:
+            print("  ninguno")
+
+    if args.salida:
+        try:
+            commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        resultado = {
+            'meta': {'fecha': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+                     'tamanos': tamanos},
+            'presupuestos': PRESUPUESTOS,
+            'consultas': {str(k): {ruta: r['consultas'] for ruta, r in rutas.items()}
+                          for k, rutas in por_tamano.items()},
+            'planes': {str(k): p for k, p in planes.items()},
+            'fallas': fallas,
+        }
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, default=str)
+        print(f"\nResultados guardados en {args.salida}")
+
+    if fallas:
+        print("\nFALLAS:")
+        for falla in fallas:
+            print(f"  - {falla}")
+        sys.exit(1)
+    print("\nTodas las rutas dentro del presupuesto.")
+
+
+if __name__ == '__main__':
+    main()